@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.aio_latency
+
+Measure event loop latency while reading files with the blocking
+``minipylib.utils`` helpers and with the awaitable ``minipylib.aio``
+helpers (Python 3.7+).
+
+A ticker task sleeps for 1 ms in a loop and records how late it wakes
+up while another task reads a set of files, either blocking, offloaded
+whole (``aio.get_file_contents``) or streamed in chunks
+(``aio.iter_file_contents``).
+
+Blocking reads hold up the ticker for the duration of each read. For
+large files, streamed reads keep the lag close to the tick interval;
+for small files already in the page cache, blocking reads are cheap
+and offloading mostly adds overhead.
+
+Usage::
+
+    $ python examples/benchmarks/aio_latency.py [file count] [file size]
+"""
+
+from __future__ import (absolute_import, unicode_literals, print_function)
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+
+from minipylib import utils, aio
+
+
+TICK = 0.001
+
+
+async def ticker(stop, delays):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        delays.append(time.perf_counter() - start - TICK)
+
+
+async def read_blocking(paths):
+    for path in paths:
+        utils.get_file_contents(path, mode='b')
+        await asyncio.sleep(0)
+
+
+async def read_offloaded(paths):
+    await asyncio.gather(*[aio.get_file_contents(path, mode='b')
+                           for path in paths])
+
+
+async def read_streamed(paths):
+    async def consume(path):
+        async for chunk in aio.iter_file_contents(path, mode='b'):
+            pass
+    await asyncio.gather(*[consume(path) for path in paths])
+
+
+async def measure(reader, paths):
+    stop = asyncio.Event()
+    delays = []
+    tick_task = asyncio.ensure_future(ticker(stop, delays))
+    start = time.perf_counter()
+    await reader(paths)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    delays.sort()
+    return {
+        'elapsed': elapsed,
+        'ticks': len(delays),
+        'p50': delays[len(delays) // 2] if delays else 0.0,
+        'max': delays[-1] if delays else 0.0,
+    }
+
+
+def main(count=200, size=2**20):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        data = os.urandom(size)
+        for n in range(count):
+            path = os.path.join(tmp_dir, 'file%d' % n)
+            utils.write_file(path, data, mode='b')
+            paths.append(path)
+        print('%d files of %d bytes' % (count, size))
+        print('%-10s %10s %8s %12s %12s' % ('mode', 'elapsed', 'ticks',
+                                             'p50 lag ms', 'max lag ms'))
+        for name, reader in (('blocking', read_blocking),
+                             ('offloaded', read_offloaded),
+                             ('streamed', read_streamed)):
+            result = asyncio.run(measure(reader, paths))
+            print('%-10s %9.3fs %8d %12.3f %12.3f' % (
+                name, result['elapsed'], result['ticks'],
+                result['p50'] * 1000, result['max'] * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.records
+
+Compare memory use and attribute access speed of ``DataObject`` and
+record classes created by ``make_record``.
+
+Usage::
+
+    $ python examples/benchmarks/records.py [object count]
+"""
+
+from __future__ import (absolute_import, unicode_literals, print_function)
+
+import sys
+import gc
+import timeit
+
+from minipylib.utils import DataObject, make_record
+
+
+FIELDS = ['name', 'size', 'mtime', 'owner', 'mode']
+Entry = make_record('Entry', FIELDS)
+
+
+def memory_used(factory, count):
+    """Return approximate bytes allocated by ``count`` objects."""
+    try:
+        import tracemalloc
+    except ImportError:
+        obj = factory(0)
+        return count * (sys.getsizeof(obj) +
+                        sys.getsizeof(getattr(obj, '__dict__', {})))
+    gc.collect()
+    tracemalloc.start()
+    objects = [factory(n) for n in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size
+
+
+def main(count=100000):
+    values = lambda n: {'name': 'file%d' % n, 'size': n, 'mtime': 0.0,
+                        'owner': 'nobody', 'mode': 0o644}
+    data_object = lambda n: DataObject(values(n))
+    record = lambda n: Entry(values(n))
+
+    print('%d objects with %d fields' % (count, len(FIELDS)))
+    print('%-12s %12s %14s %14s' % ('type', 'memory MB', 'create us',
+                                    'getattr ns'))
+    for name, factory in (('DataObject', data_object), ('record', record)):
+        memory = memory_used(factory, count) / 2.0**20
+        create = min(timeit.repeat(lambda: factory(1), number=10000,
+                                   repeat=3)) / 10000 * 1e6
+        obj = factory(1)
+        access = min(timeit.repeat(lambda: obj.size, number=1000000,
+                                   repeat=3)) * 1e3
+        print('%-12s %12.1f %14.2f %14.1f' % (name, memory, create, access))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.str_conv
+
+Compare bulk and streaming string/bytes conversion helpers with
+per-item ``s2b``/``b2s`` calls.
+
+Usage::
+
+    $ python examples/benchmarks/str_conv.py [item count]
+"""
+
+from __future__ import (absolute_import, unicode_literals, print_function)
+
+import sys
+import timeit
+
+from minipylib.utils import (s2b, b2s, s2b_list, b2s_list,
+                             iter_encode, iter_decode)
+
+
+def best(func, repeat=5):
+    """Return best time of ``repeat`` runs of ``func``."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(count=100000):
+    text = ['écriture %d 寫作' % n for n in range(count)]
+    data = [s.encode('utf-8') for s in text]
+    stream = b''.join(data)
+    chunks = [stream[n:n+4096] for n in range(0, len(stream), 4096)]
+
+    results = [
+        ('[s2b(s) for s in items]', best(lambda: [s2b(s) for s in text])),
+        ('s2b_list(items)', best(lambda: s2b_list(text))),
+        ('[b2s(b) for b in items]', best(lambda: [b2s(b) for b in data])),
+        ('b2s_list(items)', best(lambda: b2s_list(data))),
+        ('iter_encode(items)', best(lambda: list(iter_encode(text)))),
+        ('iter_decode(4k chunks)', best(lambda: list(iter_decode(chunks)))),
+    ]
+    print('%d items, %d bytes' % (count, len(stream)))
+    for label, seconds in results:
+        print('%-26s %8.2f ms' % (label, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
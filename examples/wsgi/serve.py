@@ -12,6 +12,12 @@ daemon mode).
 
 See doc string for `create_server` for details on parameters.
 
+To profile startup time, set ``MINIPYLIB_PROFILE_STARTUP`` (or the
+``profile_startup`` key in SERVER_CONFIG) to an output path prefix
+(see minipylib.profiler)::
+
+    $ MINIPYLIB_PROFILE_STARTUP=/tmp/startup python serve.py
+
 Servers with built-in adaptors in minipylib.server module:
 
 * wsgiserver: CherryPy wsgiserver (included in minipy)
@@ -30,7 +36,7 @@ Servers with built-in adaptors in minipylib.server module:
 
 from __future__ import (absolute_import, unicode_literals)
 
-from minipylib.server import make_server
+from minipylib import profiler
 
 # load configurations
 try:
@@ -38,6 +44,14 @@ try:
 except ImportError:
     from wsgi.default_config import SERVER_CONFIG
 
+# start profiler before minipylib.server is imported, so the timing
+# tree includes the server and backend imports (make_server stops it)
+_prefix = profiler.get_profile_prefix(SERVER_CONFIG)
+if _prefix:
+    profiler.start_profiler(_prefix)
+
+from minipylib.server import make_server
+
 
 _server = make_server(**SERVER_CONFIG)
 
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.aio
+
+This module contains awaitable counterparts of the file helpers in
+``minipylib.utils`` for asyncio applications (Python 3.7+).
+
+Blocking file system calls are run on a dedicated, bounded thread pool
+so they do not stall the event loop: ::
+
+    from minipylib import aio
+
+    async def handler(path):
+        data = await aio.get_file_contents(path)
+        await aio.write_file(path + '.bak', data, atomic=True)
+
+        async with await aio.open_file(path, mode='rb') as f:
+            async for chunk in f.iter_chunks(2**16):
+                process(chunk)
+
+Awaiting tasks can be cancelled: a call that has not started running
+on the pool is dropped, and streaming reads and writes stop at the
+next chunk.
+
+For gevent and eventlet applications, see ``minipylib.green``.
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from minipylib import utils
+
+
+DEFAULT_AIO_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the shared file I/O thread pool (created on first use)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(DEFAULT_AIO_WORKERS)
+    return _executor
+
+
+def set_executor(executor=None, workers=DEFAULT_AIO_WORKERS):
+    """
+    Replace the shared file I/O thread pool.
+
+    :param executor: ``concurrent.futures.Executor`` (default is a new
+        ``ThreadPoolExecutor`` with ``workers`` threads)
+    :returns: previous executor (or None); the caller should shut it down
+    """
+    global _executor
+    if executor is None:
+        executor = ThreadPoolExecutor(workers)
+    with _executor_lock:
+        previous, _executor = _executor, executor
+    return previous
+
+
+async def run_io(func, *args, **kwargs):
+    """
+    Run blocking ``func(*args, **kwargs)`` on the file I/O thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class AsyncFile(object):
+    """
+    File object with awaitable methods (returned by ``open_file``).
+
+    Supports ``async with`` and ``async for`` (over lines).
+    """
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+
+    async def read(self, size=-1):
+        return await run_io(self.file_obj.read, size)
+
+    async def readline(self):
+        return await run_io(self.file_obj.readline)
+
+    async def write(self, data):
+        return await run_io(self.file_obj.write, data)
+
+    async def flush(self):
+        return await run_io(self.file_obj.flush)
+
+    async def close(self):
+        return await run_io(self.file_obj.close)
+
+    async def iter_chunks(self, chunk_size=utils.default_chunk_size):
+        """Async generator of chunks of file content."""
+        while True:
+            data = await self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+
+async def open_file(path, mode=None, encoding=None, **kwargs):
+    """
+    Awaitable version of ``utils.open_file``.
+
+    :returns: ``AsyncFile``
+    """
+    future = get_executor().submit(utils.open_file, path, mode=mode,
+                                   encoding=encoding, **kwargs)
+    try:
+        file_obj = await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # close the file if the pool opens it after cancellation
+        def close(f):
+            if not f.cancelled() and f.exception() is None:
+                f.result().close()
+        future.add_done_callback(close)
+        raise
+    return AsyncFile(file_obj)
+
+
+async def get_file_contents(path, mode=None, encoding=None, **kwargs):
+    """
+    Awaitable version of ``utils.get_file_contents``.
+    """
+    return await run_io(utils.get_file_contents, path, mode=mode,
+                        encoding=encoding, **kwargs)
+
+
+async def write_file(path, data, mode=None, encoding=None, **kwargs):
+    """
+    Awaitable version of ``utils.write_file`` (accepts ``atomic`` and
+    ``durability``).
+    """
+    return await run_io(utils.write_file, path, data, mode=mode,
+                        encoding=encoding, **kwargs)
+
+
+async def delete_file(path, secure=False):
+    """
+    Awaitable version of ``utils.delete_file``.
+    """
+    return await run_io(utils.delete_file, path, secure=secure)
+
+
+async def iter_file_contents(path, chunk_size=utils.default_chunk_size,
+                             mode=None, encoding=None, **kwargs):
+    """
+    Async generator of chunks of file content (streaming read).
+
+    Yields nothing if the file cannot be read. The file is closed when
+    the generator finishes or is cancelled.
+    """
+    mode, encoding = utils._file_mode('r', mode, encoding)
+    try:
+        f = await open_file(path, mode=mode, encoding=encoding, **kwargs)
+    except (IOError, OSError):
+        return
+    async with f:
+        async for data in f.iter_chunks(chunk_size):
+            yield data
+
+
+async def write_stream(path, chunks, mode=None, encoding=None, **kwargs):
+    """
+    Write chunks from an iterable or async iterable to file.
+
+    :param path: path of file to write to.
+    :param chunks: iterable or async iterable of data
+    :returns: number of chunks written
+    """
+    mode, encoding = utils._file_mode('w', mode, encoding)
+    count = 0
+    async with await open_file(path, mode=mode, encoding=encoding,
+                               **kwargs) as f:
+        if hasattr(chunks, '__aiter__'):
+            async for data in chunks:
+                await f.write(data)
+                count += 1
+        else:
+            for data in chunks:
+                await f.write(data)
+                count += 1
+    return count
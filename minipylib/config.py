@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.config
+
+This module contains file-backed sources for ``minipylib.utils.Config``
+and a watcher that reloads them when the files change.
+
+Each source loads one namespace from a file: ::
+
+    config = Config()
+    watcher = ConfigWatcher(config, [
+        PythonSource('/etc/myapp/default_config.py', 'defaults'),
+        JSONSource('/etc/myapp/site.json', 'site'),
+        EnvSource(namespace='env', prefix='MYAPP_'),
+    ])
+    watcher.load()
+    watcher.start(interval=2.0)
+
+    config.subscribe(lambda config, namespace, keys: resize_pools(config))
+
+Later sources override earlier ones. The watcher checks the files'
+mtime and size (a single ``stat`` per source) and reloads only sources
+that changed. A reloaded namespace is swapped into the config in one
+step and subscribers are called with the keys that changed. A file that
+fails to load keeps its previous values (the error is kept in the
+source's ``error`` attribute).
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import six
+import os
+import json
+import logging
+import threading
+
+from minipylib.utils import get_file_contents
+
+
+log = logging.getLogger(__name__)
+
+
+class ConfigError(Exception):
+    """Raised when a config source is not defined properly."""
+    pass
+
+
+class ConfigSource(object):
+    """
+    Base class for a file-backed config namespace.
+
+    Subclasses implement ``parse`` to convert file content to a dict.
+    """
+    mode = None
+
+    def __init__(self, path, namespace=None):
+        """
+        :param path: path of config file
+        :param namespace: config namespace (default is the file name)
+        """
+        self.path = path
+        self.namespace = namespace or os.path.basename(path)
+        self.signature = None
+        self.error = None
+
+    def get_signature(self):
+        """Return (mtime, size) of file or None if missing."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def changed(self):
+        """Return True if file changed since last ``load``."""
+        return self.get_signature() != self.signature
+
+    def load(self):
+        """
+        Return dict of settings from file (empty if file is missing).
+
+        :raises: error from ``parse`` if file cannot be parsed
+        """
+        signature = self.get_signature()
+        data = {}
+        if signature is not None:
+            text = get_file_contents(self.path, mode=self.mode)
+            if text is not None:
+                data = self.parse(text)
+        self.signature = signature
+        return data
+
+    def parse(self, text):
+        """
+        Return dict of settings from file content. Subclass should
+        override.
+        """
+        raise ConfigError(
+            'ConfigSource subclass should override "parse" method.')
+
+
+class JSONSource(ConfigSource):
+    """
+    Load namespace from a JSON file (top-level object).
+    """
+    def parse(self, text):
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError('%s: top-level JSON value is not an object'
+                             % self.path)
+        return data
+
+
+class IniSource(ConfigSource):
+    """
+    Load namespace from an INI file.
+
+    If ``section`` is set, only that section is loaded; otherwise the
+    items of all sections are merged (later sections win). Values are
+    strings.
+    """
+    def __init__(self, path, namespace=None, section=None):
+        super(IniSource, self).__init__(path, namespace)
+        self.section = section
+
+    def parse(self, text):
+        from six.moves import configparser
+        parser = configparser.RawConfigParser()
+        parser.optionxform = str
+        if six.PY2:
+            import io
+            parser.readfp(io.StringIO(text), self.path)
+        else:
+            parser.read_string(text, self.path)
+        sections = [self.section] if self.section else parser.sections()
+        data = {}
+        for section in sections:
+            data.update(parser.items(section))
+        return data
+
+
+class EnvSource(ConfigSource):
+    """
+    Load namespace from environment variables or an env file.
+
+    Only variables that start with ``prefix`` are loaded (the prefix is
+    removed from the key). An env file has ``KEY=value`` lines; blank
+    lines and lines starting with ``#`` are ignored.
+    """
+    def __init__(self, path=None, namespace='env', prefix=''):
+        super(EnvSource, self).__init__(path, namespace)
+        self.prefix = prefix
+
+    def get_signature(self):
+        if self.path is None:
+            return tuple(sorted([(k, v) for k, v in os.environ.items()
+                                 if k.startswith(self.prefix)]))
+        return super(EnvSource, self).get_signature()
+
+    def load(self):
+        if self.path is None:
+            self.signature = self.get_signature()
+            return self.filter(os.environ.items())
+        return super(EnvSource, self).load()
+
+    def filter(self, items):
+        size = len(self.prefix)
+        return dict([(k[size:], v) for k, v in items
+                     if k.startswith(self.prefix) and k[size:]])
+
+    def parse(self, text):
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            key = key.strip()
+            if key.startswith('export '):
+                key = key[len('export '):].strip()
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            items.append((key, value))
+        return self.filter(items)
+
+
+class PythonSource(ConfigSource):
+    """
+    Load namespace from a Python settings file.
+
+    Only global vars in ALL CAPS are loaded (as with
+    ``import_module_settings``). The file is executed in a fresh
+    namespace; it is not added to ``sys.modules``.
+    """
+    # compile source as bytes (honours coding declarations)
+    mode = 'b'
+
+    def parse(self, text):
+        namespace = {'__file__': self.path, '__name__': '__config__'}
+        six.exec_(compile(text, self.path, 'exec'), namespace)
+        return dict([(k, v) for k, v in namespace.items()
+                     if k == k.upper() and not k.startswith('_')])
+
+
+SOURCE_TYPES = {
+    '.json': JSONSource,
+    '.ini': IniSource,
+    '.cfg': IniSource,
+    '.env': EnvSource,
+    '.py': PythonSource,
+}
+
+def get_source(path, namespace=None):
+    """
+    Return source for ``path`` based on the file extension.
+
+    :raises: ``ValueError`` for unknown file types
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        source_class = SOURCE_TYPES[ext]
+    except KeyError:
+        raise ValueError('Unknown config file type: %s' % path)
+    if source_class is EnvSource:
+        return EnvSource(path, namespace or os.path.basename(path))
+    return source_class(path, namespace)
+
+
+class ConfigWatcher(object):
+    """
+    Load config sources into a ``Config`` and reload them on change.
+    """
+    def __init__(self, config, sources):
+        """
+        :param config: ``minipylib.utils.Config``
+        :param sources: list of ``ConfigSource`` objects or file paths
+            (later sources override earlier ones)
+        """
+        self.config = config
+        self.sources = [get_source(s) if isinstance(s, six.string_types)
+                        else s for s in sources]
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def _reload(self, source):
+        try:
+            data = source.load()
+        except Exception as e:
+            # keep previous values until the file changes again
+            source.error = e
+            source.signature = source.get_signature()
+            return None
+        source.error = None
+        return self.config.replace_namespace(source.namespace, data)
+
+    def load(self):
+        """Load all sources (in order)."""
+        for source in self.sources:
+            self._reload(source)
+
+    def poll(self):
+        """
+        Reload sources whose files changed.
+
+        :returns: dict of namespace and set of changed keys
+        """
+        changes = {}
+        for source in self.sources:
+            if source.changed():
+                changed = self._reload(source)
+                if changed:
+                    changes[source.namespace] = changed
+        return changes
+
+    def _run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.poll()
+            except Exception:
+                # keep polling; the next change may fix the error
+                log.exception('Config poll failed')
+
+    def start(self, interval=1.0):
+        """Poll sources every ``interval`` seconds in a daemon thread."""
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, args=(interval,))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop polling thread."""
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
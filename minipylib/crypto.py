@@ -23,7 +23,9 @@ import hashlib
 import base64
 import hmac
 import string
-import random
+import struct
+import threading
+import time
 
 try:
     import cPickle as pickle
@@ -31,6 +33,7 @@ except ImportError:
     import pickle
 
 from Crypto.Cipher import AES
+from Crypto.Util import Counter
 
 
 ### AES encryption/decryption
@@ -199,6 +202,297 @@ class Cipher(object):
         return decrypted
 
 
+### AES counter mode cipher
+
+DEFAULT_CIPHER_WORKERS = 4
+DEFAULT_SEGMENT_SIZE = 2**20
+
+
+def _ctr_job(args):
+    """Encrypt/decrypt one counter range (pool worker, must be picklable)."""
+    key, nonce, block_index, data = args
+    counter = Counter.new(64, prefix=nonce, initial_value=block_index)
+    return AES.new(key, AES.MODE_CTR, counter=counter).encrypt(data)
+
+
+_ctr_pools = {}
+_ctr_pools_lock = threading.Lock()
+
+def get_ctr_pool(workers, processes=False):
+    """
+    Return shared pool for ``CTRCipher`` jobs (created on first use).
+
+    One pool is kept for each (workers, processes) combination, so
+    short-lived ciphers (e.g. from ``encode_data``) do not each start
+    their own threads or processes.
+    """
+    key = (workers, bool(processes))
+    with _ctr_pools_lock:
+        pool = _ctr_pools.get(key)
+        if pool is None:
+            if processes:
+                from multiprocessing import Pool
+            else:
+                from multiprocessing.pool import ThreadPool as Pool
+            pool = _ctr_pools[key] = Pool(workers)
+    return pool
+
+
+def close_ctr_pools():
+    """Shut down shared ``CTRCipher`` pools."""
+    with _ctr_pools_lock:
+        pools = list(_ctr_pools.values())
+        _ctr_pools.clear()
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+
+class CTRCipher(Cipher):
+    """
+    Encryption/decryption cipher object using AES in counter mode.
+
+    Unlike CFB mode, every 16-byte block of the keystream can be
+    computed independently, so large buffers are split into counter
+    ranges (``segment_size`` bytes each) and encrypted on a shared pool
+    of ``workers`` threads (or processes if ``processes`` is True; see
+    ``get_ctr_pool``). The result is the same as encrypting the data
+    serially.
+
+    Envelope format: ::
+
+        magic (4 bytes) + digest (32 bytes) + nonce (8 bytes) + ciphertext
+
+    The digest is an HMAC (with a key derived from the secret) of the
+    magic, nonce and ciphertext. It is checked before anything is
+    decrypted.
+
+    Note: threads only run in parallel if the AES implementation
+    releases the GIL (PyCryptodome does); otherwise use ``processes``.
+    """
+    mode = AES.MODE_CTR
+    magic = b'\xa7CT\x01'
+    nonce_size = 8
+    iv_size = nonce_size
+
+    def __init__(self, secret, workers=DEFAULT_CIPHER_WORKERS,
+                 processes=False, segment_size=DEFAULT_SEGMENT_SIZE):
+        """
+        :param secret: secret password
+        :param workers: number of threads/processes for large data
+        :param processes: True to use a process pool instead of threads
+        :param segment_size: bytes per job (multiple of 16)
+        """
+        if segment_size % AES.block_size:
+            raise CipherError("segment_size must be a multiple of %d"
+                              % AES.block_size)
+        super(CTRCipher, self).__init__(secret)
+        self.workers = workers
+        self.processes = processes
+        self.segment_size = segment_size
+
+    def set_secret(self, secret):
+        """
+        Set secret password (text is encoded to utf-8).
+        """
+        if isinstance(secret, six.text_type):
+            secret = secret.encode('utf-8')
+        super(CTRCipher, self).set_secret(secret)
+        self.signer = Signer(hashlib.sha256(b'mac:' + self.key).digest())
+
+    def make_digest(self, *args):
+        """
+        Return HMAC digest for arguments.
+        """
+        return self.signer.sign(*args)
+
+    def get_pool(self):
+        """Return pool used for parallel jobs."""
+        return get_ctr_pool(self.workers, self.processes)
+
+    def crypt(self, data, nonce, block_index=0):
+        """
+        Encrypt or decrypt data (the operations are the same in CTR mode).
+
+        :param data: data to encrypt/decrypt
+        :param nonce: nonce (8 bytes)
+        :param block_index: counter value of first block of data
+        :returns: encrypted/decrypted data
+        """
+        size = self.segment_size
+        if self.workers < 2 or len(data) <= size:
+            return _ctr_job((self.key, nonce, block_index, data))
+        step = size // AES.block_size
+        jobs = [(self.key, nonce, block_index + n * step, data[i:i+size])
+                for n, i in enumerate(range(0, len(data), size))]
+        return b''.join(self.get_pool().map(_ctr_job, jobs))
+
+    def encrypt(self, plaintext):
+        """
+        Encrypt plaintext.
+
+        :param plaintext: data to be encrypted
+        :returns: envelope
+        """
+        if not self.key:
+            raise CipherError("Empty encryption key.")
+        self.iv = os.urandom(self.nonce_size)
+        ciphertext = self.crypt(plaintext, self.iv)
+        self.digest = self.make_digest(self.magic, self.iv, ciphertext)
+        return self.magic + self.digest + self.iv + ciphertext
+
+    def decrypt(self, data):
+        """
+        Verify and decrypt envelope.
+
+        :param data: envelope created by ``encrypt``
+        :returns: plaintext data
+        """
+        if not self.key:
+            raise CipherError("Empty encryption key")
+        if not isinstance(data, six.binary_type):
+            raise CipherError("Bad data supplied to decrypt method.")
+        header = len(self.magic) + self.digest_size + self.nonce_size
+        if len(data) < header or not data.startswith(self.magic):
+            raise CipherError("Data is not a CTR envelope.")
+        self.digest = data[len(self.magic):len(self.magic)+self.digest_size]
+        self.iv = data[header-self.nonce_size:header]
+        ciphertext = data[header:]
+        if not hmac.compare_digest(
+                self.make_digest(self.magic, self.iv, ciphertext),
+                self.digest):
+            raise CipherError("Data signatures do not match!")
+        return self.crypt(ciphertext, self.iv)
+
+    def encrypt_file(self, src_path, dst_path, encoding=None):
+        """
+        Encrypt file to envelope file.
+
+        :param src_path: path of file to encrypt
+        :param dst_path: path of encrypted file to create
+        :param encoding: encode envelope as text (key of ``Encoders``,
+            e.g. 'base64')
+
+        The envelope is written as it is encrypted. The digest at the
+        start of the envelope is filled in when the whole file has been
+        encrypted (``dst_path`` must be a seekable file).
+        """
+        from minipylib.utils import open_file
+        nonce = os.urandom(self.nonce_size)
+        hasher = self.signer.hasher()
+        hasher.update(self.magic)
+        hasher.update(nonce)
+        read_size = self.segment_size * max(self.workers, 1)
+        header_size = len(self.magic) + self.digest_size + self.nonce_size
+        if encoding:
+            encoder = StreamEncoder(encoding)
+            # the encoded header is rewritten at the end, so hold back
+            # enough ciphertext to fill the last group of the header.
+            group = encoder.group
+            head_size = (header_size + group - 1) // group * group
+            placeholder = len(encoder.encoder(b'\0' * head_size))
+        else:
+            encoder = None
+            head_size = header_size
+            placeholder = header_size
+
+        def make_head(digest, held):
+            head = self.magic + digest + nonce + held
+            if encoder is None:
+                return head
+            if len(head) == head_size:
+                return encoder.encoder(head)
+            # envelope is shorter than head_size
+            return encoder.encoder(head) + encoder.flush()
+
+        with open_file(src_path, mode='rb') as src:
+            with open_file(dst_path, mode='wb') as dst:
+                dst.write(b'\0' * placeholder)
+                held = b''
+                block_index = 0
+                while True:
+                    data = src.read(read_size)
+                    if not data:
+                        break
+                    ciphertext = self.crypt(data, nonce, block_index)
+                    hasher.update(ciphertext)
+                    block_index += len(data) // AES.block_size
+                    if len(held) < head_size - header_size:
+                        ciphertext = held + ciphertext
+                        split = head_size - header_size
+                        held, ciphertext = ciphertext[:split], ciphertext[split:]
+                    if encoder is not None:
+                        ciphertext = encoder.update(ciphertext)
+                    dst.write(ciphertext)
+                if encoder is not None:
+                    dst.write(encoder.flush())
+                head = make_head(hasher.digest(), held)
+                if len(head) != placeholder:
+                    # short envelope: nothing was written after the header
+                    dst.seek(0)
+                    dst.truncate()
+                dst.seek(0)
+                dst.write(head)
+
+    def decrypt_file(self, src_path, dst_path, encoding=None):
+        """
+        Verify and decrypt envelope file.
+
+        :param src_path: path of encrypted file
+        :param dst_path: path of decrypted file to create
+        :param encoding: encoding of envelope file (key of ``Decoders``)
+
+        The file is read once: each chunk is added to the MAC and
+        decrypted to a temporary file next to ``dst_path``, which is
+        renamed to ``dst_path`` only if the MAC matches. So the output
+        is exactly the data that was authenticated, even if the source
+        file changes while it is read.
+        """
+        import tempfile
+        from minipylib.utils import open_file
+        read_size = self.segment_size * max(self.workers, 1)
+        header = len(self.magic) + self.digest_size + self.nonce_size
+
+        with open_file(src_path, mode='rb') as src:
+            envelope = src
+            if encoding:
+                envelope = ChunkReader(iter_decode(src, encoding, read_size))
+            head = envelope.read(header)
+            if len(head) < header or not head.startswith(self.magic):
+                raise CipherError("Data is not a CTR envelope.")
+            digest = head[len(self.magic):len(self.magic)+self.digest_size]
+            nonce = head[header-self.nonce_size:]
+            hasher = self.signer.hasher()
+            hasher.update(self.magic)
+            hasher.update(nonce)
+            dirname, basename = os.path.split(os.path.abspath(dst_path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % basename,
+                                            suffix='.tmp', dir=dirname)
+            try:
+                with open_file(fd, mode='wb') as dst:
+                    block_index = 0
+                    while True:
+                        data = envelope.read(read_size)
+                        if not data:
+                            break
+                        hasher.update(data)
+                        dst.write(self.crypt(data, nonce, block_index))
+                        block_index += len(data) // AES.block_size
+                if not hmac.compare_digest(hasher.digest(), digest):
+                    raise CipherError("Data signatures do not match!")
+                getattr(os, 'replace', os.rename)(tmp_path, dst_path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+
+# cipher classes for the ``mode`` parameter of ``encode_data``
+CipherModes = {
+    'cfb': Cipher,
+    'ctr': CTRCipher,
+}
+
+
 ### functions to encode/decode using AES Cipher object (above)
 
 ### example encode/decode function
@@ -223,21 +517,28 @@ class Cipher(object):
 Encoders = {
     'base16': base64.b16encode,
     'base32': base64.b32encode,
-    'base64': base64.b64encode
+    'base64': base64.b64encode,
+    'base64url': base64.urlsafe_b64encode,
 }
 
 Decoders = {
     'base16': base64.b16decode,
     'base32': base64.b32decode,
-    'base64': base64.b64decode
+    'base64': base64.b64decode,
+    'base64url': base64.urlsafe_b64decode,
 }
 
+if hasattr(base64, 'b85encode'):
+    # Python 3.4+
+    Encoders['base85'] = base64.b85encode
+    Decoders['base85'] = base64.b85decode
+
 
 def get_encoder(encode):
     """
     Return encoder corresponding to encode string or callable.
 
-    :param encoding: string (either 'base16', 'base32' or 'base64') or callable
+    :param encoding: string (key of ``Encoders``/``Decoders``) or callable
     :returns: callable
     """
     if callable(encode):
@@ -253,7 +554,7 @@ def get_decoder(decode):
     """
     Return decoder corresponding to decode string or callable.
 
-    :param encoding: string (either 'base16', 'base32' or 'base64') or callable
+    :param encoding: string (key of ``Encoders``/``Decoders``) or callable
     :returns: callable
     """
     if callable(decode):
@@ -265,18 +566,226 @@ def get_decoder(decode):
     return decoder
 
 
-def encode_data(data, secret_key, pickle_data=False, encoding=None):
+### streaming encoders/decoders
+# * data is encoded/decoded in blocks aligned to the encoding's group
+#   size so chunks can be processed independently; the output is the
+#   same as encoding/decoding the whole buffer at once.
+
+# (input bytes, output characters) per group for each encoding
+EncodingGroups = {
+    'base16': (1, 2),
+    'base32': (5, 8),
+    'base64': (3, 4),
+    'base64url': (3, 4),
+    'base85': (4, 5),
+}
+
+DEFAULT_STREAM_CHUNK_SIZE = 2**16
+
+
+class StreamEncoder(object):
+    """
+    Incremental encoder for the encodings in ``Encoders``.
+
+    Usage::
+
+        encoder = StreamEncoder('base64')
+        for chunk in chunks:
+            out.write(encoder.update(chunk))
+        out.write(encoder.flush())
+
+    """
+    def __init__(self, encoding='base64'):
+        """
+        :param encoding: name of encoding (key of ``Encoders``)
+        """
+        try:
+            self.encoder = Encoders[encoding]
+            self.group = EncodingGroups[encoding][0]
+        except KeyError:
+            raise CipherError("Unknown encoding: %s" % encoding)
+        self.encoding = encoding
+        self.pending = b''
+
+    def update(self, data):
+        """
+        Encode data and return output for all complete groups.
+        """
+        if self.pending:
+            data = self.pending + data
+        size = len(data) - len(data) % self.group
+        self.pending = data[size:]
+        if not size:
+            return b''
+        return self.encoder(data[:size])
+
+    def flush(self):
+        """
+        Return encoded remaining data (with padding if required).
+        """
+        data, self.pending = self.pending, b''
+        if not data:
+            return b''
+        return self.encoder(data)
+
+
+class StreamDecoder(StreamEncoder):
+    """
+    Incremental decoder for the encodings in ``Decoders``.
+
+    Whitespace (e.g. line breaks) in the encoded input is ignored.
+    """
+    def __init__(self, encoding='base64'):
+        """
+        :param encoding: name of encoding (key of ``Decoders``)
+        """
+        try:
+            self.encoder = Decoders[encoding]
+            self.group = EncodingGroups[encoding][1]
+        except KeyError:
+            raise CipherError("Unknown encoding: %s" % encoding)
+        self.encoding = encoding
+        self.pending = b''
+
+    def update(self, data):
+        """
+        Decode data and return output for all complete groups.
+        """
+        if isinstance(data, six.text_type):
+            data = data.encode('ascii')
+        return super(StreamDecoder, self).update(b''.join(data.split()))
+
+
+def _iter_source(source, chunk_size):
+    """Yield chunks from a file object (``read`` method) or iterable."""
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+def iter_encode(source, encoding='base64', chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """
+    Encode a stream of bytes.
+
+    :param source: file object (opened in binary mode) or iterable of bytes
+    :param encoding: name of encoding (key of ``Encoders``)
+    :param chunk_size: read size for file objects
+    :returns: iterator of encoded chunks (bytes)
+    """
+    encoder = StreamEncoder(encoding)
+    for chunk in _iter_source(source, chunk_size):
+        data = encoder.update(chunk)
+        if data:
+            yield data
+    data = encoder.flush()
+    if data:
+        yield data
+
+
+def iter_decode(source, encoding='base64', chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """
+    Decode a stream of encoded text.
+
+    :param source: file object or iterable of encoded chunks
+    :param encoding: name of encoding (key of ``Decoders``)
+    :param chunk_size: read size for file objects
+    :returns: iterator of decoded chunks (bytes)
+    """
+    decoder = StreamDecoder(encoding)
+    for chunk in _iter_source(source, chunk_size):
+        data = decoder.update(chunk)
+        if data:
+            yield data
+    data = decoder.flush()
+    if data:
+        yield data
+
+
+class ChunkReader(object):
+    """
+    File-like object to ``read`` from an iterable of byte strings.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = b''
+
+    def read(self, size=-1):
+        parts = [self.buf]
+        have = len(self.buf)
+        while size < 0 or have < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            have += len(chunk)
+        data = b''.join(parts)
+        if size < 0:
+            self.buf = b''
+            return data
+        self.buf = data[size:]
+        return data[:size]
+
+
+def get_cipher(secret_key, mode=None, data=None):
+    """
+    Return object to encrypt/decrypt data with.
+
+    :param secret_key: secret password or ``KeyRing`` object
+    :param mode: cipher mode ('cfb' or 'ctr', default is 'cfb')
+    :param data: envelope to decrypt (to pick the matching cipher)
+    :returns: ``Cipher`` (or the ``KeyRing`` if supplied)
+    """
+    if isinstance(secret_key, KeyRing):
+        return secret_key
+    if mode is None and isinstance(data, six.binary_type) and \
+       data.startswith(CTRCipher.magic):
+        mode = 'ctr'
+    try:
+        cipher_class = CipherModes[mode or 'cfb']
+    except KeyError:
+        raise CipherError("Unknown cipher mode: %s" % mode)
+    return cipher_class(secret_key)
+
+
+def decrypt_envelope(data, secret_key):
+    """
+    Decrypt envelope created by a ``Cipher``, ``CTRCipher`` or ``KeyRing``.
+
+    :param data: envelope
+    :param secret_key: secret password or ``KeyRing`` object
+    :returns: plaintext data
+    """
+    cipher = get_cipher(secret_key, data=data)
+    try:
+        return cipher.decrypt(data)
+    except CipherError:
+        if not isinstance(cipher, CTRCipher):
+            raise
+    # CFB envelope with a digest that happens to start with the CTR magic
+    return Cipher(secret_key).decrypt(data)
+
+
+def encode_data(data, secret_key, pickle_data=False, encoding=None,
+                mode=None):
     """
     Encode data using encryption, pickle and base64.b64encode.
 
     :param data: data to encrypt (set pickle_data to True if Python data structure).
+    :param secret_key: secret password or ``KeyRing`` object
     :param pickle_data: True or False; set to True to enable pickling.
     :param encoding: use base16, basse32 or base64 encoding
+    :param mode: cipher mode ('cfb' or 'ctr', default is 'cfb')
     :returns: string
     """
     if pickle_data:
         data = pickle.dumps(data)
-    encoded = Cipher(secret_key).encrypt(data)
+    encoded = get_cipher(secret_key, mode=mode).encrypt(data)
     encoder = get_encoder(encoding)
     if callable(encoder):
         encoded = encoder(encoded)
@@ -288,6 +797,7 @@ def decode_data(encrypted, secret_key, pickle_data=False, encoding=None):
     Decode data encrypted and encoded by encode_data above.
 
     :param encrypted: encoded string to be decoded.
+    :param secret_key: secret password or ``KeyRing`` object
     :param pickle_data: True or False; set to True if encrypted data is  pickled.
     :param encoding: use base16, basse32 or base64 encoding
     :returns: data structure.
@@ -295,7 +805,7 @@ def decode_data(encrypted, secret_key, pickle_data=False, encoding=None):
     decoder = get_decoder(encoding)
     if callable(decoder):
         encrypted = decoder(encrypted)
-    decoded = Cipher(secret_key).decrypt(encrypted)
+    decoded = decrypt_envelope(encrypted, secret_key)
     if pickle_data:
         decoded = pickle.loads(decoded)
     return decoded
@@ -313,34 +823,182 @@ DefaultHashAlgorithms = {
     'sha512': hashlib.sha512
 }
 
-def file_digest(path, block_size=2**10, hashfunc=None, algorithm=None):
+# read sizes for file digests
+# * block size grows with the file size (between MIN_BLOCK_SIZE and
+#   MAX_BLOCK_SIZE) so large files are read with a few big reads.
+# * files larger than MMAP_THRESHOLD are hashed through a read-only
+#   memory map instead of read calls.
+MIN_BLOCK_SIZE = 2**16
+MAX_BLOCK_SIZE = 2**20
+MMAP_THRESHOLD = 2**26
+
+try:
+    # Python 2 (mmap objects only support the old buffer interface)
+    _buffer = buffer
+except NameError:
+    def _buffer(obj, offset, size):
+        return memoryview(obj)[offset:offset+size]
+
+
+def get_hash_func(algorithm=None, hashfunc=None):
+    """
+    Return hash constructor for ``algorithm`` (default is ``DefaultHash``).
+
+    :param algorithm: name of hash algorithm (e.g. 'md5', 'sha256')
+    :param hashfunc: hash constructor (returned as is if supplied)
+    :returns: callable returning a new hash object
+
+    Algorithms not in ``DefaultHashAlgorithms`` are looked up with
+    ``hashlib.new`` if available on the platform.
+
+    :raises: ``ValueError`` for unknown algorithm names
+    """
+    if hashfunc is not None:
+        return hashfunc
+    if algorithm is None:
+        return DefaultHash
+    hashfunc = DefaultHashAlgorithms.get(algorithm)
+    if hashfunc is None:
+        available = getattr(hashlib, 'algorithms_available', ())
+        if algorithm in available:
+            def hashfunc(data=b''):
+                return hashlib.new(algorithm, data)
+        else:
+            raise ValueError('Unknown hash algorithm: %s' % algorithm)
+    return hashfunc
+
+
+def get_block_size(size, min_size=MIN_BLOCK_SIZE, max_size=MAX_BLOCK_SIZE):
+    """
+    Return read size to use for a file of ``size`` bytes.
+
+    :param size: size of file in bytes
+    :param min_size: smallest block size to return
+    :param max_size: largest block size to return
+    :returns: block size (power of 2 for files larger than ``min_size``)
+    """
+    if size < min_size:
+        return max(size, 1)
+    block_size = min_size
+    while block_size < max_size and block_size * 64 < size:
+        block_size *= 2
+    return block_size
+
+
+def update_from_file(file_obj, updaters, block_size=None, use_mmap=None):
+    """
+    Feed content of an open binary file to hash ``update`` methods.
+
+    :param file_obj: file object opened in binary mode
+    :param updaters: list of ``update`` methods of hash objects
+    :param block_size: read size (default is chosen by file size)
+    :param use_mmap: True to read file through ``mmap`` (default is True
+        if file is larger than ``MMAP_THRESHOLD``)
+    :returns: number of bytes read
+
+    The file is read with ``readinto`` into a single reused buffer so
+    nothing is allocated per block.
+    """
+    import mmap
+    size = os.fstat(file_obj.fileno()).st_size
+    if block_size is None:
+        block_size = get_block_size(size)
+    if use_mmap is None:
+        use_mmap = size >= MMAP_THRESHOLD
+
+    if use_mmap and size > 0:
+        mapped = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(updaters) == 1:
+                updaters[0](mapped)
+            else:
+                # feed each window to every hasher while it is still in cache
+                for offset in range(0, size, block_size):
+                    chunk = _buffer(mapped, offset, block_size)
+                    for update in updaters:
+                        update(chunk)
+                    del chunk
+        finally:
+            mapped.close()
+        return size
+
+    total = 0
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    readinto = file_obj.readinto
+    while True:
+        nbytes = readinto(buf)
+        if not nbytes:
+            break
+        total += nbytes
+        chunk = view if nbytes == block_size else view[:nbytes]
+        for update in updaters:
+            update(chunk)
+    return total
+
+
+def file_digests(path, algorithms=None, block_size=None, use_mmap=None,
+                 hexdigest=True):
+    """
+    Calculate several hashes for a file in a single pass.
+
+    :param path: file system path for file
+    :param algorithms: list of algorithm names (default is ['sha256'])
+    :param block_size: read size (default is chosen by file size)
+    :param use_mmap: True/False to force or disable reading through ``mmap``
+    :param hexdigest: if True, return hexdigest format, else regular binary
+    :returns: dict of algorithm name and digest
+    :raises: ``ValueError`` for unknown algorithm names
+
+    Example: ::
+
+        digests = file_digests(path, ('md5', 'sha256'))
+        md5 = digests['md5']
+
+    """
+    from minipylib.utils import open_file
+    if not algorithms:
+        algorithms = ('sha256',)
+    elif isinstance(algorithms, six.string_types):
+        algorithms = (algorithms,)
+    hashers = [(name, get_hash_func(name)()) for name in algorithms]
+    with open_file(path, mode='rb', buffering=0) as file_obj:
+        update_from_file(file_obj, [h.update for name, h in hashers],
+                         block_size=block_size, use_mmap=use_mmap)
+    if hexdigest:
+        return dict([(name, h.hexdigest()) for name, h in hashers])
+    return dict([(name, h.digest()) for name, h in hashers])
+
+
+def file_digest(path, block_size=None, hashfunc=None, algorithm=None,
+                use_mmap=None):
     """
     Calculate hash for file (default algorithm is hashlib.sha256).
 
     :param path: file system path for file
+    :param block_size: read size (default is chosen by file size)
     :param hashfunc: algorithm to use (from hashlib)
     :param algorithm: alternative method of specifying hash algorithm (as string)
+    :param use_mmap: True/False to force or disable reading through ``mmap``
     :returns: hash in hex
+
+    To calculate more than one hash for the same file, use
+    ``file_digests`` to read the file only once.
     """
     from minipylib.utils import open_file
-    if hashfunc is None:
-        if algorithm is None:
-            hashfunc = DefaultHash
-        else:
-            hashfunc = DefaultHashAlgorithms.get(algorithm, DefaultHash);
-
+    try:
+        hashfunc = get_hash_func(algorithm, hashfunc)
+    except ValueError:
+        # unknown names have always fallen back to the default here
+        hashfunc = DefaultHash
     hasher = hashfunc()
-    with open_file(path, mode='rb') as file_obj:
-        while True:
-            data = file_obj.read(block_size)
-            if not data:
-                break
-            hasher.update(data)
-
+    with open_file(path, mode='rb', buffering=0) as file_obj:
+        update_from_file(file_obj, [hasher.update],
+                         block_size=block_size, use_mmap=use_mmap)
     return hasher.hexdigest()
 
 
-def md5_for_file(path, block_size=2**10):
+def md5_for_file(path, block_size=None):
     """
     Calculate md5 checksum for file.
 
@@ -350,6 +1008,432 @@ def md5_for_file(path, block_size=2**10):
     return file_digest(path, block_size=block_size, hashfunc=hashlib.md5)
 
 
+### directory manifests
+
+DEFAULT_TREE_WORKERS = 4
+
+class DigestCache(object):
+    """
+    Cache of file digests keyed on (path, inode, size, mtime).
+
+    Entries for files that have not changed since the last run are
+    reused by ``digest_tree`` instead of hashing the file again. The
+    cache is stored as a JSON file if ``path`` is supplied.
+
+    Usage::
+
+        cache = DigestCache('/var/cache/release.digests')
+        for relpath, digest in digest_tree(root, cache=cache):
+            ...
+        # cache is saved after the tree has been walked
+    """
+    def __init__(self, path=None, algorithm=None):
+        """
+        :param path: path of JSON file to store cache (None for memory only)
+        :param algorithm: hash algorithm the digests were created with
+        """
+        self.path = path
+        self.algorithm = algorithm or 'sha256'
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    @staticmethod
+    def make_key(st):
+        """Return (inode, size, mtime) from a stat result."""
+        return [st.st_ino, st.st_size, st.st_mtime]
+
+    def lookup(self, relpath, st):
+        """
+        Return cached digest for file or None if file has changed.
+        """
+        entry = self.entries.get(relpath)
+        if entry is not None and entry[:3] == self.make_key(st):
+            self.hits += 1
+            return entry[3]
+        self.misses += 1
+        return None
+
+    def store(self, relpath, st, digest):
+        """Add digest for file to cache."""
+        self.entries[relpath] = self.make_key(st) + [digest]
+
+    def prune(self, keep):
+        """Remove entries not in ``keep`` (set of relative paths)."""
+        for relpath in list(self.entries):
+            if relpath not in keep:
+                del self.entries[relpath]
+
+    def load(self):
+        """Load cache from file (cache is left empty if file is unusable)."""
+        import json
+        from minipylib.utils import get_file_contents
+        data = get_file_contents(self.path)
+        try:
+            data = json.loads(data)
+            assert data.get('algorithm') == self.algorithm
+            self.entries = data['entries']
+        except (TypeError, ValueError, KeyError, AttributeError,
+                AssertionError):
+            self.entries = {}
+
+    def save(self):
+        """Write cache to file (through a temporary file and rename)."""
+        import json
+        from minipylib.utils import write_file
+        if not self.path:
+            return False
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        data = json.dumps({'algorithm': self.algorithm,
+                           'entries': self.entries})
+        if not write_file(tmp_path, six.text_type(data)):
+            return False
+        os.rename(tmp_path, self.path)
+        return True
+
+
+def _digest_file_job(args):
+    """
+    Pool worker for ``digest_tree`` (must be picklable).
+
+    Returns the error instead of raising it so one unreadable file does
+    not stop the walk.
+    """
+    path, algorithm = args
+    try:
+        return file_digest(path, algorithm=algorithm)
+    except (IOError, OSError) as e:
+        return e
+
+
+def digest_tree(root, algorithm='sha256', cache=None,
+                workers=DEFAULT_TREE_WORKERS, processes=False, onerror=None):
+    """
+    Calculate digests for all files in a directory tree.
+
+    :param root: top directory of tree
+    :param algorithm: hash algorithm name (default is 'sha256')
+    :param cache: ``DigestCache`` object to skip unchanged files
+    :param workers: number of threads or processes used for hashing
+        (files are hashed serially if ``workers`` < 2)
+    :param processes: True to hash in a process pool instead of threads
+    :param onerror: function called with (relative path, error) for
+        files that cannot be read (e.g. removed during the walk);
+        these files are skipped
+    :returns: iterator of (relative path, hexdigest) sorted by path
+    :raises: ``ValueError`` if ``cache`` uses a different algorithm
+
+    Results are produced as a stream in path order while the remaining
+    files are still being hashed. If ``cache`` is supplied, it is
+    updated with the new digests and saved when the walk finishes or
+    the iterator is closed.
+    """
+    from minipylib.utils import iter_tree
+    if cache is not None and cache.algorithm != algorithm:
+        raise ValueError('Digest cache algorithm %s does not match %s'
+                         % (cache.algorithm, algorithm))
+    files = sorted(iter_tree(root))
+    todo = []
+    cached = []
+    for relpath, st in files:
+        digest = cache.lookup(relpath, st) if cache is not None else None
+        cached.append(digest)
+        if digest is None:
+            todo.append((os.path.join(root, relpath), algorithm))
+
+    pool = None
+    if workers > 1 and len(todo) > 1:
+        if processes:
+            from multiprocessing import Pool
+        else:
+            from multiprocessing.pool import ThreadPool as Pool
+        pool = Pool(workers)
+        results = pool.imap(_digest_file_job, todo, chunksize=1)
+    else:
+        results = six.moves.map(_digest_file_job, todo)
+
+    try:
+        for (relpath, st), digest in zip(files, cached):
+            if digest is None:
+                digest = next(results)
+                if isinstance(digest, (IOError, OSError)):
+                    if onerror is not None:
+                        onerror(relpath, digest)
+                    continue
+                if cache is not None:
+                    cache.store(relpath, st, digest)
+            yield relpath, digest
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if cache is not None:
+            cache.prune(set([relpath for relpath, st in files]))
+            cache.save()
+
+
+def write_manifest(root, file_obj, **kwargs):
+    """
+    Write checksum manifest for directory tree.
+
+    :param root: top directory of tree
+    :param file_obj: text stream to write manifest to
+    :param kwargs: keyword args to pass to ``digest_tree``
+    :returns: number of files in manifest
+
+    Lines are written in the ``sha256sum`` format (``digest  path``)
+    sorted by path.
+    """
+    count = 0
+    for relpath, digest in digest_tree(root, **kwargs):
+        file_obj.write('%s  %s\n' % (digest, relpath))
+        count += 1
+    return count
+
+
+### tree hashing
+# * a file is split into fixed size leaves which are hashed independently
+#   (so they can be hashed in parallel) and combined into a root digest.
+# * leaf and node hashes are prefixed with different bytes so a leaf
+#   can never be mistaken for an interior node.
+
+DEFAULT_LEAF_SIZE = 2**22
+DEFAULT_TREE_CHECKPOINT = 30.0
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+class TreeDigest(object):
+    """
+    Merkle tree digest of a file.
+
+    * ``leaves`` is a list of binary leaf digests (``None`` for leaves
+      that have not been hashed yet).
+    * ``root`` is the binary root digest (available when all leaves
+      are hashed).
+    """
+    def __init__(self, algorithm='sha256', leaf_size=DEFAULT_LEAF_SIZE,
+                 size=0, mtime=None, leaves=None):
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.size = size
+        self.mtime = mtime
+        if leaves is None:
+            leaves = [None] * self.leaf_count(size, leaf_size)
+        self.leaves = leaves
+
+    @staticmethod
+    def leaf_count(size, leaf_size):
+        """Return number of leaves for a file of ``size`` bytes."""
+        return max(1, (size + leaf_size - 1) // leaf_size)
+
+    @property
+    def complete(self):
+        return None not in self.leaves
+
+    @property
+    def root(self):
+        if not self.complete:
+            return None
+        return merkle_root(self.leaves, get_hash_func(self.algorithm))
+
+    def hexdigest(self):
+        """Return root digest in hex (or None if leaves are missing)."""
+        root = self.root
+        if root is None:
+            return None
+        return base64.b16encode(root).lower().decode('ascii')
+
+    def pending(self):
+        """Return list of indexes of leaves not hashed yet."""
+        return [i for i, leaf in enumerate(self.leaves) if leaf is None]
+
+    def to_dict(self):
+        """Return tree as a JSON serializable dict."""
+        leaves = [leaf if leaf is None else
+                  base64.b16encode(leaf).lower().decode('ascii')
+                  for leaf in self.leaves]
+        return {
+            'algorithm': self.algorithm,
+            'leaf_size': self.leaf_size,
+            'size': self.size,
+            'mtime': self.mtime,
+            'leaves': leaves,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create tree from dict returned by ``to_dict``."""
+        leaves = [leaf if leaf is None else base64.b16decode(leaf.upper())
+                  for leaf in data['leaves']]
+        return cls(data['algorithm'], data['leaf_size'], data['size'],
+                   data.get('mtime'), leaves)
+
+    def save(self, path):
+        """Save tree to JSON file (through a temporary file and rename)."""
+        import json
+        from minipylib.utils import write_file
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        if write_file(tmp_path, six.text_type(json.dumps(self.to_dict()))):
+            os.rename(tmp_path, path)
+            return True
+        return False
+
+    @classmethod
+    def load(cls, path):
+        """Load tree from JSON file or return None if file is unusable."""
+        import json
+        from minipylib.utils import get_file_contents
+        try:
+            return cls.from_dict(json.loads(get_file_contents(path)))
+        except (TypeError, ValueError, KeyError):
+            return None
+
+
+def merkle_root(leaves, hashfunc=DefaultHash):
+    """
+    Combine leaf digests into a root digest.
+
+    :param leaves: list of binary leaf digests
+    :param hashfunc: hash constructor
+    :returns: binary root digest
+
+    An unpaired node at the end of a level is promoted to the next
+    level unchanged.
+    """
+    level = list(leaves)
+    while len(level) > 1:
+        paired = []
+        for i in range(0, len(level) - 1, 2):
+            h = hashfunc(NODE_PREFIX)
+            h.update(level[i])
+            h.update(level[i+1])
+            paired.append(h.digest())
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def _tree_leaf_job(args):
+    """Pool worker for ``tree_digest`` (must be picklable)."""
+    import mmap
+    path, index, leaf_size, algorithm = args
+    hasher = get_hash_func(algorithm)(LEAF_PREFIX)
+    offset = index * leaf_size
+    with open(path, 'rb') as file_obj:
+        size = os.fstat(file_obj.fileno()).st_size
+        length = min(leaf_size, size - offset)
+        if length > 0:
+            mapped = mmap.mmap(file_obj.fileno(), length,
+                               access=mmap.ACCESS_READ, offset=offset)
+            try:
+                hasher.update(mapped)
+            finally:
+                mapped.close()
+    return index, hasher.digest()
+
+
+def _hash_leaves(path, tree, indexes, workers, processes):
+    """Yield (index, digest) for ``indexes``, in a pool if workers > 1."""
+    jobs = [(path, i, tree.leaf_size, tree.algorithm) for i in indexes]
+    if workers > 1 and len(jobs) > 1:
+        if processes:
+            from multiprocessing import Pool
+        else:
+            from multiprocessing.pool import ThreadPool as Pool
+        pool = Pool(workers)
+        try:
+            for result in pool.imap_unordered(_tree_leaf_job, jobs):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for job in jobs:
+            yield _tree_leaf_job(job)
+
+
+def tree_digest(path, algorithm='sha256', leaf_size=DEFAULT_LEAF_SIZE,
+                workers=DEFAULT_TREE_WORKERS, processes=False,
+                state_path=None, checkpoint=DEFAULT_TREE_CHECKPOINT):
+    """
+    Calculate a Merkle tree digest for a file.
+
+    :param path: file system path for file
+    :param algorithm: hash algorithm name (default is 'sha256')
+    :param leaf_size: size of leaves (must be a multiple of
+        ``mmap.ALLOCATIONGRANULARITY``; default is 4 MiB)
+    :param workers: number of threads or processes hashing leaves
+    :param processes: True to hash in a process pool instead of threads
+    :param state_path: path of JSON file to save progress to
+    :param checkpoint: save progress at most every ``checkpoint``
+        seconds (each save rewrites the whole state, so saves are
+        spaced by time rather than by leaf count)
+    :returns: ``TreeDigest`` object
+
+    Leaves are read through ``mmap`` and hashed in parallel. If
+    ``state_path`` is supplied, hashed leaves are saved periodically
+    and an interrupted run resumes from the saved state (as long as
+    the file has the same size and modification time).
+
+    Example: ::
+
+        tree = tree_digest(path, state_path=path + '.tree')
+        root = tree.hexdigest()
+
+    """
+    import mmap
+    if leaf_size % mmap.ALLOCATIONGRANULARITY:
+        raise ValueError('leaf_size must be a multiple of %d'
+                         % mmap.ALLOCATIONGRANULARITY)
+    st = os.stat(path)
+    tree = None
+    if state_path and os.path.isfile(state_path):
+        tree = TreeDigest.load(state_path)
+        if tree is not None and (tree.algorithm, tree.leaf_size, tree.size,
+                                 tree.mtime) != (algorithm, leaf_size,
+                                                 st.st_size, st.st_mtime):
+            tree = None
+    if tree is None:
+        tree = TreeDigest(algorithm, leaf_size, st.st_size, st.st_mtime)
+
+    saved = time.time()
+    for index, digest in _hash_leaves(path, tree, tree.pending(),
+                                      workers, processes):
+        tree.leaves[index] = digest
+        if state_path and time.time() - saved >= checkpoint:
+            tree.save(state_path)
+            saved = time.time()
+    if state_path:
+        tree.save(state_path)
+    return tree
+
+
+def verify_tree(path, tree, indexes=None, workers=DEFAULT_TREE_WORKERS,
+                processes=False):
+    """
+    Verify file against the leaves of a ``TreeDigest``.
+
+    :param path: file system path for file
+    :param tree: ``TreeDigest`` object to verify against
+    :param indexes: list of leaf indexes to check (default is all leaves)
+    :param workers: number of threads or processes hashing leaves
+    :param processes: True to hash in a process pool instead of threads
+    :returns: sorted list of indexes of leaves that do not match
+    """
+    if os.path.getsize(path) != tree.size:
+        raise ValueError('File size does not match tree.')
+    if indexes is None:
+        indexes = range(len(tree.leaves))
+    bad = [index for index, digest
+           in _hash_leaves(path, tree, indexes, workers, processes)
+           if not hmac.compare_digest(digest, tree.leaves[index] or b'')]
+    return sorted(bad)
+
+
 ### make hmac digest
 
 def make_digest(secret_key, *args, **kwargs):
@@ -357,6 +1441,7 @@ def make_digest(secret_key, *args, **kwargs):
     Return an ``HMAC`` digest for arguments.
 
     :param secret_key: secret password to use for creating hash digest
+        (or ``KeyRing`` object to use its primary key)
     :param args: a list of byte strings to calculate digest from
     :param digestmod: keyword argument for digest module (default: DefaultHash)
     :param hexdigest: if True, return hexdigest format, else regular binary
@@ -378,7 +1463,11 @@ def make_digest(secret_key, *args, **kwargs):
         * http://bugs.python.org/issue5285
         * http://bugs.python.org/issue16063
 
+    To sign many messages with the same secret key, use a ``Signer``
+    object (which prepares the keyed hash state only once).
     """
+    if isinstance(secret_key, KeyRing):
+        return secret_key.make_digest(*args, **kwargs)
     digestmod = kwargs.get('digestmod', DefaultHash)
     hasher = hmac.new(secret_key, digestmod=digestmod)
     for arg in args:
@@ -388,6 +1477,678 @@ def make_digest(secret_key, *args, **kwargs):
     return hasher.digest()
 
 
+### HMAC signer with precomputed key state
+
+def _signature_bytes(signature):
+    """Return signature as bytes (for constant time comparison)."""
+    if isinstance(signature, six.text_type):
+        return signature.encode('ascii')
+    return signature
+
+
+class Signer(object):
+    """
+    Object to sign and verify messages with ``HMAC`` using a fixed key.
+
+    The key padding and the keyed inner/outer hash state are computed
+    once when the object is created. Each message is signed with a
+    ``copy()`` of the prepared state, so signing many messages with the
+    same secret key is cheaper than calling ``make_digest`` for each.
+
+    Usage::
+
+        signer = Signer(secret_key)
+        signature = signer.sign(b'message')
+        assert signer.verify(signature, b'message')
+
+    ``sign`` returns the same digest as
+    ``make_digest(secret_key, *args)``.
+    """
+    def __init__(self, secret_key, digestmod=DefaultHash):
+        """
+        :param secret_key: secret password (byte string)
+        :param digestmod: digest module (default: DefaultHash)
+        """
+        self.digestmod = digestmod
+        self._hmac = hmac.new(secret_key, digestmod=digestmod)
+        self.digest_size = self._hmac.digest_size
+
+    def hasher(self):
+        """Return a new HMAC object with the prepared key state."""
+        return self._hmac.copy()
+
+    def sign(self, *args, **kwargs):
+        """
+        Return an ``HMAC`` digest for arguments.
+
+        :param args: a list of byte strings to calculate digest from
+        :param hexdigest: if True, return hexdigest format, else regular binary
+        :returns: digest
+        """
+        hasher = self._hmac.copy()
+        for arg in args:
+            hasher.update(arg)
+        if kwargs.get('hexdigest') is True:
+            return hasher.hexdigest()
+        return hasher.digest()
+
+    def verify(self, signature, *args):
+        """
+        Verify signature for arguments in constant time.
+
+        :param signature: digest to verify (binary or hexdigest format)
+        :param args: a list of byte strings the signature was calculated from
+        :returns: True if signature is valid else False
+        """
+        try:
+            signature = _signature_bytes(signature)
+        except UnicodeError:
+            return False
+        hexdigest = len(signature) == self.digest_size * 2
+        expected = _signature_bytes(self.sign(*args, hexdigest=hexdigest))
+        return hmac.compare_digest(expected, signature)
+
+    def sign_many(self, messages, hexdigest=False):
+        """
+        Sign a batch of messages.
+
+        :param messages: iterable of byte strings (or lists/tuples of byte
+            strings, as passed to ``sign``)
+        :param hexdigest: if True, return hexdigest format, else regular binary
+        :returns: list of digests
+        """
+        sign = self.sign
+        results = []
+        for message in messages:
+            if not isinstance(message, (list, tuple)):
+                message = (message,)
+            results.append(sign(*message, hexdigest=hexdigest))
+        return results
+
+    def verify_many(self, items):
+        """
+        Verify a batch of signatures.
+
+        :param items: iterable of (signature, message) pairs (message can
+            be a byte string or a list/tuple of byte strings)
+        :returns: list of True/False
+        """
+        verify = self.verify
+        results = []
+        for signature, message in items:
+            if not isinstance(message, (list, tuple)):
+                message = (message,)
+            results.append(verify(signature, *message))
+        return results
+
+
+### key ring for key rotation
+
+class KeyRing(object):
+    """
+    Collection of secret keys identified by short key ids.
+
+    Envelopes created by a key ring start with the id of the key used,
+    so the right key is found with a dict lookup instead of trying
+    every candidate key. Envelope format: ::
+
+        KEYRING_PREFIX + len(key_id) + key_id + Cipher envelope
+
+    Prepared ``Cipher`` and ``Signer`` objects are kept for each key.
+
+    Usage::
+
+        keyring = KeyRing({'2014a': old_secret, '2014b': new_secret},
+                          primary='2014b')
+        encrypted = encode_data(data, keyring)
+        data = decode_data(encrypted, keyring)
+
+        # re-encrypt old envelopes with the primary key
+        for old, new in keyring.reencrypt_many(envelopes):
+            save(new)
+
+    A ``KeyRing`` can be passed in place of ``secret_key`` to
+    ``encode_data``, ``decode_data`` and ``make_digest``.
+
+    Envelopes created by a plain ``Cipher`` or ``CTRCipher`` (without
+    a key id) can be decrypted and upgraded with ``reencrypt`` if a
+    ``legacy`` key is set: ::
+
+        keyring = KeyRing({'old': settings.SECRET_KEY, '2014b': new_secret},
+                          primary='2014b', legacy='old')
+        new = keyring.reencrypt(old_cipher_envelope)
+
+    (The digest of a ``Cipher`` envelope is not keyed, so the key
+    cannot be found by trying each key; it has to be configured.)
+    """
+    cipher_class = Cipher
+    prefix = b'\xa7'
+
+    def __init__(self, keys=None, primary=None, digestmod=DefaultHash,
+                 cipher_class=None, legacy=None):
+        """
+        :param keys: dict of key id and secret password
+        :param primary: id of key used for new envelopes (default is the
+            first key added if ``keys`` has only one key)
+        :param digestmod: digest module for ``make_digest`` and ``sign``
+        :param cipher_class: class of cipher for new envelopes (default
+            is ``Cipher``; envelopes of either mode can be decrypted)
+        :param legacy: id of key used to decrypt envelopes without a
+            key id (default is None to reject them)
+        """
+        if cipher_class is not None:
+            self.cipher_class = cipher_class
+        self.digestmod = digestmod
+        self.ciphers = {}
+        self.signers = {}
+        self.primary = None
+        self.legacy = None
+        for key_id, secret in (keys or {}).items():
+            self.add_key(key_id, secret)
+        if primary is not None:
+            self.set_primary(primary)
+        elif len(self.ciphers) == 1:
+            self.primary = list(self.ciphers)[0]
+        if legacy is not None:
+            self.set_legacy(legacy)
+
+    @staticmethod
+    def normalize_id(key_id):
+        """Return key id as bytes (1 to 255 bytes long)."""
+        if isinstance(key_id, six.text_type):
+            key_id = key_id.encode('utf-8')
+        if not isinstance(key_id, six.binary_type) or \
+           not 0 < len(key_id) < 256:
+            raise CipherError("Bad key id: %r" % key_id)
+        return key_id
+
+    def add_key(self, key_id, secret, primary=False):
+        """
+        Add a key to the key ring.
+
+        :param key_id: short id for key (text or bytes)
+        :param secret: secret password (text is encoded to utf-8)
+        :param primary: if True, use key for new envelopes
+        """
+        key_id = self.normalize_id(key_id)
+        if isinstance(secret, six.text_type):
+            # key derivation and HMAC require a byte string key
+            secret = secret.encode('utf-8')
+        self.ciphers[key_id] = self.cipher_class(secret)
+        self.signers[key_id] = Signer(secret, digestmod=self.digestmod)
+        if primary:
+            self.primary = key_id
+
+    def remove_key(self, key_id):
+        """Remove a key from the key ring."""
+        key_id = self.normalize_id(key_id)
+        self.ciphers.pop(key_id, None)
+        self.signers.pop(key_id, None)
+        if self.primary == key_id:
+            self.primary = None
+        if self.legacy == key_id:
+            self.legacy = None
+
+    def set_primary(self, key_id):
+        """Set key used for new envelopes."""
+        key_id = self.normalize_id(key_id)
+        if key_id not in self.ciphers:
+            raise CipherError("Unknown key id: %r" % key_id)
+        self.primary = key_id
+
+    def set_legacy(self, key_id):
+        """Set key used for envelopes without a key id (None to unset)."""
+        if key_id is not None:
+            key_id = self.normalize_id(key_id)
+            if key_id not in self.ciphers:
+                raise CipherError("Unknown key id: %r" % key_id)
+        self.legacy = key_id
+
+    def get_cipher(self, key_id=None):
+        """
+        Return cipher for key (default is the primary key).
+
+        A copy of the prepared cipher is returned, so the result can be
+        used while other threads use the same key ring.
+        """
+        import copy
+        key_id = self.primary if key_id is None else self.normalize_id(key_id)
+        try:
+            return copy.copy(self.ciphers[key_id])
+        except KeyError:
+            raise CipherError("Unknown key id: %r" % key_id)
+
+    def make_header(self, key_id):
+        """Return envelope header for key id."""
+        return self.prefix + six.int2byte(len(key_id)) + key_id
+
+    def split(self, envelope):
+        """
+        Split envelope into key id and body.
+
+        :param envelope: envelope created by key ring
+        :returns: (key id, body)
+        """
+        if not isinstance(envelope, six.binary_type) or \
+           envelope[:1] != self.prefix or len(envelope) < 2:
+            raise CipherError("Data is not a key ring envelope.")
+        size = six.indexbytes(envelope, 1)
+        key_id = envelope[2:2+size]
+        if len(key_id) != size:
+            raise CipherError("Data is not a key ring envelope.")
+        return key_id, envelope[2+size:]
+
+    def key_id_for(self, envelope):
+        """Return key id of envelope (or None if not a key ring envelope)."""
+        try:
+            return self.split(envelope)[0]
+        except CipherError:
+            return None
+
+    def encrypt(self, plaintext, key_id=None):
+        """
+        Encrypt plaintext with key (default is the primary key).
+
+        :param plaintext: data to be encrypted
+        :param key_id: id of key to use
+        :returns: envelope
+        """
+        key_id = self.primary if key_id is None else self.normalize_id(key_id)
+        cipher = self.get_cipher(key_id)
+        return self.make_header(key_id) + cipher.encrypt(plaintext)
+
+    def decrypt(self, envelope):
+        """
+        Decrypt envelope with the key named in its header.
+
+        :param envelope: envelope created by ``encrypt`` (or by a plain
+            cipher if a ``legacy`` key is set)
+        :returns: plaintext data
+        """
+        try:
+            key_id, data = self.split(envelope)
+            cipher = self.get_cipher(key_id)
+            if isinstance(cipher, CTRCipher) != \
+               data.startswith(CTRCipher.magic):
+                # envelope was created with the other cipher mode
+                return decrypt_envelope(data, cipher.secret)
+            return cipher.decrypt(data)
+        except CipherError:
+            if self.legacy is None or not isinstance(envelope,
+                                                     six.binary_type):
+                raise
+        # envelope without key id (or a legacy digest that happens to
+        # look like a key ring header)
+        return decrypt_envelope(envelope, self.ciphers[self.legacy].secret)
+
+    def make_digest(self, *args, **kwargs):
+        """
+        Return an ``HMAC`` digest for arguments.
+
+        :param args: a list of byte strings to calculate digest from
+        :param key_id: keyword argument for key to use (default is primary)
+        :param digestmod: keyword argument for digest module (default is
+            the key ring's ``digestmod``)
+        :param hexdigest: if True, return hexdigest format, else regular binary
+        :returns: digest (without key id)
+        """
+        key_id = kwargs.get('key_id')
+        key_id = self.primary if key_id is None else self.normalize_id(key_id)
+        try:
+            signer = self.signers[key_id]
+        except KeyError:
+            raise CipherError("Unknown key id: %r" % key_id)
+        digestmod = kwargs.get('digestmod')
+        if digestmod is not None and digestmod is not self.digestmod:
+            secret = self.ciphers[key_id].secret
+            if isinstance(secret, six.text_type):
+                secret = secret.encode('utf-8')
+            return make_digest(secret, *args, digestmod=digestmod,
+                               hexdigest=kwargs.get('hexdigest'))
+        return signer.sign(*args, hexdigest=kwargs.get('hexdigest'))
+
+    def sign(self, *args, **kwargs):
+        """
+        Return ``HMAC`` digest for arguments prefixed with the key id.
+
+        :param args: a list of byte strings to calculate digest from
+        :param key_id: keyword argument for key to use (default is primary)
+        :returns: signature (bytes)
+        """
+        key_id = kwargs.get('key_id')
+        key_id = self.primary if key_id is None else self.normalize_id(key_id)
+        return self.make_header(key_id) + self.make_digest(*args,
+                                                           key_id=key_id)
+
+    def verify(self, signature, *args):
+        """
+        Verify signature created by ``sign`` in constant time.
+
+        :param signature: signature to verify
+        :param args: a list of byte strings the signature was calculated from
+        :returns: True if signature is valid else False
+        """
+        try:
+            key_id, digest = self.split(signature)
+        except CipherError:
+            return False
+        signer = self.signers.get(key_id)
+        if signer is None:
+            return False
+        return signer.verify(digest, *args)
+
+    def reencrypt(self, envelope):
+        """
+        Re-encrypt envelope with the primary key.
+
+        :param envelope: envelope created by ``encrypt`` (or a legacy
+            envelope, see ``legacy``)
+        :returns: new envelope (or the same envelope if it already uses
+            the primary key)
+        """
+        if self.key_id_for(envelope) == self.primary:
+            return envelope
+        return self.encrypt(self.decrypt(envelope))
+
+    def reencrypt_many(self, envelopes):
+        """
+        Re-encrypt envelopes not using the primary key.
+
+        :param envelopes: iterable of envelopes
+        :returns: iterator of (old envelope, new envelope) for envelopes
+            that were re-encrypted
+        """
+        for envelope in envelopes:
+            new = self.reencrypt(envelope)
+            if new is not envelope:
+                yield envelope, new
+
+    def reencrypt_in_background(self, envelopes, callback, errback=None):
+        """
+        Re-encrypt envelopes in a background (daemon) thread.
+
+        :param envelopes: iterable of envelopes
+        :param callback: called with (old envelope, new envelope) for
+            each envelope that was re-encrypted
+        :param errback: called with (envelope, exception) if an envelope
+            cannot be decrypted (default is to skip it)
+        :returns: started ``threading.Thread`` object
+        """
+        import threading
+
+        def run():
+            for envelope in envelopes:
+                try:
+                    new = self.reencrypt(envelope)
+                except CipherError as e:
+                    if errback is not None:
+                        errback(envelope, e)
+                    continue
+                if new is not envelope:
+                    callback(envelope, new)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+### password hashing
+# * encoded format: algorithm$cost params$salt$hash (base64 salt/hash)
+#   e.g. pbkdf2_sha256$100000$c2FsdA==$... or scrypt$16384$8$1$c2FsdA==$...
+
+DEFAULT_PASSWORD_ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_PBKDF2_ITERATIONS = 100000
+DEFAULT_SCRYPT_COST = (2**14, 8, 1)
+PASSWORD_SALT_SIZE = 16
+PASSWORD_HASH_SIZE = 32
+DEFAULT_PASSWORD_WORKERS = 2
+
+PasswordHashAlgorithms = {
+    'pbkdf2_sha256': 'sha256',
+    'pbkdf2_sha512': 'sha512',
+    'scrypt': None,
+}
+
+
+def _password_bytes(password):
+    """Return password as bytes (text is encoded as utf-8)."""
+    if isinstance(password, six.text_type):
+        return password.encode('utf-8')
+    return password
+
+
+def _derive_password(password, salt, algorithm, cost):
+    """Return raw hash of password for algorithm and cost."""
+    if algorithm == 'scrypt':
+        if not hasattr(hashlib, 'scrypt'):
+            raise CipherError("scrypt is not available on this platform.")
+        n, r, p = cost
+        return hashlib.scrypt(password, salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p,
+                              dklen=PASSWORD_HASH_SIZE)
+    try:
+        digest = PasswordHashAlgorithms[algorithm]
+    except KeyError:
+        raise CipherError("Unknown password algorithm: %s" % algorithm)
+    return hashlib.pbkdf2_hmac(str(digest), password, salt, cost,
+                               PASSWORD_HASH_SIZE)
+
+
+def _default_password_cost(algorithm):
+    if algorithm == 'scrypt':
+        return DEFAULT_SCRYPT_COST
+    return DEFAULT_PBKDF2_ITERATIONS
+
+
+def hash_password(password, algorithm=None, cost=None, salt=None):
+    """
+    Return encoded password hash.
+
+    :param password: password (text or bytes)
+    :param algorithm: 'pbkdf2_sha256' (default), 'pbkdf2_sha512' or 'scrypt'
+    :param cost: number of iterations for PBKDF2 or (n, r, p) for scrypt
+    :param salt: salt (bytes; default is random)
+    :returns: encoded hash (text) including algorithm, cost and salt
+    """
+    algorithm = algorithm or DEFAULT_PASSWORD_ALGORITHM
+    if cost is None:
+        cost = _default_password_cost(algorithm)
+    if salt is None:
+        salt = os.urandom(PASSWORD_SALT_SIZE)
+    hashed = _derive_password(_password_bytes(password), salt, algorithm, cost)
+    if algorithm == 'scrypt':
+        params = '%d$%d$%d' % tuple(cost)
+    else:
+        params = '%d' % cost
+    return '%s$%s$%s$%s' % (algorithm, params,
+                            base64.b64encode(salt).decode('ascii'),
+                            base64.b64encode(hashed).decode('ascii'))
+
+
+def parse_password_hash(encoded):
+    """
+    Split encoded password hash into its parts.
+
+    :param encoded: encoded hash returned by ``hash_password``
+    :returns: (algorithm, cost, salt, hash)
+    """
+    try:
+        parts = encoded.split('$')
+        algorithm = parts[0]
+        if algorithm == 'scrypt':
+            cost = tuple([int(n) for n in parts[1:4]])
+            assert len(parts) == 6
+        else:
+            cost = int(parts[1])
+            assert len(parts) == 4
+        salt = base64.b64decode(parts[-2])
+        hashed = base64.b64decode(parts[-1])
+    except (AttributeError, IndexError, ValueError, TypeError,
+            AssertionError):
+        raise CipherError("Bad password hash.")
+    return algorithm, cost, salt, hashed
+
+
+def check_password(password, encoded):
+    """
+    Verify password against encoded hash (in constant time).
+
+    :param password: password (text or bytes)
+    :param encoded: encoded hash returned by ``hash_password``
+    :returns: True if password matches else False (also for malformed
+        hashes and hashes with out of range cost parameters)
+    """
+    try:
+        algorithm, cost, salt, hashed = parse_password_hash(encoded)
+        result = _derive_password(_password_bytes(password), salt,
+                                  algorithm, cost)
+    except (CipherError, ValueError, OverflowError):
+        return False
+    return hmac.compare_digest(result, hashed)
+
+
+def password_needs_rehash(encoded, algorithm=None, cost=None):
+    """
+    Return True if encoded hash does not use algorithm and cost.
+    """
+    algorithm = algorithm or DEFAULT_PASSWORD_ALGORITHM
+    if cost is None:
+        cost = _default_password_cost(algorithm)
+    try:
+        parts = parse_password_hash(encoded)
+    except CipherError:
+        return True
+    return parts[:2] != (algorithm, cost)
+
+
+def calibrate_password_cost(target=0.25, algorithm=None, rounds=3):
+    """
+    Return cost which takes about ``target`` seconds on this host.
+
+    :param target: target time (seconds) to hash one password
+    :param algorithm: password algorithm (default is 'pbkdf2_sha256')
+    :param rounds: number of timing runs (the fastest is used)
+    :returns: iterations for PBKDF2 or (n, r, p) for scrypt
+
+    For PBKDF2, time is proportional to the number of iterations. For
+    scrypt, ``n`` is a power of 2 so the result is the largest ``n``
+    that stays within ``target``.
+    """
+    algorithm = algorithm or DEFAULT_PASSWORD_ALGORITHM
+    salt = os.urandom(PASSWORD_SALT_SIZE)
+
+    def timed(cost):
+        best = None
+        for i in range(rounds):
+            start = time.time()
+            _derive_password(b'calibrate', salt, algorithm, cost)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    if algorithm == 'scrypt':
+        n, r, p = 2**10, DEFAULT_SCRYPT_COST[1], DEFAULT_SCRYPT_COST[2]
+        elapsed = timed((n, r, p))
+        while elapsed * 2 <= target and n < 2**20:
+            n *= 2
+            elapsed = timed((n, r, p))
+        if elapsed > target and n > 2**10:
+            n //= 2
+        return (n, r, p)
+
+    iterations = 10000
+    elapsed = timed(iterations)
+    # scale up until timings are long enough to be meaningful
+    while elapsed < 0.01:
+        iterations *= 4
+        elapsed = timed(iterations)
+    return max(1000, int(iterations * target / elapsed))
+
+
+class PasswordHasher(object):
+    """
+    Hash and verify passwords on a dedicated pool of worker threads.
+
+    Password hashing is deliberately slow. Running it on a small,
+    separate pool limits how many CPUs a burst of logins can use and
+    lets asynchronous callers continue without waiting for the result.
+    (``hashlib`` releases the GIL while it hashes.)
+
+    Usage::
+
+        hasher = PasswordHasher(cost=calibrate_password_cost(0.1))
+        encoded = hasher.hash('password')
+        result = hasher.verify_async('password', encoded, callback=login)
+    """
+    def __init__(self, algorithm=None, cost=None,
+                 workers=DEFAULT_PASSWORD_WORKERS):
+        """
+        :param algorithm: password algorithm (default is 'pbkdf2_sha256')
+        :param cost: algorithm cost (default is the algorithm default)
+        :param workers: number of worker threads
+        """
+        self.algorithm = algorithm or DEFAULT_PASSWORD_ALGORITHM
+        self.cost = cost
+        if cost is None:
+            self.cost = _default_password_cost(self.algorithm)
+        self.workers = workers
+        self.pool = None
+
+    def get_pool(self):
+        """Return worker pool (created on first use)."""
+        if self.pool is None:
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(self.workers)
+        return self.pool
+
+    def close(self):
+        """Shut down worker pool."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def calibrate(self, target=0.25):
+        """Set cost to take about ``target`` seconds on this host."""
+        self.cost = calibrate_password_cost(target, self.algorithm)
+        return self.cost
+
+    def hash(self, password):
+        """Return encoded hash (computed in the calling thread)."""
+        return hash_password(password, self.algorithm, self.cost)
+
+    def needs_rehash(self, encoded):
+        """Return True if hash does not use this hasher's settings."""
+        return password_needs_rehash(encoded, self.algorithm, self.cost)
+
+    def hash_async(self, password, callback=None):
+        """
+        Hash password on the worker pool.
+
+        :returns: ``AsyncResult`` (call ``get()`` to wait for result)
+        """
+        return self.get_pool().apply_async(self.hash, (password,),
+                                           callback=callback)
+
+    def verify_async(self, password, encoded, callback=None):
+        """
+        Verify password on the worker pool.
+
+        :param callback: called with True/False when done
+        :returns: ``AsyncResult`` (call ``get()`` to wait for result)
+        """
+        return self.get_pool().apply_async(check_password,
+                                           (password, encoded),
+                                           callback=callback)
+
+    def verify(self, password, encoded, timeout=None):
+        """
+        Verify password on the worker pool and wait for the result.
+        """
+        return self.verify_async(password, encoded).get(timeout)
+
+
 ### secret key generation
 
 DEFAULT_KEY_SIZE = 72
@@ -402,6 +2163,108 @@ csets = {
     'p': string.punctuation,
 }
 
+# cache of character strings for charset parameters (see get_key_chars)
+_key_chars_cache = {}
+
+# cache of KeyAlphabet objects for character strings
+_key_alphabet_cache = {}
+
+
+def get_key_chars(charset=DEFAULT_KEY_CHAR_SET, key_string=None):
+    """
+    Return string of characters to generate keys from.
+
+    :param charset: string of character sets to use (a, l, u, n, p)
+    :param key_string: use provided string for key characters
+    :returns: string of characters
+
+    The strings for ``charset`` values are built once and cached.
+    """
+    if key_string and isinstance(key_string, six.string_types):
+        return key_string
+    chars = _key_chars_cache.get(charset)
+    if chars is None:
+        chars = ''
+        added = {}
+        for c in charset:
+            if not c in added:
+                added[c] = True
+                if c in ('a', 'l', 'u', 'n', 'p'):
+                    if c == 'a':
+                        added['u'] = True
+                        added['l'] = True
+                    chars += csets.get(c, '')
+        _key_chars_cache[charset] = chars
+    return chars
+
+
+class KeyAlphabet(object):
+    """
+    Map random bytes from ``os.urandom`` to characters of an alphabet.
+
+    Entropy is read in large blocks and converted with rejection
+    sampling (values that would bias the result are discarded), so
+    every character of the alphabet is equally likely.
+
+    * ASCII alphabets of up to 256 characters are converted with a
+      single ``bytes.translate`` call per block.
+    * Other alphabets (up to 65536 characters) use 1 or 2 random bytes
+      per character.
+    """
+    def __init__(self, chars):
+        """
+        :param chars: string of characters (must not be empty)
+        """
+        self.chars = chars
+        size = len(chars)
+        if not 0 < size <= 2**16:
+            raise ValueError('Alphabet must have 1 to 65536 characters.')
+        self.unit = 1 if size <= 256 else 2
+        span = 2 ** (8 * self.unit)
+        self.limit = span - span % size
+        self.accept_rate = float(self.limit) / span
+        self.table = None
+        if self.unit == 1 and all(ord(c) < 128 for c in chars):
+            self.table = bytes(bytearray([ord(chars[b % size])
+                                          for b in range(256)]))
+            self.delete = bytes(bytearray(range(self.limit, 256)))
+
+    @classmethod
+    def get(cls, chars):
+        """Return cached ``KeyAlphabet`` for ``chars``."""
+        alphabet = _key_alphabet_cache.get(chars)
+        if alphabet is None:
+            alphabet = _key_alphabet_cache[chars] = cls(chars)
+        return alphabet
+
+    def _convert(self, data):
+        """Convert random bytes to characters (dropping rejected values)."""
+        if self.table is not None:
+            return data.translate(self.table, self.delete).decode('ascii')
+        chars = self.chars
+        size = len(chars)
+        limit = self.limit
+        if self.unit == 1:
+            values = bytearray(data)
+        else:
+            values = struct.unpack(str('>%dH') % (len(data) // 2), data)
+        return ''.join([chars[v % size] for v in values if v < limit])
+
+    def generate(self, length):
+        """
+        Return random string of ``length`` characters.
+        """
+        parts = []
+        needed = length
+        while needed > 0:
+            # read a little more than needed to allow for rejections
+            nbytes = int(needed / self.accept_rate * 1.05 + 16) * self.unit
+            text = self._convert(os.urandom(nbytes))[:needed]
+            parts.append(text)
+            needed -= len(text)
+        return ''.join(parts)
+
+
 def gen_secret_key(keysize=DEFAULT_KEY_SIZE,
                    charset=DEFAULT_KEY_CHAR_SET,
                    key_string=None):
@@ -436,25 +2299,34 @@ def gen_secret_key(keysize=DEFAULT_KEY_SIZE,
         key = gen_secret_key(64, key_string=string.letters+string.digits)
 
     """
-    if key_string and isinstance(key_string, six.string_types):
-        chars = key_string
-    else:
-        chars = ''
-        added = {}
-        for c in charset:
-            if not c in added:
-                added[c] = True
-                if c in ('a', 'l', 'u', 'n', 'p'):
-                    if c == 'a':
-                        added['u'] = True
-                        added['l'] = True
-                    chars += csets.get(c, '')
+    keys = gen_secret_keys(1, keysize, charset, key_string)
+    if keys is None:
+        return None
+    return keys[0]
+
+
+def gen_secret_keys(count, keysize=DEFAULT_KEY_SIZE,
+                    charset=DEFAULT_KEY_CHAR_SET,
+                    key_string=None):
+    """
+    Returns a list of ``count`` random strings of length ``keysize``
+
+    :param count: number of keys to generate
+    :param keysize: length of keys to generate (default is 72)
+    :param charset: string of character sets to use (a, l, u, n, p)
+    :param key_string: use provided string for key characters
+    :returns: list of random strings or None if error
+
+    Parameters are the same as ``gen_secret_key``. All keys are
+    generated from one large block of random data, which is much
+    faster than generating them one at a time.
+    """
+    chars = get_key_chars(charset, key_string)
     try:
+        count = int(count)
         keysize = int(keysize)
-        assert keysize > 0
+        assert count >= 0 and keysize > 0 and chars
     except (TypeError, ValueError, AssertionError):
-        key = None
-    else:
-        prng = random.SystemRandom()
-        key = ''.join([prng.choice(chars) for i in range(keysize)])
-    return key
+        return None
+    text = KeyAlphabet.get(chars).generate(count * keysize)
+    return [text[i:i+keysize] for i in range(0, count * keysize, keysize)]
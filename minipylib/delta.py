@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.delta
+
+This module contains functions to compute and apply binary deltas
+between versions of a file (based on the rsync algorithm).
+
+1. The receiver, who has the old version of a file (the *basis*),
+   computes a ``Signature``: a weak rolling checksum and a strong
+   digest for each block of the file.
+
+2. The sender computes a delta of the new version against the
+   signature. Blocks found in the basis are sent as ``copy``
+   operations, everything else as literal ``data``.
+
+3. The receiver applies the delta to the basis with ``patch``.
+
+Example: ::
+
+    with open(old_path, 'rb') as basis:
+        sig = signature(basis)
+    with open(new_path, 'rb') as new, open(delta_path, 'wb') as out:
+        write_delta(delta(sig, new), out)
+    with open(old_path, 'rb') as basis, open(delta_path, 'rb') as d, \\
+         open(result_path, 'wb') as out:
+        patch(basis, read_delta(d), out)
+
+All functions work on file objects and stream their data, so files
+are never read into memory as a whole.
+
+:see: http://rsync.samba.org/tech_report/
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import struct
+
+from minipylib.crypto import get_hash_func
+
+
+DEFAULT_DELTA_BLOCK_SIZE = 2**11
+DEFAULT_DELTA_ALGORITHM = 'md5'
+MAX_LITERAL_SIZE = 2**16
+READ_SIZE = 2**16
+
+SIGNATURE_MAGIC = b'MPSG'
+DELTA_MAGIC = b'MPDL'
+OP_COPY = b'C'
+OP_DATA = b'D'
+OP_END = b'E'
+
+# struct formats
+_UINT32 = struct.Struct(str('>I'))
+_COPY = struct.Struct(str('>QI'))
+_SIG_HEADER = struct.Struct(str('>IBQ'))
+
+
+class DeltaError(Exception):
+    """
+    Raised when a signature or delta cannot be read.
+    """
+    pass
+
+
+def weak_checksum(data):
+    """
+    Return rsync weak checksum of ``data``.
+
+    :param data: bytes or bytearray
+    :returns: (checksum, a, b) -- ``a`` and ``b`` are the two 16-bit
+        halves used to roll the checksum
+    """
+    data = bytearray(data)
+    size = len(data)
+    a = sum(data) & 0xffff
+    b = sum([(size - i) * x for i, x in enumerate(data)]) & 0xffff
+    return a | (b << 16), a, b
+
+
+class Signature(object):
+    """
+    Block checksums for the basis file.
+
+    * ``weak`` and ``strong`` are lists of weak checksums and strong
+      digests for each block.
+    """
+    def __init__(self, block_size=DEFAULT_DELTA_BLOCK_SIZE,
+                 algorithm=DEFAULT_DELTA_ALGORITHM, weak=None, strong=None):
+        self.block_size = block_size
+        self.algorithm = algorithm
+        self.hashfunc = get_hash_func(algorithm)
+        self.weak = weak or []
+        self.strong = strong or []
+        self._index = None
+
+    def add_block(self, data):
+        """Add checksums for the next block of the basis file."""
+        self.weak.append(weak_checksum(data)[0])
+        self.strong.append(self.hashfunc(bytes(data)).digest())
+        self._index = None
+
+    def index(self):
+        """Return dict of weak checksum and list of block numbers."""
+        if self._index is None:
+            index = {}
+            for n, weak in enumerate(self.weak):
+                index.setdefault(weak, []).append(n)
+            self._index = index
+        return self._index
+
+    def dump(self, file_obj):
+        """Write signature to binary file object."""
+        name = self.algorithm.encode('ascii')
+        file_obj.write(SIGNATURE_MAGIC)
+        file_obj.write(_SIG_HEADER.pack(self.block_size, len(name),
+                                        len(self.weak)))
+        file_obj.write(name)
+        for weak, strong in zip(self.weak, self.strong):
+            file_obj.write(_UINT32.pack(weak))
+            file_obj.write(strong)
+
+    @classmethod
+    def load(cls, file_obj):
+        """Read signature written by ``dump``."""
+        if file_obj.read(len(SIGNATURE_MAGIC)) != SIGNATURE_MAGIC:
+            raise DeltaError('Not a signature file.')
+        try:
+            block_size, name_size, count = _SIG_HEADER.unpack(
+                file_obj.read(_SIG_HEADER.size))
+            algorithm = file_obj.read(name_size).decode('ascii')
+        except (struct.error, UnicodeError):
+            raise DeltaError('Bad signature header.')
+        sig = cls(block_size, algorithm)
+        digest_size = sig.hashfunc().digest_size
+        entry_size = _UINT32.size + digest_size
+        for n in range(count):
+            entry = file_obj.read(entry_size)
+            if len(entry) != entry_size:
+                raise DeltaError('Truncated signature file.')
+            sig.weak.append(_UINT32.unpack(entry[:_UINT32.size])[0])
+            sig.strong.append(entry[_UINT32.size:])
+        return sig
+
+
+def signature(file_obj, block_size=DEFAULT_DELTA_BLOCK_SIZE,
+              algorithm=DEFAULT_DELTA_ALGORITHM):
+    """
+    Compute signature of basis file.
+
+    :param file_obj: basis file (opened in binary mode)
+    :param block_size: size of blocks
+    :param algorithm: strong hash algorithm (default is 'md5')
+    :returns: ``Signature`` object
+    """
+    sig = Signature(block_size, algorithm)
+    while True:
+        data = file_obj.read(block_size)
+        if not data:
+            break
+        sig.add_block(data)
+    return sig
+
+
+class DeltaOps(object):
+    """
+    Iterator over the operations of a delta computed by ``delta``.
+
+    * ``block_size`` is the block size of the signature.
+    """
+    def __init__(self, block_size, ops):
+        self.block_size = block_size
+        self.ops = ops
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.ops)
+
+    next = __next__
+
+
+def delta(sig, file_obj, read_size=READ_SIZE):
+    """
+    Compute delta of a file against a signature.
+
+    :param sig: ``Signature`` of basis file
+    :param file_obj: new version of the file (opened in binary mode)
+    :param read_size: read size for file
+    :returns: ``DeltaOps`` iterator of operations --
+        ``('copy', first block, count)`` or ``('data', bytes)`` (with
+        the signature's ``block_size`` attribute)
+    """
+    return DeltaOps(sig.block_size, _iter_delta(sig, file_obj, read_size))
+
+
+def _iter_delta(sig, file_obj, read_size):
+    """Generate delta operations (see ``delta``)."""
+    size = sig.block_size
+    index = sig.index()
+    strong = sig.strong
+    hashfunc = sig.hashfunc
+    buf = bytearray()
+    pos = 0
+    eof = False
+    literal = bytearray()
+    copy = None
+    weak = None
+    a = b = 0
+
+    while True:
+        # keep a full window in the buffer (unless at end of file)
+        if not eof and len(buf) - pos < size + 1:
+            del buf[:pos]
+            pos = 0
+            data = file_obj.read(max(read_size, size + 1))
+            if data:
+                buf.extend(data)
+            else:
+                eof = True
+            continue
+        n = min(size, len(buf) - pos)
+        if n == 0:
+            break
+        if weak is None:
+            weak, a, b = weak_checksum(buf[pos:pos+n])
+
+        match = None
+        candidates = index.get(weak)
+        if candidates:
+            digest = hashfunc(bytes(buf[pos:pos+n])).digest()
+            for block in candidates:
+                if strong[block] == digest and \
+                   (n == size or block == len(strong) - 1):
+                    match = block
+                    break
+
+        if match is not None:
+            if literal:
+                yield ('data', bytes(literal))
+                literal = bytearray()
+            if copy is not None and copy[0] + copy[1] == match:
+                copy[1] += 1
+            else:
+                if copy is not None:
+                    yield ('copy', copy[0], copy[1])
+                copy = [match, 1]
+            pos += n
+            weak = None
+            continue
+
+        # no match: emit first byte of window as literal and roll
+        if copy is not None:
+            yield ('copy', copy[0], copy[1])
+            copy = None
+        x_out = buf[pos]
+        literal.append(x_out)
+        pos += 1
+        if pos + n - 1 < len(buf):
+            x_in = buf[pos+n-1]
+            a = (a - x_out + x_in) & 0xffff
+            b = (b - n * x_out + a) & 0xffff
+        else:
+            # end of file: window shrinks by one byte
+            a = (a - x_out) & 0xffff
+            b = (b - n * x_out) & 0xffff
+        weak = a | (b << 16)
+        if len(literal) >= MAX_LITERAL_SIZE:
+            yield ('data', bytes(literal))
+            literal = bytearray()
+
+    if literal:
+        yield ('data', bytes(literal))
+    if copy is not None:
+        yield ('copy', copy[0], copy[1])
+
+
+def patch(basis, ops, out, block_size=DEFAULT_DELTA_BLOCK_SIZE,
+          read_size=READ_SIZE):
+    """
+    Apply delta to basis file.
+
+    :param basis: basis file (opened in binary mode, must be seekable)
+    :param ops: delta operations (from ``delta`` or ``read_delta``)
+    :param out: file object to write new version to
+    :param block_size: block size of the signature used for the delta
+    :param read_size: read size when copying from basis
+    :returns: number of bytes written
+
+    If ``ops`` is returned by ``delta`` or ``read_delta``, its
+    ``block_size`` is used.
+    """
+    block_size = getattr(ops, 'block_size', block_size)
+    written = 0
+    for op in ops:
+        if op[0] == 'data':
+            out.write(op[1])
+            written += len(op[1])
+            continue
+        basis.seek(op[1] * block_size)
+        remaining = op[2] * block_size
+        while remaining > 0:
+            data = basis.read(min(read_size, remaining))
+            if not data:
+                break
+            out.write(data)
+            written += len(data)
+            remaining -= len(data)
+    return written
+
+
+def write_delta(ops, out, block_size=None):
+    """
+    Write delta operations in compact binary form.
+
+    :param ops: delta operations (from ``delta``)
+    :param out: binary file object to write to
+    :param block_size: block size of the signature used for the delta
+        (default is ``ops.block_size``)
+    :returns: number of operations written
+    """
+    if block_size is None:
+        block_size = getattr(ops, 'block_size', DEFAULT_DELTA_BLOCK_SIZE)
+    out.write(DELTA_MAGIC + _UINT32.pack(block_size))
+    count = 0
+    for op in ops:
+        if op[0] == 'data':
+            out.write(OP_DATA + _UINT32.pack(len(op[1])))
+            out.write(op[1])
+        else:
+            out.write(OP_COPY + _COPY.pack(op[1], op[2]))
+        count += 1
+    out.write(OP_END)
+    return count
+
+
+class DeltaReader(object):
+    """
+    Iterator over the operations of a delta written by ``write_delta``.
+
+    * ``block_size`` is the block size stored in the delta.
+    """
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        header = file_obj.read(len(DELTA_MAGIC) + _UINT32.size)
+        if header[:len(DELTA_MAGIC)] != DELTA_MAGIC or \
+           len(header) != len(DELTA_MAGIC) + _UINT32.size:
+            raise DeltaError('Not a delta file.')
+        self.block_size = _UINT32.unpack(header[len(DELTA_MAGIC):])[0]
+
+    def __iter__(self):
+        read = self.file_obj.read
+        while True:
+            code = read(1)
+            if code == OP_END:
+                return
+            if code == OP_COPY:
+                data = read(_COPY.size)
+                if len(data) != _COPY.size:
+                    break
+                start, count = _COPY.unpack(data)
+                yield ('copy', start, count)
+            elif code == OP_DATA:
+                data = read(_UINT32.size)
+                if len(data) != _UINT32.size:
+                    break
+                size = _UINT32.unpack(data)[0]
+                data = read(size)
+                if len(data) != size:
+                    break
+                yield ('data', data)
+            else:
+                break
+        raise DeltaError('Truncated or corrupt delta.')
+
+
+def read_delta(file_obj):
+    """
+    Return iterator over the operations of a delta file.
+
+    :param file_obj: binary file object written by ``write_delta``
+    :returns: ``DeltaReader`` (iterable, with ``block_size`` attribute)
+    """
+    return DeltaReader(file_obj)
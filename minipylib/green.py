@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.green
+
+This module contains cooperative versions of the file helpers in
+``minipylib.utils`` for gevent and eventlet applications (the
+counterpart of ``minipylib.aio`` for asyncio).
+
+Blocking file system calls are run on a bounded pool of native
+threads, so only the calling greenlet waits and the hub keeps
+running: ::
+
+    from minipylib import green
+
+    io = green.get_green_io('gevent')
+
+    def handler(path):
+        data = io.get_file_contents(path)
+        io.write_file(path + '.bak', data, atomic=True)
+
+        with io.open_file(path, mode='rb') as f:
+            for chunk in f.iter_chunks(2**16):
+                process(chunk)
+
+Backends are only available if the corresponding library is
+installed (see ``get_green_backends``).
+
+Killing a greenlet that waits on a call releases it at once; a call
+already running on a native thread finishes in the background and its
+result is dropped. Streaming reads and writes stop at the next chunk.
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import threading
+
+from minipylib import utils
+
+
+DEFAULT_GREEN_WORKERS = 4
+
+
+class GreenIOError(Exception):
+    """Raised for unknown or unavailable green backends."""
+    pass
+
+
+class GreenFileIO(object):
+    """
+    Template for green file helpers.
+    * subclasses define ``run_io`` to run a blocking call on a native
+      thread pool.
+    """
+
+    name = None
+
+    def __init__(self, workers=DEFAULT_GREEN_WORKERS):
+        """
+        :param workers: maximum number of concurrent blocking calls
+        """
+        self.workers = workers
+
+    def run_io(self, func, *args, **kwargs):
+        """
+        Run blocking ``func(*args, **kwargs)`` on a native thread and
+        return its result. Subclass should override.
+        """
+        raise GreenIOError(
+            'GreenFileIO subclass should override "run_io" method.')
+
+    def close(self):
+        """Release the thread pool (if the backend owns one)."""
+        pass
+
+    def open_file(self, path, mode=None, encoding=None, **kwargs):
+        """
+        Green version of ``utils.open_file``.
+
+        :returns: ``GreenFile``
+        """
+        file_obj = self.run_io(utils.open_file, path, mode=mode,
+                               encoding=encoding, **kwargs)
+        return GreenFile(self, file_obj)
+
+    def get_file_contents(self, path, mode=None, encoding=None, **kwargs):
+        """
+        Green version of ``utils.get_file_contents``.
+        """
+        return self.run_io(utils.get_file_contents, path, mode=mode,
+                           encoding=encoding, **kwargs)
+
+    def write_file(self, path, data, mode=None, encoding=None, **kwargs):
+        """
+        Green version of ``utils.write_file`` (accepts ``atomic`` and
+        ``durability``).
+        """
+        return self.run_io(utils.write_file, path, data, mode=mode,
+                           encoding=encoding, **kwargs)
+
+    def delete_file(self, path, secure=False):
+        """
+        Green version of ``utils.delete_file``.
+        """
+        return self.run_io(utils.delete_file, path, secure=secure)
+
+    def iter_file_contents(self, path, chunk_size=utils.default_chunk_size,
+                           mode=None, encoding=None, **kwargs):
+        """
+        Generator of chunks of file content (streaming read).
+
+        Yields nothing if the file cannot be read.
+        """
+        mode, encoding = utils._file_mode('r', mode, encoding)
+        try:
+            f = self.open_file(path, mode=mode, encoding=encoding, **kwargs)
+        except (IOError, OSError):
+            return
+        with f:
+            for data in f.iter_chunks(chunk_size):
+                yield data
+
+    def write_stream(self, path, chunks, mode=None, encoding=None, **kwargs):
+        """
+        Write chunks from an iterable to file.
+
+        :param path: path of file to write to.
+        :param chunks: iterable of data
+        :returns: number of chunks written
+        """
+        mode, encoding = utils._file_mode('w', mode, encoding)
+        count = 0
+        with self.open_file(path, mode=mode, encoding=encoding,
+                            **kwargs) as f:
+            for data in chunks:
+                f.write(data)
+                count += 1
+        return count
+
+
+class GreenFile(object):
+    """
+    File object whose methods only block the calling greenlet
+    (returned by ``GreenFileIO.open_file``).
+
+    Supports ``with`` and iteration (over lines).
+    """
+    def __init__(self, io, file_obj):
+        self.io = io
+        self.file_obj = file_obj
+
+    def read(self, size=-1):
+        return self.io.run_io(self.file_obj.read, size)
+
+    def readline(self):
+        return self.io.run_io(self.file_obj.readline)
+
+    def write(self, data):
+        return self.io.run_io(self.file_obj.write, data)
+
+    def flush(self):
+        return self.io.run_io(self.file_obj.flush)
+
+    def close(self):
+        return self.io.run_io(self.file_obj.close)
+
+    def iter_chunks(self, chunk_size=utils.default_chunk_size):
+        """Generator of chunks of file content."""
+        while True:
+            data = self.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    next = __next__
+
+
+_backends = {}
+_green_io = {}
+_green_io_lock = threading.Lock()
+
+
+#######################################################################
+# gevent
+# info:
+# * http://www.gevent.org/
+#######################################################################
+
+try:
+    from gevent.threadpool import ThreadPool as gevent_threadpool
+
+    class GeventFileIO(GreenFileIO):
+        """
+        Run blocking calls on a dedicated ``gevent.threadpool.ThreadPool``
+        with ``workers`` threads.
+        """
+        name = 'gevent'
+
+        def __init__(self, workers=DEFAULT_GREEN_WORKERS):
+            super(GeventFileIO, self).__init__(workers)
+            self.pool = gevent_threadpool(workers)
+
+        def run_io(self, func, *args, **kwargs):
+            return self.pool.apply(func, args, kwargs)
+
+        def close(self):
+            self.pool.kill()
+
+    _backends[GeventFileIO.name] = GeventFileIO
+
+except ImportError:
+    pass
+
+
+#######################################################################
+# eventlet
+# info:
+# * http://eventlet.net/
+#######################################################################
+
+try:
+    from eventlet import tpool as eventlet_tpool
+    from eventlet.semaphore import Semaphore as eventlet_semaphore
+
+    class EventletFileIO(GreenFileIO):
+        """
+        Run blocking calls on eventlet's ``tpool``.
+
+        The tpool is shared by the whole process (its size is set by
+        ``EVENTLET_THREADPOOL_SIZE``); at most ``workers`` calls from
+        this object run at a time.
+        """
+        name = 'eventlet'
+
+        def __init__(self, workers=DEFAULT_GREEN_WORKERS):
+            super(EventletFileIO, self).__init__(workers)
+            self.semaphore = eventlet_semaphore(workers)
+
+        def run_io(self, func, *args, **kwargs):
+            with self.semaphore:
+                return eventlet_tpool.execute(func, *args, **kwargs)
+
+    _backends[EventletFileIO.name] = EventletFileIO
+
+except ImportError:
+    pass
+
+
+def get_green_backends():
+    """Return names of available green backends."""
+    return sorted(_backends)
+
+
+def get_green_io(name, workers=DEFAULT_GREEN_WORKERS):
+    """
+    Return shared ``GreenFileIO`` instance for backend ``name``
+    (created on first use).
+
+    One instance (and thread pool) is kept for each (name, workers)
+    combination, so calling this per request does not start new
+    threads.
+
+    :param name: "gevent" or "eventlet"
+    :param workers: maximum number of concurrent blocking calls
+    :raises GreenIOError: if the backend is unknown or not installed
+    """
+    key = (name, workers)
+    with _green_io_lock:
+        io = _green_io.get(key)
+        if io is None:
+            try:
+                cls = _backends[name]
+            except KeyError:
+                raise GreenIOError('Green backend not available: %s' % name)
+            io = _green_io[key] = cls(workers)
+    return io
+
+
+def close_green_io():
+    """Close shared ``GreenFileIO`` instances and their thread pools."""
+    with _green_io_lock:
+        ios = list(_green_io.values())
+        _green_io.clear()
+    for io in ios:
+        io.close()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.profiler
+
+This module contains a startup profiler that records a nested timing
+tree of imports and named phases (e.g. the phases of
+``minipylib.server.make_server``).
+
+The profiler is enabled by setting the ``MINIPYLIB_PROFILE_STARTUP``
+environment variable (or the ``profile_startup`` server config key) to
+an output path prefix, e.g.: ::
+
+    $ MINIPYLIB_PROFILE_STARTUP=/tmp/startup python serve.py
+
+When ``make_server`` returns, the timing tree is written to
+``/tmp/startup.json`` and in folded stack format (for flame graph
+tools) to ``/tmp/startup.folded``.
+
+The environment variable starts the profiler as soon as
+``minipylib.server`` is imported. The config key is only seen by
+``make_server``, after the server modules have been imported, so on
+its own it only times the ``make_server`` phases; to include the
+imports, start the profiler before importing ``minipylib.server``: ::
+
+    prefix = get_profile_prefix(SERVER_CONFIG)
+    if prefix:
+        start_profiler(prefix)
+    from minipylib.server import make_server
+
+The profiler can also be used directly: ::
+
+    profiler = start_profiler()
+    with phase('load settings'):
+        import myapp.settings
+    stop_profiler()
+    print(profiler.folded())
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from six.moves import builtins
+
+
+PROFILE_ENV_VAR = 'MINIPYLIB_PROFILE_STARTUP'
+PROFILE_CONFIG_KEY = 'profile_startup'
+DEFAULT_PROFILE_PREFIX = 'startup-profile'
+
+
+class TimingNode(object):
+    """
+    Node in a timing tree.
+
+    * ``seconds`` is the total time of the node (including children).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.seconds = None
+        self.children = []
+
+    def finish(self):
+        self.seconds = time.time() - self.start
+
+    @property
+    def self_seconds(self):
+        """Time spent in node itself (excluding children)."""
+        total = self.seconds or 0.0
+        return max(0.0, total - sum([c.seconds or 0.0 for c in self.children]))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'seconds': self.seconds,
+            'children': [c.to_dict() for c in self.children],
+        }
+
+
+class StartupProfiler(object):
+    """
+    Record nested timings of imports and phases.
+
+    Only imports and phases in the thread that created the profiler
+    are recorded. Modules that are already imported are not recorded.
+    """
+    def __init__(self, name='startup'):
+        self.root = TimingNode(name)
+        self.stack = [self.root]
+        self.thread = threading.current_thread()
+        self.installed = False
+        self._import = None
+
+    def push(self, name):
+        node = TimingNode(name)
+        self.stack[-1].children.append(node)
+        self.stack.append(node)
+        return node
+
+    def pop(self, node):
+        node.finish()
+        while len(self.stack) > 1:
+            if self.stack.pop() is node:
+                break
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager to time a named phase."""
+        if threading.current_thread() is not self.thread:
+            yield
+            return
+        node = self.push(name)
+        try:
+            yield node
+        finally:
+            self.pop(node)
+
+    def _profiled_import(self, name, *args, **kwargs):
+        if name in sys.modules or \
+           threading.current_thread() is not self.thread:
+            return self._import(name, *args, **kwargs)
+        node = self.push('import %s' % name)
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            self.pop(node)
+
+    def install(self):
+        """Start recording imports."""
+        if not self.installed:
+            self._import = builtins.__import__
+            builtins.__import__ = self._profiled_import
+            self.installed = True
+
+    def uninstall(self):
+        """Stop recording imports and finish timing tree."""
+        if self.installed:
+            if builtins.__import__ == self._profiled_import:
+                builtins.__import__ = self._import
+            self.installed = False
+        self.root.finish()
+
+    def to_dict(self):
+        return self.root.to_dict()
+
+    def to_json(self, **kwargs):
+        """Return timing tree as JSON."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def folded(self):
+        """
+        Return timing tree in folded stack format: ::
+
+            startup;make_server;import gevent 1520
+
+        (one line per node, with self time in microseconds).
+        """
+        lines = []
+        def walk(node, path):
+            path = path + [node.name.replace(';', ':').replace(' ', '_')]
+            usecs = int(node.self_seconds * 1e6)
+            if usecs > 0:
+                lines.append('%s %d' % (';'.join(path), usecs))
+            for child in node.children:
+                walk(child, path)
+        walk(self.root, [])
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, prefix):
+        """
+        Write timing tree to ``<prefix>.json`` and ``<prefix>.folded``.
+
+        :returns: tuple of paths written
+        """
+        paths = ('%s.json' % prefix, '%s.folded' % prefix)
+        with open(paths[0], 'w') as f:
+            f.write(self.to_json(indent=2))
+        with open(paths[1], 'w') as f:
+            f.write(self.folded())
+        return paths
+
+
+_profiler = None
+_prefix = None
+
+def get_profiler():
+    """Return active profiler (or None)."""
+    return _profiler
+
+
+def start_profiler(prefix=None):
+    """
+    Start profiler (if not already started).
+
+    :param prefix: output path prefix for ``stop_profiler``
+    :returns: active ``StartupProfiler``
+    """
+    global _profiler, _prefix
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.install()
+    if prefix:
+        _prefix = prefix
+    return _profiler
+
+
+def stop_profiler(dump=True):
+    """
+    Stop active profiler and write its output.
+
+    :param dump: if True, write output to the prefix given to
+        ``start_profiler``
+    :returns: stopped profiler (or None if profiler is not active)
+    """
+    global _profiler, _prefix
+    profiler, prefix = _profiler, _prefix
+    _profiler = _prefix = None
+    if profiler is not None:
+        profiler.uninstall()
+        if dump and prefix:
+            profiler.dump(prefix)
+    return profiler
+
+
+def get_profile_prefix(config=None):
+    """
+    Return output prefix if profiling is enabled (else None).
+
+    :param config: dict with ``profile_startup`` key (True or prefix)
+    """
+    value = os.environ.get(PROFILE_ENV_VAR)
+    if not value and config:
+        value = config.get(PROFILE_CONFIG_KEY)
+    if not value:
+        return None
+    if value is True or value in ('1', 'true', 'yes'):
+        return DEFAULT_PROFILE_PREFIX
+    return value
+
+
+def start_from_env():
+    """Start profiler if the environment variable is set."""
+    prefix = get_profile_prefix()
+    if prefix:
+        return start_profiler(prefix)
+    return None
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a named phase with the active profiler (no-op if inactive).
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield None
+    else:
+        with profiler.phase(name) as node:
+            yield node
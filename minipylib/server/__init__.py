@@ -37,23 +37,34 @@ Supported servers:
 
 from __future__ import (absolute_import, unicode_literals)
 
-from minipylib.server.settings import DEFAULT_SERVER_CONFIG
-from minipylib.server.utils import get_uid_gid, change_uid_gid
-from minipylib.server.apps import test_app, get_django_app
-from minipylib.server.backends.base import get_server_instance
-
-# load backend servers (to populate the Server class registry)
-from minipylib.server.backends import (
-    wsgiserver,
-    bjoern_server,
-    cherrypy_server,
-    eventlet_server,
-    fapws_server,
-    gevent_server,
-    simple_server,
-    uwsgi_server,
-    waitress_server,
-)
+from minipylib import profiler
+
+# profile startup if MINIPYLIB_PROFILE_STARTUP is set
+profiler.start_from_env()
+
+try:
+    from minipylib.server.settings import DEFAULT_SERVER_CONFIG
+    from minipylib.server.utils import get_uid_gid, change_uid_gid
+    from minipylib.server.apps import test_app, get_django_app
+    from minipylib.server.backends.base import get_server_instance
+
+    # load backend servers (to populate the Server class registry)
+    with profiler.phase('load backends'):
+        from minipylib.server.backends import (
+            wsgiserver,
+            bjoern_server,
+            cherrypy_server,
+            eventlet_server,
+            fapws_server,
+            gevent_server,
+            simple_server,
+            uwsgi_server,
+            waitress_server,
+        )
+except Exception:
+    # do not leave the import hook installed if loading fails
+    profiler.stop_profiler()
+    raise
 
 from minipylib.server.exceptions import (
     ServerNotFoundError,
@@ -80,18 +91,44 @@ def make_server(server_name=None, **params):
         if __name__ == '__main__':
             server.run()
 
+
+    If the ``profile_startup`` param (or the ``MINIPYLIB_PROFILE_STARTUP``
+    environment variable) is set to a path prefix, a timing tree of
+    startup imports and phases is written to ``<prefix>.json`` and
+    ``<prefix>.folded`` when the server is created (see
+    ``minipylib.profiler``).
+
+    The environment variable starts the profiler when this module is
+    imported, so the tree includes the imports of ``minipylib.server``
+    and its backends. The ``profile_startup`` param only takes effect
+    here, after those imports, so it times the ``make_server`` phases
+    (and anything imported during them) unless the profiler was already
+    started before importing ``minipylib.server`` (as
+    ``examples/wsgi/serve.py`` does).
     """
-    if not server_name:
-        server_name = params.get('server') or \
-                      DEFAULT_SERVER_CONFIG.get('server')
-    app = params.get('app')
-    if not app:
-        if params.get('app_type') == 'django':
-            app = get_django_app(server_name)
-        else:
-            app = test_app
-        params['app'] = app
-    return get_server_instance(server_name, params)
+    prefix = profiler.get_profile_prefix(params)
+    if prefix:
+        profiler.start_profiler(prefix)
+    try:
+        with profiler.phase('make_server'):
+            if not server_name:
+                server_name = params.get('server') or \
+                              DEFAULT_SERVER_CONFIG.get('server')
+            app = params.get('app')
+            if not app:
+                if params.get('app_type') == 'django':
+                    with profiler.phase('get_django_app'):
+                        app = get_django_app(server_name)
+                else:
+                    app = test_app
+                params['app'] = app
+            with profiler.phase('get_server_instance'):
+                server = get_server_instance(server_name, params)
+    finally:
+        # always remove the import hook (also if server creation fails)
+        if prefix:
+            profiler.stop_profiler()
+    return server
 
 
 def get_web_server(**params):
@@ -34,4 +34,8 @@ DEFAULT_SERVER_CONFIG = {
 
     # number of threads for servers that use them (like cherrypy):
     'threads': 10,
+
+    # set to a path prefix (or True) to write a startup timing profile
+    #   (see minipylib.profiler)
+    'profile_startup': None,
 }
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.store
+
+This module contains a content-addressed file store.
+
+Blobs are stored under the hex digest of their content in a sharded
+directory layout, e.g. for the sha256 digest ``2cf24dba5fb0a3...``: ::
+
+    root/2c/f2/2cf24dba5fb0a3...
+
+Input is hashed while it is copied to a temporary file in the store,
+which is then renamed into place. Writers never see partial blobs and
+a blob that already exists is not written again.
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import six
+import os
+import threading
+
+from minipylib.crypto import get_hash_func, file_digest
+from minipylib.utils import open_file, _sync_dir, _create_temp_file
+
+
+DEFAULT_STORE_ALGORITHM = 'sha256'
+DEFAULT_STORE_CHUNK_SIZE = 2**16
+TMP_DIR = 'tmp'
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+def _makedirs(path):
+    """Create directory (ignore error if another writer created it)."""
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+class ContentStore(object):
+    """
+    Content-addressed store for files.
+
+    Usage::
+
+        store = ContentStore('/var/lib/assets')
+        digest = store.put_file('/tmp/upload.png')
+        with store.open(digest) as file_obj:
+            data = file_obj.read()
+
+    The store keeps an in-memory index of digests known to exist so
+    repeated existence checks do not touch the file system. The store
+    is safe to use from several threads (and several processes, since
+    blobs are moved into place with an atomic rename).
+    """
+    def __init__(self, root, algorithm=DEFAULT_STORE_ALGORITHM, depth=2,
+                 width=2, chunk_size=DEFAULT_STORE_CHUNK_SIZE, fsync=False):
+        """
+        :param root: top directory of store
+        :param algorithm: hash algorithm name (default is 'sha256')
+        :param depth: number of directory levels
+        :param width: number of hex characters per directory level
+        :param chunk_size: read size when copying input
+        :param fsync: if True, flush blobs to disk before moving them
+            into place (and the directory after the rename)
+        """
+        self.root = root
+        self.algorithm = algorithm
+        self.hashfunc = get_hash_func(algorithm)
+        self.digest_size = self.hashfunc().digest_size * 2
+        self.depth = depth
+        self.width = width
+        self.chunk_size = chunk_size
+        self.fsync = fsync
+        self.tmp_dir = os.path.join(root, TMP_DIR)
+        _makedirs(self.tmp_dir)
+        self.index = set()
+        self.lock = threading.Lock()
+
+    def is_digest(self, digest):
+        """Return True if ``digest`` is a lowercase hex digest."""
+        return isinstance(digest, six.string_types) and \
+            len(digest) == self.digest_size and \
+            HEX_DIGITS.issuperset(digest)
+
+    def path_for(self, digest):
+        """
+        Return file system path of blob for ``digest``.
+
+        :raises: ``ValueError`` if ``digest`` is not a lowercase hex
+            digest of the store's algorithm
+        """
+        if not self.is_digest(digest):
+            raise ValueError('Bad digest: %r' % (digest,))
+        parts = [digest[i*self.width:(i+1)*self.width]
+                 for i in range(self.depth)]
+        return os.path.join(self.root, *(parts + [digest]))
+
+    def exists(self, digest):
+        """Return True if blob for ``digest`` is in the store."""
+        if digest in self.index:
+            return True
+        if os.path.isfile(self.path_for(digest)):
+            with self.lock:
+                self.index.add(digest)
+            return True
+        return False
+
+    __contains__ = exists
+
+    def _iter_chunks(self, source):
+        """Yield chunks of bytes from data, file object or iterable."""
+        if isinstance(source, six.binary_type):
+            yield source
+        elif hasattr(source, 'read'):
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            for chunk in source:
+                yield chunk
+
+    def put(self, source):
+        """
+        Add content to the store.
+
+        :param source: bytes, file object (opened in binary mode) or
+            iterable of bytes
+        :returns: hex digest of content
+        """
+        hasher = self.hashfunc()
+        # blobs get mode 0666 less the umask (mkstemp would give 0600)
+        fd, tmp_path = _create_temp_file(os.path.join(self.tmp_dir, 'put'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in self._iter_chunks(source):
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                if self.fsync:
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+            digest = hasher.hexdigest()
+            path = self.path_for(digest)
+            # check the file system, not the index: the blob may have
+            # been deleted by another store or process
+            if not os.path.isfile(path):
+                dirname = os.path.dirname(path)
+                _makedirs(dirname)
+                os.rename(tmp_path, path)
+                if self.fsync:
+                    _sync_dir(dirname)
+            with self.lock:
+                self.index.add(digest)
+        finally:
+            # temp file is left if the blob exists or the copy failed
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return digest
+
+    def put_file(self, path):
+        """
+        Add file to the store.
+
+        :param path: file system path of file to add
+        :returns: hex digest of content
+        """
+        with open_file(path, mode='rb') as file_obj:
+            return self.put(file_obj)
+
+    def open(self, digest):
+        """Return blob opened for reading in binary mode."""
+        return open_file(self.path_for(digest), mode='rb')
+
+    def get(self, digest):
+        """Return content of blob or None if not in store."""
+        try:
+            with self.open(digest) as file_obj:
+                return file_obj.read()
+        except (IOError, OSError):
+            return None
+
+    def delete(self, digest):
+        """Remove blob from store."""
+        with self.lock:
+            self.index.discard(digest)
+        try:
+            os.unlink(self.path_for(digest))
+        except OSError:
+            return False
+        return True
+
+    def verify(self, digest):
+        """Return True if blob content matches its digest."""
+        path = self.path_for(digest)
+        if not os.path.isfile(path):
+            return False
+        return file_digest(path, hashfunc=self.hashfunc) == digest
+
+    def __iter__(self):
+        """Iterate over digests of all blobs in the store."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root and TMP_DIR in dirnames:
+                dirnames.remove(TMP_DIR)
+            for name in filenames:
+                if self.is_digest(name) and \
+                   os.path.join(dirpath, name) == self.path_for(name):
+                    yield name
+
+    def load_index(self):
+        """Add digests of all blobs in the store to the index."""
+        digests = set(self)
+        with self.lock:
+            self.index.update(digests)
+        return len(digests)
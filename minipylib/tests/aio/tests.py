@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+tests.aio.tests
+
+Tests for minipylib.aio (Python 3 only)
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import six
+import os
+import shutil
+import tempfile
+import unittest
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+def collect(loop, agen):
+    """Return list of items from async generator."""
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(agen.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+
+@unittest.skipIf(six.PY2, 'asyncio requires Python 3')
+class AioTests(SimpleTestCase):
+
+    def setUp(self):
+        import asyncio
+        self.tmp_dir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_file_helpers(self):
+        """
+        Ensure awaitable file helpers are working properly.
+        """
+        from minipylib import aio
+        self._msg('test', 'aio file helpers', first=True)
+        run = self.loop.run_until_complete
+        path = os.path.join(self.tmp_dir, 'testfile.txt')
+        text = 'écriture 寫作\n' * 100
+
+        self.assertTrue(run(aio.write_file(path, text, atomic=True)))
+        self.assertEqual(run(aio.get_file_contents(path)), text)
+        self.assertEqual(run(aio.get_file_contents(path + '.missing')), None)
+
+        chunks = collect(self.loop, aio.iter_file_contents(path, chunk_size=50))
+        self.assertEqual(''.join(chunks), text)
+        self.assertEqual(len(chunks), -(-len(text) // 50))
+        self.assertEqual(collect(self.loop,
+                                 aio.iter_file_contents(path + '.missing')), [])
+
+        f = run(aio.open_file(path, mode='rb'))
+        lines = collect(self.loop, f)
+        run(f.close())
+        self.assertEqual(lines, text.encode('utf-8').splitlines(True))
+
+        out = os.path.join(self.tmp_dir, 'out.bin')
+        count = run(aio.write_stream(out, [b'a', b'b', b'c'], mode='b'))
+        self.assertEqual(count, 3)
+        self.assertEqual(run(aio.get_file_contents(out, mode='b')), b'abc')
+        self.assertTrue(run(aio.delete_file(out)))
+        self.assertFalse(os.path.exists(out))
+
+
+    def test_cancel(self):
+        """
+        Ensure awaitable calls can be cancelled.
+        """
+        import time
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from minipylib import aio
+        self._msg('test', 'aio cancel', first=True)
+
+        previous = aio.set_executor(ThreadPoolExecutor(1))
+        try:
+            calls = []
+            def blocking(n):
+                time.sleep(0.05)
+                calls.append(n)
+            first = self.loop.create_task(aio.run_io(blocking, 1))
+            second = self.loop.create_task(aio.run_io(blocking, 2))
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+            second.cancel()
+            self.loop.run_until_complete(first)
+            self.assertRaises(asyncio.CancelledError,
+                              self.loop.run_until_complete, second)
+            aio.get_executor().shutdown(wait=True)
+            self.assertEqual(calls, [1])
+        finally:
+            aio.set_executor(previous)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+tests.config.tests
+
+Tests for minipylib.config
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import os
+import time
+import logging
+import shutil
+import tempfile
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class ConfigSourceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        return path
+
+    def test_sources(self):
+        """
+        Ensure config sources load files properly.
+        """
+        from minipylib.config import (get_source, EnvSource, ConfigSource,
+                                      ConfigError)
+        self._msg('test', 'config sources', first=True)
+
+        path = self.write('settings.py', '# -*- coding: utf-8 -*-\n'
+                          'NAME = "écriture"\nTHREADS = 2 * 5\nlocal = 1\n')
+        self.assertEqual(get_source(path).load(),
+                         {'NAME': 'écriture', 'THREADS': 10})
+        path = self.write('site.json', '{"threads": 4, "debug": true}')
+        self.assertEqual(get_source(path, 'site').load(),
+                         {'threads': 4, 'debug': True})
+        path = self.write('site.ini', '[server]\nthreads = 4\n'
+                          '[app]\nDebug = yes\n')
+        self.assertEqual(get_source(path).load(),
+                         {'threads': '4', 'Debug': 'yes'})
+        path = self.write('app.env', '# comment\nAPP_A=1\n'
+                          'export APP_B="two words"\nOTHER=3\n')
+        source = get_source(path)
+        source.prefix = 'APP_'
+        self.assertEqual(source.load(), {'A': '1', 'B': 'two words'})
+
+        os.environ['MINIPYLIB_TEST_X'] = 'x'
+        try:
+            source = EnvSource(prefix='MINIPYLIB_TEST_')
+            self.assertEqual(source.load(), {'X': 'x'})
+            self.assertFalse(source.changed())
+            os.environ['MINIPYLIB_TEST_X'] = 'y'
+            self.assertTrue(source.changed())
+        finally:
+            del os.environ['MINIPYLIB_TEST_X']
+
+        self.assertRaises(ValueError, get_source, 'config.xml')
+        self.assertRaises(ConfigError,
+                          ConfigSource(self.write('base.txt', 'x')).load)
+        self.assertEqual(get_source(os.path.join(self.tmp_dir, 'no.json')).load(),
+                         {})
+
+
+    def test_config_watcher(self):
+        """
+        Ensure ConfigWatcher reloads changed sources.
+        """
+        from minipylib.utils import Config
+        from minipylib.config import ConfigWatcher, JSONSource
+        self._msg('test', 'ConfigWatcher', first=True)
+
+        defaults = self.write('defaults.py', 'THREADS = 10\nDEBUG = False\n')
+        site = self.write('site.json', '{"THREADS": 4}')
+        config = Config()
+        watcher = ConfigWatcher(config, [defaults, JSONSource(site, 'site')])
+        watcher.load()
+        self.assertEqual((config.get('THREADS'), config.get('DEBUG')),
+                         (4, False))
+        self.assertEqual(watcher.poll(), {})
+
+        def broken(config, namespace, keys):
+            raise RuntimeError('subscriber error')
+        config.subscribe(broken)
+        events = []
+        config.subscribe(lambda c, namespace, keys:
+                         events.append((namespace, sorted(keys))))
+        errors = []
+        handler = logging.Handler()
+        handler.emit = errors.append
+        logger = logging.getLogger('minipylib.utils')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.write('site.json', '{"THREADS": 8, "DEBUG": true}')
+        self.assertEqual(watcher.poll(), {'site': set(['THREADS', 'DEBUG'])})
+        self.assertEqual((config.get('THREADS'), config.get('DEBUG')),
+                         (8, True))
+        self.assertEqual(events, [('site', ['DEBUG', 'THREADS'])])
+
+        # broken file keeps previous values
+        self.write('site.json', '{"THREADS": ')
+        self.assertEqual(watcher.poll(), {})
+        self.assertTrue(watcher.sources[1].error is not None)
+        self.assertEqual(config.get('THREADS'), 8)
+        self._msg('error', watcher.sources[1].error)
+
+        # polling thread
+        watcher.start(interval=0.01)
+        try:
+            self.write('site.json', '{"THREADS": 16, "DEBUG": true}')
+            for n in range(200):
+                if config.get('THREADS') == 16:
+                    break
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+        self.assertEqual(config.get('THREADS'), 16)
+        self.assertEqual(events[-1], ('site', ['THREADS']))
+        self.assertTrue(len(errors) >= 2)
+        self.assertTrue(watcher.thread is None)
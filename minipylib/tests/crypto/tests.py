@@ -10,6 +10,8 @@ Tests for minipylib.crypto
 
 from __future__ import (absolute_import, unicode_literals)
 
+import six
+
 from minipylib.tests.helpers import SimpleTestCase
 
 
@@ -354,6 +356,198 @@ class CryptoTests(SimpleTestCase):
         self._msg('digest', digest)
 
 
+    def test_file_digests(self):
+        """
+        Ensure file_digests function is working properly.
+        """
+        import os
+        import hashlib
+        import tempfile
+        from minipylib.crypto import file_digests, file_digest, get_hash_func
+        self._msg('test', 'file_digests', first=True)
+
+        module_dir = os.path.dirname(os.path.realpath(__file__))
+        path = os.path.join(module_dir, example_text_file)
+        with open(path, 'rb') as file_obj:
+            data = file_obj.read()
+        algorithms = ('md5', 'sha1', 'sha256')
+        expected = dict([(name, hashlib.new(name, data).hexdigest())
+                         for name in algorithms])
+
+        # regular reads, small blocks and mmap should all agree
+        for kwargs in ({}, {'block_size': 7}, {'use_mmap': True},
+                       {'use_mmap': True, 'block_size': 100}):
+            digests = file_digests(path, algorithms, **kwargs)
+            self.assertEqual(digests, expected)
+            self._msg('kwargs', kwargs)
+            self._msg('digests', digests)
+
+        digest = file_digest(path, use_mmap=True)
+        self.assertEqual(digest, expected['sha256'])
+
+        digests = file_digests(path, 'md5', hexdigest=False)
+        self.assertEqual(digests, {'md5': hashlib.md5(data).digest()})
+
+        # unknown algorithms are not replaced by the default hash
+        self.assertRaises(ValueError, file_digests, path, ['md5', 'bogus'])
+        self.assertRaises(ValueError, get_hash_func, 'bogus')
+        self.assertEqual(file_digest(path, algorithm='bogus'),
+                         expected['sha256'])
+
+        # empty file
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        digests = file_digests(path, algorithms, use_mmap=True)
+        self.assertEqual(digests['sha1'], hashlib.sha1(b'').hexdigest())
+        os.unlink(path)
+
+
+    def test_digest_tree(self):
+        """
+        Ensure digest_tree function is working properly.
+        """
+        import os
+        import io
+        import shutil
+        import tempfile
+        from minipylib.crypto import (digest_tree, DigestCache,
+                                      write_manifest, file_digest)
+        self._msg('test', 'digest_tree', first=True)
+
+        root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(root, 'b', 'c'))
+        files = {
+            'a.txt': b'file a',
+            os.path.join('b', 'b.txt'): b'file b',
+            os.path.join('b', 'c', 'c.txt'): example_text.encode('utf-8'),
+        }
+        for relpath, data in files.items():
+            with open(os.path.join(root, relpath), 'wb') as file_obj:
+                file_obj.write(data)
+        expected = sorted([(relpath, file_digest(os.path.join(root, relpath)))
+                           for relpath in files])
+
+        for kwargs in ({'workers': 1}, {'workers': 3},
+                       {'workers': 2, 'processes': True}):
+            result = list(digest_tree(root, **kwargs))
+            self.assertEqual(result, expected)
+            self._msg('kwargs', kwargs)
+            self._msg('result', result)
+
+        # unchanged files are read from the cache on the next run
+        cache_path = os.path.join(tempfile.mkdtemp(), 'digests.json')
+        cache = DigestCache(cache_path)
+        self.assertEqual(list(digest_tree(root, cache=cache)), expected)
+        self.assertEqual(cache.misses, 3)
+        cache = DigestCache(cache_path)
+        self.assertEqual(list(digest_tree(root, cache=cache)), expected)
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 0)
+
+        # changed file is hashed again
+        path = os.path.join(root, 'a.txt')
+        with open(path, 'wb') as file_obj:
+            file_obj.write(b'file a has changed')
+        cache = DigestCache(cache_path)
+        result = dict(digest_tree(root, cache=cache))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(result['a.txt'], file_digest(path))
+
+        out = io.StringIO()
+        count = write_manifest(root, out)
+        self.assertEqual(count, 3)
+        self.assertEqual(out.getvalue().splitlines()[0],
+                         '%s  a.txt' % result['a.txt'])
+        self._msg('manifest', out.getvalue(), linebreak=True)
+
+        # cache must match the algorithm
+        cache = DigestCache(cache_path)
+        self.assertRaises(ValueError, list,
+                          digest_tree(root, algorithm='sha1', cache=cache))
+
+        # cache is saved when the iterator is closed early
+        os.unlink(cache_path)
+        cache = DigestCache(cache_path)
+        walk = digest_tree(root, cache=cache, workers=1)
+        next(walk)
+        walk.close()
+        self.assertEqual(len(DigestCache(cache_path).entries), 1)
+
+        # file removed during the walk is skipped and reported
+        errors = []
+        walk = digest_tree(root, workers=1,
+                           onerror=lambda relpath, e: errors.append(relpath))
+        self.assertEqual(next(walk)[0], 'a.txt')
+        os.unlink(os.path.join(root, 'b', 'b.txt'))
+        self.assertEqual([relpath for relpath, digest in walk],
+                         [os.path.join('b', 'c', 'c.txt')])
+        self.assertEqual(errors, [os.path.join('b', 'b.txt')])
+
+        shutil.rmtree(root)
+        shutil.rmtree(os.path.dirname(cache_path))
+
+
+    def test_tree_digest(self):
+        """
+        Ensure tree_digest function is working properly.
+        """
+        import os
+        import mmap
+        import hashlib
+        import tempfile
+        from minipylib.crypto import (tree_digest, verify_tree, merkle_root,
+                                      TreeDigest, LEAF_PREFIX)
+        self._msg('test', 'tree_digest', first=True)
+
+        leaf_size = mmap.ALLOCATIONGRANULARITY
+        data = os.urandom(leaf_size * 10 + 123)
+        fd, path = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+
+        leaves = [hashlib.sha256(LEAF_PREFIX + data[i:i+leaf_size]).digest()
+                  for i in range(0, len(data), leaf_size)]
+        expected = merkle_root(leaves, hashlib.sha256)
+
+        for kwargs in ({'workers': 1}, {'workers': 4},
+                       {'workers': 2, 'processes': True}):
+            tree = tree_digest(path, leaf_size=leaf_size, **kwargs)
+            self.assertEqual(tree.leaves, leaves)
+            self.assertEqual(tree.root, expected)
+            self._msg('kwargs', kwargs)
+            self._msg('root', tree.hexdigest())
+
+        # resume from a partially completed state file
+        state_path = path + '.tree'
+        tree.leaves[3] = tree.leaves[7] = None
+        self.assertTrue(tree.hexdigest() is None)
+        tree.save(state_path)
+        self.assertEqual(TreeDigest.load(state_path).pending(), [3, 7])
+        tree = tree_digest(path, leaf_size=leaf_size, state_path=state_path,
+                           checkpoint=0)
+        self.assertEqual(tree.root, expected)
+        self.assertTrue(TreeDigest.load(state_path).complete)
+
+        # partial re-verification
+        self.assertEqual(verify_tree(path, tree), [])
+        with open(path, 'r+b') as file_obj:
+            file_obj.seek(leaf_size * 5 + 10)
+            file_obj.write(b'changed')
+        self.assertEqual(verify_tree(path, tree), [5])
+        self.assertEqual(verify_tree(path, tree, indexes=[0, 1]), [])
+
+        self.assertRaises(ValueError, tree_digest, path, leaf_size=1000)
+
+        # empty file has a single empty leaf
+        with open(path, 'wb'):
+            pass
+        tree = tree_digest(path)
+        self.assertEqual(tree.root, hashlib.sha256(LEAF_PREFIX).digest())
+
+        os.unlink(path)
+        os.unlink(state_path)
+
+
     def test_make_digest(self):
         """
         Ensure make_digest function is working properly.
@@ -387,6 +581,46 @@ class CryptoTests(SimpleTestCase):
         self._msg('digest', digest)
 
 
+    def test_signer(self):
+        """
+        Ensure Signer object is working properly.
+        """
+        import hashlib
+        from minipylib.crypto import Signer, make_digest
+        self._msg('test', 'Signer', first=True)
+
+        secret_key = b'the-secret-key'
+        messages = [b'abc', b'Attack at dawn.', example_text.encode('utf-8')]
+        signer = Signer(secret_key)
+        for message in messages:
+            expected = make_digest(secret_key, message)
+            self.assertEqual(signer.sign(message), expected)
+            self.assertTrue(signer.verify(expected, message))
+            hex_expected = make_digest(secret_key, message, hexdigest=True)
+            self.assertEqual(signer.sign(message, hexdigest=True), hex_expected)
+            self.assertTrue(signer.verify(hex_expected, message))
+            self.assertTrue(signer.verify(hex_expected.upper(), message)
+                            is False)
+            self._msg('signature', hex_expected)
+
+        self.assertEqual(signer.sign(b'a', b'b', b'c'),
+                         make_digest(secret_key, b'a', b'b', b'c'))
+        self.assertFalse(signer.verify(b'bad signature', b'abc'))
+        self.assertFalse(signer.verify('\u1234', b'abc'))
+        self.assertFalse(Signer(b'other key').verify(signer.sign(b'abc'), b'abc'))
+
+        signatures = signer.sign_many(messages + [(b'a', b'b')])
+        self.assertEqual(signatures[-1], signer.sign(b'a', b'b'))
+        results = signer.verify_many(zip(signatures, messages + [(b'a', b'b')]))
+        self.assertEqual(results, [True] * 4)
+        results = signer.verify_many(zip(signatures, reversed(messages)))
+        self.assertEqual(results, [False, True, False])
+
+        signer = Signer(secret_key, digestmod=hashlib.md5)
+        self.assertEqual(signer.sign(b'abc'),
+                         make_digest(secret_key, b'abc', digestmod=hashlib.md5))
+
+
     def test_gen_secret_key(self):
         """
         Ensure gen_scret_key function is working properly.
@@ -544,3 +778,351 @@ class CryptoTests(SimpleTestCase):
         self.assertTrue(secret is None)
         self._msg('keylen', keylen)
         self._msg('secret', secret)
+
+
+    def test_gen_secret_keys(self):
+        """
+        Ensure gen_secret_keys function is working properly.
+        """
+        import string
+        from minipylib.crypto import (gen_secret_keys, gen_secret_key,
+                                      KeyAlphabet)
+        self._msg('test', 'gen_secret_keys', first=True)
+
+        keys = gen_secret_keys(1000, 16, charset='ln')
+        self.assertEqual(len(keys), 1000)
+        self.assertEqual(len(set(keys)), 1000)
+        chars = set(string.ascii_lowercase + string.digits)
+        for key in keys:
+            self.assertEqual(len(key), 16)
+            self.assertTrue(set(key) <= chars)
+        self._msg('keys[:3]', keys[:3])
+
+        # every character of the alphabet is used
+        self.assertEqual(set(''.join(keys)), chars)
+
+        # custom (non-ascii and large) key strings
+        key_string = '寫作ሴé'
+        key = gen_secret_key(50, key_string=key_string)
+        self.assertEqual(len(key), 50)
+        self.assertTrue(set(key) <= set(key_string))
+        self._msg('key', key)
+
+        key_string = ''.join([six.unichr(0x4e00 + n) for n in range(1000)])
+        key = gen_secret_key(300, key_string=key_string)
+        self.assertEqual(len(key), 300)
+        self.assertTrue(set(key) <= set(key_string))
+
+        self.assertEqual(gen_secret_keys(0, 16), [])
+        self.assertTrue(gen_secret_keys(3, 0) is None)
+        self.assertTrue(gen_secret_keys(3, 'abc') is None)
+        self.assertTrue(gen_secret_key(16, charset='x') is None)
+        self.assertTrue(KeyAlphabet.get('abc') is KeyAlphabet.get('abc'))
+        self.assertRaises(ValueError, KeyAlphabet, '')
+
+
+    def test_keyring(self):
+        """
+        Ensure KeyRing object is working properly.
+        """
+        import hashlib
+        from minipylib.crypto import (KeyRing, Cipher, CTRCipher, CipherError,
+                                      encode_data, decode_data, make_digest)
+        self._msg('test', 'KeyRing', first=True)
+
+        data = b'Attack at dawn.'
+        keyring = KeyRing({'k1': 'secret-1'})
+        self.assertEqual(keyring.primary, b'k1')
+        envelope = keyring.encrypt(data)
+        self.assertEqual(keyring.key_id_for(envelope), b'k1')
+        self.assertEqual(keyring.decrypt(envelope), data)
+        # body is a regular Cipher envelope
+        body = keyring.split(envelope)[1]
+        self.assertEqual(Cipher(b'secret-1').decrypt(body), data)
+
+        # rotate keys
+        keyring.add_key('k2', 'secret-2', primary=True)
+        envelope2 = keyring.encrypt(data)
+        self.assertEqual(keyring.key_id_for(envelope2), b'k2')
+        self.assertEqual(keyring.decrypt(envelope), data)
+        self.assertEqual(keyring.decrypt(envelope2), data)
+        self.assertTrue(keyring.reencrypt(envelope2) is envelope2)
+        rotated = list(keyring.reencrypt_many([envelope, envelope2]))
+        self.assertEqual(len(rotated), 1)
+        self.assertEqual(rotated[0][0], envelope)
+        self.assertEqual(keyring.key_id_for(rotated[0][1]), b'k2')
+        self.assertEqual(keyring.decrypt(rotated[0][1]), data)
+        self._msg('envelope', repr(envelope))
+        self._msg('rotated', repr(rotated[0][1]))
+
+        results = []
+        errors = []
+        thread = keyring.reencrypt_in_background(
+            [envelope, envelope2, b'bad envelope'],
+            lambda old, new: results.append((old, new)),
+            lambda envelope, e: errors.append(envelope))
+        thread.join(10)
+        self.assertEqual([old for old, new in results], [envelope])
+        self.assertEqual(errors, [b'bad envelope'])
+
+        keyring.remove_key('k1')
+        self.assertRaises(CipherError, keyring.decrypt, envelope)
+        self.assertRaises(CipherError, keyring.decrypt, data)
+        self.assertRaises(CipherError, keyring.set_primary, 'k3')
+        self.assertRaises(CipherError, keyring.add_key, '', 'secret')
+
+        # encode_data/decode_data/make_digest accept a KeyRing
+        encoded = encode_data(data, keyring, encoding='base64')
+        self.assertEqual(decode_data(encoded, keyring, encoding='base64'), data)
+        self.assertEqual(make_digest(keyring, b'abc'),
+                         make_digest(b'secret-2', b'abc'))
+        signature = keyring.sign(b'abc')
+        self.assertTrue(keyring.verify(signature, b'abc'))
+        self.assertFalse(keyring.verify(signature, b'abd'))
+        self.assertFalse(KeyRing({'k1': 'secret-2'}).verify(signature, b'abc'))
+        self.assertEqual(make_digest(keyring, b'abc', digestmod=hashlib.sha1),
+                         make_digest(b'secret-2', b'abc',
+                                     digestmod=hashlib.sha1))
+
+        # envelopes without a key id are read with the legacy key
+        old = Cipher(b'secret-0').encrypt(data)
+        old_ctr = CTRCipher(b'secret-0').encrypt(data)
+        self.assertRaises(CipherError, keyring.decrypt, old)
+        keyring.add_key('k0', 'secret-0')
+        keyring.set_legacy('k0')
+        self.assertEqual(keyring.decrypt(old), data)
+        self.assertEqual(keyring.decrypt(old_ctr), data)
+        self.assertRaises(CipherError, keyring.decrypt, b'bad envelope')
+        rotated = list(keyring.reencrypt_many([old, old_ctr, envelope2]))
+        self.assertEqual([o for o, new in rotated], [old, old_ctr])
+        for o, new in rotated:
+            self.assertEqual(keyring.key_id_for(new), b'k2')
+            self.assertEqual(keyring.decrypt(new), data)
+        keyring.remove_key('k0')
+        self.assertTrue(keyring.legacy is None)
+
+
+    def test_ctr_cipher(self):
+        """
+        Ensure CTRCipher class is working properly.
+        """
+        import os
+        import tempfile
+        from Crypto.Cipher import AES
+        from Crypto.Util import Counter
+        from minipylib.crypto import (CTRCipher, Cipher, CipherError, KeyRing,
+                                      encode_data, decode_data,
+                                      close_ctr_pools)
+        self._msg('test', 'CTRCipher', first=True)
+
+        secret_key = 'the-secret-key'
+        data = os.urandom(1000) + example_text.encode('utf-8')
+        nonce = os.urandom(8)
+
+        # parallel result is the same as a single serial AES call
+        serial = CTRCipher(secret_key, workers=1)
+        parallel = CTRCipher(secret_key, workers=4, segment_size=64)
+        counter = Counter.new(64, prefix=nonce, initial_value=0)
+        expected = AES.new(serial.key, AES.MODE_CTR,
+                           counter=counter).encrypt(data)
+        self.assertEqual(serial.crypt(data, nonce), expected)
+        self.assertEqual(parallel.crypt(data, nonce), expected)
+        self.assertEqual(parallel.crypt(expected, nonce), data)
+        process_pool = CTRCipher(secret_key, workers=2, processes=True,
+                                 segment_size=1024)
+        self.assertEqual(process_pool.crypt(data, nonce), expected)
+        # ciphers share one pool per (workers, processes)
+        self.assertTrue(CTRCipher(secret_key, workers=4).get_pool() is
+                        parallel.get_pool())
+        self.assertFalse(process_pool.get_pool() is parallel.get_pool())
+
+        envelope = parallel.encrypt(data)
+        self.assertTrue(envelope.startswith(CTRCipher.magic))
+        self.assertEqual(serial.decrypt(envelope), data)
+        self.assertEqual(parallel.decrypt(envelope), data)
+        tampered = envelope[:-1] + (b'a' if envelope[-1:] != b'a' else b'b')
+        self.assertRaises(CipherError, parallel.decrypt, tampered)
+        self.assertRaises(CipherError, CTRCipher('other-key').decrypt, envelope)
+        self.assertRaises(CipherError, parallel.decrypt, b'abc')
+        self.assertRaises(CipherError, CTRCipher, secret_key, segment_size=100)
+
+        # encode_data/decode_data handle both modes
+        encoded = encode_data(data, secret_key, encoding='base64', mode='ctr')
+        self.assertEqual(decode_data(encoded, secret_key, encoding='base64'),
+                         data)
+        # (Cipher requires a byte string secret)
+        secret_bytes = secret_key.encode('utf-8')
+        encoded = encode_data(data, secret_bytes, encoding='base64')
+        self.assertEqual(decode_data(encoded, secret_bytes, encoding='base64'),
+                         data)
+        self.assertRaises(CipherError, encode_data, data, secret_key,
+                          mode='ecb')
+
+        keyring = KeyRing({'k1': secret_key}, cipher_class=CTRCipher)
+        envelope = keyring.encrypt(data)
+        self.assertEqual(keyring.decrypt(envelope), data)
+        self.assertEqual(keyring.decrypt(
+            keyring.make_header(b'k1') + Cipher(secret_bytes).encrypt(data)),
+            data)
+
+        # files
+        src = tempfile.mkstemp()[1]
+        dst = tempfile.mkstemp()[1]
+        out = tempfile.mkstemp()[1]
+        with open(src, 'wb') as file_obj:
+            file_obj.write(data * 3)
+        cipher = CTRCipher(secret_key, workers=3, segment_size=256)
+        cipher.encrypt_file(src, dst)
+        with open(dst, 'rb') as file_obj:
+            encrypted = file_obj.read()
+        self.assertEqual(CTRCipher(secret_key).decrypt(encrypted), data * 3)
+        cipher.decrypt_file(dst, out)
+        with open(out, 'rb') as file_obj:
+            self.assertEqual(file_obj.read(), data * 3)
+        with open(dst, 'wb') as file_obj:
+            file_obj.write(encrypted[:-1])
+        os.unlink(out)
+        self.assertRaises(CipherError, cipher.decrypt_file, dst, out)
+        self.assertFalse(os.path.exists(out))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(out))
+                          if name.startswith('.%s.' % os.path.basename(out))],
+                         [])
+        close_ctr_pools()
+        for path in (src, dst):
+            os.unlink(path)
+
+
+    def test_hash_password(self):
+        """
+        Ensure password hashing functions are working properly.
+        """
+        import hashlib
+        from minipylib.crypto import (hash_password, check_password,
+                                      parse_password_hash,
+                                      password_needs_rehash,
+                                      calibrate_password_cost,
+                                      PasswordHasher, CipherError)
+        self._msg('test', 'hash_password', first=True)
+
+        password = 'écriture 寫作'
+        encoded = hash_password(password, cost=1000)
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(check_password(password, encoded))
+        self.assertTrue(check_password(password.encode('utf-8'), encoded))
+        self.assertFalse(check_password('wrong', encoded))
+        self.assertFalse(check_password(password, 'bad$hash'))
+        # out of range cost parameters
+        salt, hashed = encoded.split('$')[-2:]
+        for params in ('0', '-5', '16383$8$1', '16384$0$1'):
+            algorithm = 'scrypt' if '$' in params else 'pbkdf2_sha256'
+            self.assertFalse(check_password(
+                password, '$'.join([algorithm, params, salt, hashed])))
+        self.assertNotEqual(hash_password(password, cost=1000), encoded)
+        self._msg('encoded', encoded)
+
+        algorithm, cost, salt, hashed = parse_password_hash(encoded)
+        self.assertEqual(hashed, hashlib.pbkdf2_hmac(
+            str('sha256'), password.encode('utf-8'), salt, 1000, 32))
+        self.assertRaises(CipherError, parse_password_hash, 'abc')
+
+        self.assertFalse(password_needs_rehash(encoded, cost=1000))
+        self.assertTrue(password_needs_rehash(encoded))
+        self.assertTrue(password_needs_rehash(encoded, 'pbkdf2_sha512', 1000))
+
+        encoded = hash_password(password, 'pbkdf2_sha512', cost=1000)
+        self.assertTrue(check_password(password, encoded))
+        self.assertRaises(CipherError, hash_password, password, 'md5')
+
+        if hasattr(hashlib, 'scrypt'):
+            encoded = hash_password(password, 'scrypt', cost=(2**10, 8, 1))
+            self.assertTrue(encoded.startswith('scrypt$1024$8$1$'))
+            self.assertTrue(check_password(password, encoded))
+            self.assertFalse(check_password('wrong', encoded))
+
+        iterations = calibrate_password_cost(0.02)
+        self.assertTrue(iterations >= 1000)
+        self._msg('iterations (20ms)', iterations)
+
+        hasher = PasswordHasher(cost=1000, workers=2)
+        encoded = hasher.hash(password)
+        self.assertFalse(hasher.needs_rehash(encoded))
+        results = []
+        async_result = hasher.verify_async(password, encoded,
+                                           callback=results.append)
+        self.assertTrue(async_result.get(10))
+        self.assertEqual(results, [True])
+        self.assertFalse(hasher.verify('wrong', encoded, timeout=10))
+        self.assertTrue(check_password(password,
+                                       hasher.hash_async(password).get(10)))
+        hasher.close()
+
+
+    def test_stream_encoder(self):
+        """
+        Ensure streaming encoders/decoders are working properly.
+        """
+        import io
+        import os
+        from minipylib.crypto import (Encoders, Decoders, StreamEncoder,
+                                      iter_encode, iter_decode, CipherError)
+        self._msg('test', 'StreamEncoder', first=True)
+
+        data = os.urandom(1000)
+        chunks = [data[i:i+7] for i in range(0, len(data), 7)]
+        for encoding in Encoders:
+            expected = Encoders[encoding](data)
+            encoded = b''.join(iter_encode(chunks, encoding))
+            self.assertEqual(encoded, expected)
+            encoded = b''.join(iter_encode(io.BytesIO(data), encoding,
+                                           chunk_size=11))
+            self.assertEqual(encoded, expected)
+            decoded = b''.join(iter_decode(io.BytesIO(encoded), encoding,
+                                           chunk_size=13))
+            self.assertEqual(decoded, data)
+            self.assertEqual(Decoders[encoding](encoded), data)
+            self._msg(encoding, encoded[:40])
+
+        # line breaks are ignored when decoding
+        encoded = Encoders['base64'](data)
+        lines = [encoded[i:i+76] + b'\n' for i in range(0, len(encoded), 76)]
+        self.assertEqual(b''.join(iter_decode(lines)), data)
+        self.assertEqual(b''.join(iter_encode([])), b'')
+        self.assertRaises(CipherError, StreamEncoder, 'rot13')
+
+
+    def test_ctr_cipher_encoded_file(self):
+        """
+        Ensure CTRCipher writes and reads encoded envelope files.
+        """
+        import os
+        import tempfile
+        from minipylib.crypto import (CTRCipher, Decoders, CipherError,
+                                      close_ctr_pools)
+        self._msg('test', 'CTRCipher encoded files', first=True)
+
+        cipher = CTRCipher(b'the-secret-key', workers=2, segment_size=64)
+        src = tempfile.mkstemp()[1]
+        dst = tempfile.mkstemp()[1]
+        out = tempfile.mkstemp()[1]
+        for size in (0, 1, 5, 300, 1001):
+            data = os.urandom(size)
+            with open(src, 'wb') as file_obj:
+                file_obj.write(data)
+            for encoding in Decoders:
+                cipher.encrypt_file(src, dst, encoding=encoding)
+                with open(dst, 'rb') as file_obj:
+                    encoded = file_obj.read()
+                envelope = Decoders[encoding](encoded)
+                self.assertEqual(cipher.decrypt(envelope), data)
+                cipher.decrypt_file(dst, out, encoding=encoding)
+                with open(out, 'rb') as file_obj:
+                    self.assertEqual(file_obj.read(), data)
+            self._msg('size', size)
+
+        with open(dst, 'wb') as file_obj:
+            file_obj.write(encoded[:-8])
+        self.assertRaises(CipherError, cipher.decrypt_file, dst, out,
+                          encoding=encoding)
+        close_ctr_pools()
+        for path in (src, dst, out):
+            os.unlink(path)
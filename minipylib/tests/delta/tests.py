@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+tests.delta.tests
+
+Tests for minipylib.delta
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import io
+import os
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class DeltaTests(SimpleTestCase):
+
+    def test_weak_checksum(self):
+        """
+        Ensure weak checksum can be rolled one byte at a time.
+        """
+        from minipylib.delta import weak_checksum
+        self._msg('test', 'weak_checksum', first=True)
+
+        data = bytearray(os.urandom(64))
+        size = 16
+        weak, a, b = weak_checksum(data[:size])
+        for n in range(1, len(data) - size + 1):
+            x_out, x_in = data[n-1], data[n+size-1]
+            a = (a - x_out + x_in) & 0xffff
+            b = (b - size * x_out + a) & 0xffff
+            self.assertEqual(a | (b << 16), weak_checksum(data[n:n+size])[0])
+
+
+    def test_delta_patch(self):
+        """
+        Ensure signature, delta and patch are working properly.
+        """
+        from minipylib.delta import signature, delta, patch
+        self._msg('test', 'signature, delta, patch', first=True)
+
+        block_size = 64
+        basis = os.urandom(block_size * 20 + 10)
+        # insert, delete and change bytes at a few places
+        new = (b'header' + basis[:300] + basis[360:900] + b'inserted' +
+               basis[900:1100] + b'\x00' * 5 + basis[1105:])
+        sig = signature(io.BytesIO(basis), block_size=block_size)
+        self.assertEqual(len(sig.weak), 21)
+
+        ops = list(delta(sig, io.BytesIO(new), read_size=100))
+        literal = sum([len(op[1]) for op in ops if op[0] == 'data'])
+        self.assertTrue(literal < len(new) // 4)
+        self._msg('ops', [op if op[0] == 'copy' else len(op[1]) for op in ops])
+        self._msg('literal bytes', literal)
+
+        out = io.BytesIO()
+        written = patch(io.BytesIO(basis), ops, out, block_size=block_size)
+        self.assertEqual(out.getvalue(), new)
+        self.assertEqual(written, len(new))
+
+        # identical file is a single copy; unrelated file is all data
+        ops = list(delta(sig, io.BytesIO(basis)))
+        self.assertEqual(ops, [('copy', 0, 21)])
+        other = os.urandom(500)
+        ops = list(delta(sig, io.BytesIO(other)))
+        self.assertEqual(ops, [('data', other)])
+        self.assertEqual(list(delta(sig, io.BytesIO(b''))), [])
+
+
+    def test_delta_serialization(self):
+        """
+        Ensure signatures and deltas can be written and read back.
+        """
+        from minipylib.delta import (signature, delta, patch, Signature,
+                                     write_delta, read_delta, DeltaError)
+        self._msg('test', 'write_delta, read_delta', first=True)
+
+        basis = os.urandom(5000)
+        new = basis[:2000] + b'changed' + basis[2100:]
+        sig = signature(io.BytesIO(basis), block_size=512, algorithm='sha1')
+        buf = io.BytesIO()
+        sig.dump(buf)
+        sig2 = Signature.load(io.BytesIO(buf.getvalue()))
+        self.assertEqual(sig2.block_size, 512)
+        self.assertEqual(sig2.algorithm, 'sha1')
+        self.assertEqual(sig2.weak, sig.weak)
+        self.assertEqual(sig2.strong, sig.strong)
+        self.assertRaises(ValueError, Signature, algorithm='bogus')
+
+        buf = io.BytesIO()
+        # block size is taken from the signature
+        count = write_delta(delta(sig2, io.BytesIO(new)), buf)
+        self._msg('ops', count)
+        self._msg('delta size', len(buf.getvalue()))
+        self.assertTrue(len(buf.getvalue()) < 1024)
+
+        out = io.BytesIO()
+        patch(io.BytesIO(basis), read_delta(io.BytesIO(buf.getvalue())), out)
+        self.assertEqual(out.getvalue(), new)
+        self.assertEqual(read_delta(io.BytesIO(buf.getvalue())).block_size,
+                         512)
+        out = io.BytesIO()
+        patch(io.BytesIO(basis), delta(sig, io.BytesIO(new)), out)
+        self.assertEqual(out.getvalue(), new)
+
+        self.assertRaises(DeltaError, read_delta, io.BytesIO(b'junk'))
+        truncated = read_delta(io.BytesIO(buf.getvalue()[:-3]))
+        self.assertRaises(DeltaError, list, truncated)
+        self.assertRaises(DeltaError, Signature.load, io.BytesIO(b'junk'))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+tests.green.tests
+
+Tests for minipylib.green
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import os
+import shutil
+import tempfile
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class GreenTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_file_helpers(self, io):
+        path = os.path.join(self.tmp_dir, 'testfile.txt')
+        text = 'écriture 寫作\n' * 100
+
+        self.assertTrue(io.write_file(path, text, atomic=True))
+        self.assertEqual(io.get_file_contents(path), text)
+        self.assertEqual(io.get_file_contents(path + '.missing'), None)
+
+        chunks = list(io.iter_file_contents(path, chunk_size=50))
+        self.assertEqual(''.join(chunks), text)
+        self.assertEqual(len(chunks), -(-len(text) // 50))
+        self.assertEqual(list(io.iter_file_contents(path + '.missing')), [])
+
+        with io.open_file(path, mode='rb') as f:
+            lines = list(f)
+        self.assertEqual(lines, text.encode('utf-8').splitlines(True))
+
+        out = os.path.join(self.tmp_dir, 'out.bin')
+        self.assertEqual(io.write_stream(out, [b'a', b'b', b'c'], mode='b'), 3)
+        self.assertEqual(io.get_file_contents(out, mode='b'), b'abc')
+        self.assertTrue(io.delete_file(out))
+        self.assertFalse(os.path.exists(out))
+
+
+    def test_file_helpers(self):
+        """
+        Ensure green file helpers are working properly.
+        """
+        from minipylib.green import GreenFileIO
+        self._msg('test', 'green file helpers', first=True)
+
+        class InlineFileIO(GreenFileIO):
+            name = 'inline'
+            def run_io(self, func, *args, **kwargs):
+                return func(*args, **kwargs)
+
+        self._check_file_helpers(InlineFileIO())
+
+
+    def test_backends(self):
+        """
+        Ensure green backends are available only when installed.
+        """
+        from minipylib.green import (get_green_io, get_green_backends,
+                                     close_green_io, GreenFileIO,
+                                     GreenIOError)
+        self._msg('test', 'green backends', first=True)
+        self._msg('backends', get_green_backends())
+        self.assertRaises(GreenIOError, get_green_io, 'missing')
+        self.assertRaises(GreenIOError, GreenFileIO().run_io, len, 'a')
+        try:
+            for name in ('gevent', 'eventlet'):
+                try:
+                    __import__(name)
+                except ImportError:
+                    self.assertRaises(GreenIOError, get_green_io, name)
+                else:
+                    self.assertTrue(name in get_green_backends())
+                    io = get_green_io(name, workers=2)
+                    self._check_file_helpers(io)
+                    # one shared instance (and pool) per backend
+                    self.assertTrue(get_green_io(name, workers=2) is io)
+        finally:
+            close_green_io()
+
+
+    def test_shared_instances(self):
+        """
+        Ensure get_green_io shares one instance per backend and workers.
+        """
+        from minipylib import green
+        self._msg('test', 'green shared instances', first=True)
+
+        closed = []
+        class InlineFileIO(green.GreenFileIO):
+            name = 'inline'
+            def run_io(self, func, *args, **kwargs):
+                return func(*args, **kwargs)
+            def close(self):
+                closed.append(self)
+
+        green._backends['inline'] = InlineFileIO
+        try:
+            io = green.get_green_io('inline')
+            self.assertTrue(green.get_green_io('inline') is io)
+            other = green.get_green_io('inline', workers=1)
+            self.assertFalse(other is io)
+            green.close_green_io()
+            self.assertEqual(sorted(map(id, closed)),
+                             sorted([id(io), id(other)]))
+            self.assertFalse(green.get_green_io('inline') is io)
+        finally:
+            green.close_green_io()
+            del green._backends['inline']
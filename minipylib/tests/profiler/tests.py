@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+tests.profiler.tests
+
+Tests for minipylib.profiler
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class ProfilerTests(SimpleTestCase):
+
+    def test_startup_profiler(self):
+        """
+        Ensure StartupProfiler is working properly.
+        """
+        from six.moves import builtins
+        from minipylib.profiler import (start_profiler, stop_profiler,
+                                        get_profiler, phase)
+        self._msg('test', 'StartupProfiler', first=True)
+
+        original_import = builtins.__import__
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(tmp_dir, 'startup')
+            profiler = start_profiler(prefix)
+            self.assertTrue(get_profiler() is profiler)
+            with phase('outer'):
+                with phase('inner'):
+                    sys.modules.pop('colorsys', None)
+                    import colorsys
+            self.assertTrue(stop_profiler() is profiler)
+            self.assertTrue(get_profiler() is None)
+            self.assertEqual(builtins.__import__, original_import)
+
+            tree = profiler.to_dict()
+            outer = tree['children'][0]
+            self.assertEqual(outer['name'], 'outer')
+            inner = outer['children'][0]
+            self.assertEqual(inner['name'], 'inner')
+            self.assertEqual(inner['children'][0]['name'], 'import colorsys')
+            self.assertTrue(outer['seconds'] >= inner['seconds'])
+
+            with open(prefix + '.json') as f:
+                self.assertEqual(json.load(f), tree)
+            with open(prefix + '.folded') as f:
+                folded = f.read()
+            self._msg('folded', folded)
+            for line in folded.splitlines():
+                stack, usecs = line.rsplit(' ', 1)
+                self.assertTrue(stack.startswith('startup'))
+                self.assertTrue(int(usecs) > 0)
+
+            # inactive profiler: phase is a no-op
+            with phase('ignored') as node:
+                self.assertTrue(node is None)
+        finally:
+            stop_profiler(dump=False)
+            shutil.rmtree(tmp_dir)
+
+
+    def test_get_profile_prefix(self):
+        """
+        Ensure profiling can be enabled by env var or config key.
+        """
+        from minipylib.profiler import (get_profile_prefix, PROFILE_ENV_VAR,
+                                        DEFAULT_PROFILE_PREFIX)
+        self._msg('test', 'get_profile_prefix', first=True)
+
+        saved = os.environ.pop(PROFILE_ENV_VAR, None)
+        try:
+            self.assertEqual(get_profile_prefix({}), None)
+            self.assertEqual(get_profile_prefix({'profile_startup': True}),
+                             DEFAULT_PROFILE_PREFIX)
+            self.assertEqual(get_profile_prefix({'profile_startup': '/tmp/p'}),
+                             '/tmp/p')
+            os.environ[PROFILE_ENV_VAR] = '/tmp/env'
+            self.assertEqual(get_profile_prefix(), '/tmp/env')
+        finally:
+            os.environ.pop(PROFILE_ENV_VAR, None)
+            if saved is not None:
+                os.environ[PROFILE_ENV_VAR] = saved
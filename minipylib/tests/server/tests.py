@@ -49,7 +49,7 @@ class ServerTests(SimpleTestCase):
         self._msg('test', 'DEFAULT_SERVER_CONFIG', first=True)
         settings = [
             'server', 'bind_addr', 'host_name', 'server_user', 'server_group',
-            'app_type', 'app', 'threads'
+            'app_type', 'app', 'threads', 'profile_startup'
         ]
         # verify settings exist in DEFAULT_SERVER_CONFIG
         for s in settings:
@@ -78,6 +78,45 @@ class ServerTests(SimpleTestCase):
                 self.assertTrue(callable(cval))
             self._msg(k, cval)
 
+    def test_make_server_profile(self):
+        """
+        Ensure make_server writes a startup profile when enabled.
+        """
+        import os
+        import json
+        import shutil
+        import tempfile
+        from six.moves import builtins
+        from minipylib.server import make_server, ServerNotFoundError
+        from minipylib.profiler import get_profiler
+        self._msg('test', 'make_server profile_startup', first=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(tmp_dir, 'startup')
+            s = make_server(server='simple_server', app_type='wsgi',
+                            server_user=None, server_group=None,
+                            profile_startup=prefix)
+            self.assertTrue(callable(s.run))
+            self.assertTrue(get_profiler() is None)
+            with open(prefix + '.json') as f:
+                tree = json.load(f)
+            phase = tree['children'][0]
+            self.assertEqual(phase['name'], 'make_server')
+            self.assertEqual([c['name'] for c in phase['children']],
+                             ['get_server_instance'])
+            self.assertTrue(os.path.isfile(prefix + '.folded'))
+            self._msg('tree', tree)
+
+            # import hook is removed if server creation fails
+            import_func = builtins.__import__
+            self.assertRaises(ServerNotFoundError, make_server,
+                              server='no_such_server', app_type='wsgi',
+                              profile_startup=prefix)
+            self.assertTrue(get_profiler() is None)
+            self.assertTrue(builtins.__import__ is import_func)
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_get_web_server(self):
         """
         Ensure get_web_server function is working properly.
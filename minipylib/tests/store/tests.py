@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+tests.store.tests
+
+Tests for minipylib.store
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import os
+import stat
+import shutil
+import tempfile
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class StoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_content_store(self):
+        """
+        Ensure ContentStore is working properly.
+        """
+        import io
+        import hashlib
+        from minipylib.store import ContentStore
+        self._msg('test', 'ContentStore', first=True)
+
+        store = ContentStore(self.root)
+        data = b'This is a test file.\n'
+        expected = hashlib.sha256(data).hexdigest()
+        digest = store.put(data)
+        self.assertEqual(digest, expected)
+        path = store.path_for(digest)
+        self.assertEqual(path, os.path.join(self.root, digest[:2],
+                                            digest[2:4], digest))
+        self.assertTrue(os.path.isfile(path))
+        self.assertTrue(digest in store)
+        self.assertEqual(store.get(digest), data)
+        self.assertTrue(store.verify(digest))
+        self._msg('digest', digest)
+        self._msg('path', path)
+
+        # same content from a file object or iterable is not written again
+        mtime = os.stat(path).st_mtime
+        self.assertEqual(store.put(io.BytesIO(data)), expected)
+        self.assertEqual(store.put([data[:5], data[5:]]), expected)
+        self.assertEqual(os.stat(path).st_mtime, mtime)
+        self.assertEqual(os.listdir(store.tmp_dir), [])
+
+        # blobs are created like regular files (mode 0666 less umask)
+        umask = os.umask(0o022)
+        try:
+            digest3 = store.put(b'readable')
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(store.path_for(digest3)).st_mode),
+                         0o644)
+        self.assertTrue(store.delete(digest3))
+
+        src = os.path.join(self.root, 'upload.txt')
+        with open(src, 'wb') as file_obj:
+            file_obj.write(b'upload')
+        digest2 = store.put_file(src)
+        self.assertEqual(sorted(store), sorted([digest, digest2]))
+
+        # index is loaded from the file system
+        store = ContentStore(self.root)
+        self.assertEqual(store.load_index(), 2)
+        self.assertEqual(store.index, set([digest, digest2]))
+
+        with open(store.path_for(digest2), 'wb') as file_obj:
+            file_obj.write(b'corrupted')
+        self.assertFalse(store.verify(digest2))
+        self.assertTrue(store.delete(digest2))
+        self.assertFalse(digest2 in store)
+        self.assertTrue(store.get(digest2) is None)
+        self.assertFalse(store.delete(digest2))
+
+        # blob removed by another store is written again
+        other = ContentStore(self.root, fsync=True)
+        self.assertTrue(other.delete(digest))
+        self.assertTrue(digest in store.index)
+        self.assertEqual(store.put(data), digest)
+        self.assertEqual(store.get(digest), data)
+        self.assertEqual(other.put(b'upload'), digest2)
+        self.assertEqual(store.get(digest2), b'upload')
+
+        # digests must be lowercase hex of the right length
+        for bad in ('../../x', digest.upper(), digest[:-1], digest + '0',
+                    '../' + digest[3:]):
+            for method in (store.path_for, store.get, store.open,
+                           store.delete, store.verify, store.exists):
+                self.assertRaises(ValueError, method, bad)
+
+        store = ContentStore(self.root, algorithm='md5', depth=1, width=3)
+        digest = store.put(data)
+        self.assertEqual(digest, hashlib.md5(data).hexdigest())
+        self.assertEqual(store.path_for(digest),
+                         os.path.join(self.root, digest[:3], digest))
+
+
+    def test_content_store_concurrent(self):
+        """
+        Ensure ContentStore handles concurrent writers.
+        """
+        from multiprocessing.pool import ThreadPool
+        from minipylib.store import ContentStore
+        self._msg('test', 'ContentStore concurrent writers', first=True)
+
+        store = ContentStore(self.root)
+        blobs = [os.urandom(10000) for n in range(5)] * 8
+        pool = ThreadPool(8)
+        digests = pool.map(store.put, blobs)
+        pool.close()
+        pool.join()
+        self.assertEqual(len(set(digests)), 5)
+        for digest, data in zip(digests, blobs):
+            self.assertEqual(store.get(digest), data)
+        self.assertEqual(os.listdir(store.tmp_dir), [])
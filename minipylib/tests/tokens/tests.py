@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+tests.tokens.tests
+
+Tests for minipylib.tokens
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+from minipylib.tests.helpers import SimpleTestCase
+
+
+class TokensTests(SimpleTestCase):
+
+    def test_token_serializer(self):
+        """
+        Ensure TokenSerializer is working properly.
+        """
+        import time
+        from minipylib.tokens import (TokenSerializer, TokenError,
+                                      BadSignature, SignatureExpired,
+                                      urlsafe_b64encode, urlsafe_b64decode)
+        self._msg('test', 'TokenSerializer', first=True)
+
+        secret_key = b'the-secret-key'
+        serializer = TokenSerializer(secret_key)
+        data = {'user': 42, 'name': 'écriture 寫作'}
+        token = serializer.dumps(data)
+        self.assertEqual(serializer.loads(token), data)
+        self.assertEqual(serializer.loads(token, max_age=60), data)
+        self.assertTrue('=' not in token and '+' not in token)
+        self._msg('data', data)
+        self._msg('token', token)
+        self._msg('length', len(token))
+
+        # expired tokens are rejected before the signature is checked
+        token = serializer.dumps(data, timestamp=time.time() - 120)
+        self.assertRaises(SignatureExpired, serializer.loads, token, max_age=60)
+        data_bytes = bytearray(urlsafe_b64decode(token))
+        data_bytes[-1] ^= 1
+        tampered = urlsafe_b64encode(bytes(data_bytes))
+        self.assertRaises(SignatureExpired, serializer.loads, tampered,
+                          max_age=60)
+        self.assertRaises(BadSignature, serializer.loads, tampered)
+
+        self.assertRaises(BadSignature, TokenSerializer(b'other').loads, token)
+        self.assertRaises(TokenError, serializer.loads, 'abc')
+        self.assertRaises(TokenError, serializer.loads, 'ሴ')
+
+        payload, timestamp = serializer.loads_with_timestamp(
+            serializer.dumps([1, 2], timestamp=1234567890))
+        self.assertEqual(payload, [1, 2])
+        self.assertEqual(timestamp, 1234567890)
+
+
+    def test_token_serializer_keys(self):
+        """
+        Ensure TokenSerializer key ids are working properly.
+        """
+        from minipylib.tokens import (TokenSerializer, TokenError,
+                                      BadSignature, BytesSerializer)
+        self._msg('test', 'TokenSerializer key ids', first=True)
+
+        old = TokenSerializer({1: b'old-key'})
+        token = old.dumps('data')
+        rotated = TokenSerializer({1: b'old-key', 2: b'new-key'})
+        self.assertEqual(rotated.key_id, 2)
+        self.assertEqual(rotated.loads(token), 'data')
+        self.assertRaises(BadSignature, old.loads, rotated.dumps('data'))
+        self.assertRaises(TokenError, TokenSerializer, {1: b'key'}, key_id=3)
+        self.assertRaises(TokenError, TokenSerializer, {256: b'key'})
+        self.assertRaises(TokenError, TokenSerializer, {-1: b'key', 1: b'k'})
+        self.assertRaises(TokenError, TokenSerializer, b'key', mac_size=0)
+        self.assertRaises(TokenError, TokenSerializer, b'key', mac_size=33)
+
+        # text keys are encoded to utf-8
+        serializer = TokenSerializer({1: 'clé', 2: 'key'}, key_id=1)
+        self.assertEqual(TokenSerializer({1: 'clé'.encode('utf-8')}).loads(
+            serializer.dumps('data')), 'data')
+
+        serializer = TokenSerializer(b'key', serializer=BytesSerializer)
+        self.assertEqual(serializer.loads(serializer.dumps(b'\x00\xff')),
+                         b'\x00\xff')
+
+
+    def test_token_serializer_cache(self):
+        """
+        Ensure TokenSerializer cache is working properly.
+        """
+        from minipylib.tokens import TokenSerializer
+        self._msg('test', 'TokenSerializer cache', first=True)
+
+        serializer = TokenSerializer(b'the-secret-key', cache_size=2)
+        tokens = [serializer.dumps(n) for n in range(3)]
+        for n, token in enumerate(tokens):
+            self.assertEqual(serializer.loads(token), n)
+        self.assertEqual(list(serializer.cache.keys()), tokens[1:])
+
+        # cached tokens are still checked for max_age
+        self.assertEqual(serializer.loads(tokens[1], max_age=60), 1)
+        self.assertEqual(list(serializer.cache.keys()),
+                         [tokens[2], tokens[1]])
+        self._msg('cache', serializer.cache)
@@ -15,12 +15,17 @@ import os
 import sys
 
 from minipylib.tests.helpers import SimpleTestCase
+from minipylib.utils import make_record
 
 
 TestData = """\
 This is a test file.
 """
 
+# record class for pickle test (must be importable by name)
+PickledRecord = make_record('PickledRecord', ['a', 'b'])
+
+
 class UtilsTests(SimpleTestCase):
 
     def test_add_to_sys_path(self):
@@ -60,6 +65,47 @@ class UtilsTests(SimpleTestCase):
         self._msg('MAX_LENGTH', imported.MAX_LENGTH)
 
 
+    def test_module_loader(self):
+        """
+        Ensure ModuleLoader is working properly.
+        """
+        import shutil
+        import tempfile
+        from minipylib.utils import ModuleLoader, load_module
+        self._msg('test', 'ModuleLoader', first=True)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'plugin.py')
+            with open(path, 'w') as f:
+                f.write('VALUE = 1\n')
+            loader = ModuleLoader()
+            sys_path = list(sys.path)
+            module = loader.load(path)
+            self.assertEqual(module.VALUE, 1)
+            self.assertTrue(loader.load(path) is module)
+            self.assertEqual(sys.path, sys_path)
+            self.assertTrue(sys.modules[module.__name__] is module)
+
+            # file changed: module is loaded again
+            with open(path, 'w') as f:
+                f.write('VALUE = 22\n')
+            module = loader.load(path)
+            self.assertEqual(module.VALUE, 22)
+            self.assertEqual((loader.hits, loader.misses, loader.reloads),
+                             (1, 1, 1))
+            self._msg('hits, misses, reloads',
+                      (loader.hits, loader.misses, loader.reloads))
+
+            module = load_module(path, module_name='test_plugin_module')
+            self.assertEqual(module.__name__, 'test_plugin_module')
+            self.assertTrue(load_module(path) is module)
+            self.assertRaises(OSError, loader.load,
+                              os.path.join(tmp_dir, 'missing.py'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
     def test_import_module_vars(self):
         """
         Ensure import_module_vars function is working properly.
@@ -116,6 +162,60 @@ class UtilsTests(SimpleTestCase):
         self._msg('name', obj.get_name())
 
 
+    def test_lazy_imports(self):
+        """
+        Ensure lazy import proxies are working properly.
+        """
+        from minipylib.utils import (lazy_module_vars, lazy_module_settings,
+                                     lazy_instance, lazy_import_report,
+                                     clear_lazy_import_report,
+                                     get_module_settings, LazyObject)
+        self._msg('test', 'lazy imports', first=True)
+        clear_lazy_import_report()
+        dummy_module = 'minipylib.tests.utils.dummy_module'
+        obj = lazy_instance(dummy_module + '.objects', 'DummyTestObject',
+                            'lazy-object')
+        settings = lazy_module_settings(dummy_module + '.settings')
+        unused = lazy_module_vars(dummy_module + '.settings', ['MAX_LENGTH'])
+        self.assertFalse(obj._lazy_resolved)
+        self._msg('unresolved', obj)
+
+        self.assertEqual(obj.get_name(), 'lazy-object')
+        self.assertEqual(settings['ADMIN_USER'], 'dummy-admin')
+        self.assertTrue('MAX_LENGTH' in settings)
+        self.assertEqual(len(settings), 2)
+        self.assertTrue(get_module_settings(dummy_module + '.settings')
+                        is settings._lazy_target)
+
+        names = [r['name'] for r in lazy_import_report(triggered=True)]
+        self.assertTrue('instance:%s.objects.DummyTestObject' % dummy_module
+                        in names)
+        self.assertTrue('settings:%s.settings' % dummy_module in names)
+        names = [r['name'] for r in lazy_import_report(triggered=False)]
+        self.assertTrue('vars:%s.settings' % dummy_module in names)
+        self.assertFalse(unused._lazy_resolved)
+        self._msg('report', lazy_import_report())
+
+        # stats are kept per name, not per proxy
+        for n in range(100):
+            proxy = LazyObject(lambda: 'value', 'per-request')
+            self.assertEqual(hash(proxy), hash('value'))
+            self.assertTrue(proxy in set(['value']))
+        report = [r for r in lazy_import_report() if r['name'] == 'per-request']
+        self.assertEqual(len(report), 1)
+        self.assertEqual((report[0]['created'], report[0]['triggered']),
+                         (100, 100))
+        self.assertEqual(len(lazy_import_report()), 4)
+
+        # eager versions return None for missing modules; proxies
+        # raise ImportError on first use
+        missing = lazy_module_settings(dummy_module + '.missing')
+        self.assertFalse(missing._lazy_resolved)
+        self.assertRaises(ImportError, getattr, missing, 'ADMIN_USER')
+        self.assertRaises(ImportError, len,
+                          lazy_module_vars(dummy_module + '.missing'))
+
+
     def test_get_file_contents(self):
         """
         Ensure get_file_contents function is working properly.
@@ -143,6 +243,100 @@ class UtilsTests(SimpleTestCase):
         self._msg('data', repr(data), linebreak=True)
 
 
+    def test_file_cache(self):
+        """
+        Ensure FileCache is working properly.
+        """
+        import shutil
+        import tempfile
+        from minipylib.utils import FileCache, get_cached_file_contents
+        self._msg('test', 'FileCache', first=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmp_dir, 'file%d.txt' % n) for n in range(3)]
+            for path in paths:
+                with open(path, 'wb') as f:
+                    f.write(b'x' * 100)
+            cache = FileCache(max_bytes=250, revalidate=0)
+            self.assertEqual(cache.get(paths[0]), 'x' * 100)
+            self.assertEqual(cache.get(paths[0]), 'x' * 100)
+            self.assertEqual(cache.get(paths[0], mode='b'), b'x' * 100)
+            self.assertEqual((cache.hits, cache.misses, cache.revalidations),
+                             (1, 2, 1))
+            cache.get(paths[1])
+            self.assertEqual(cache.evictions, 1)
+            self.assertEqual(cache.stats()['bytes'], 200)
+
+            # changed file is read again
+            with open(paths[1], 'wb') as f:
+                f.write(b'changed')
+            self.assertEqual(cache.get(paths[1]), 'changed')
+            self.assertEqual(cache.misses, 4)
+
+            os.unlink(paths[2])
+            self.assertTrue(cache.get(paths[2]) is None)
+            self._msg('stats', cache.stats())
+
+            cache = FileCache(revalidate=60)
+            self.assertEqual(cache.get(paths[0]), 'x' * 100)
+            os.unlink(paths[0])
+            self.assertEqual(cache.get(paths[0]), 'x' * 100)
+            cache.invalidate(paths[0])
+            self.assertTrue(cache.get(paths[0]) is None)
+            self.assertEqual(get_cached_file_contents(paths[1]), 'changed')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_iter_file_contents(self):
+        """
+        Ensure streaming read functions are working properly.
+        """
+        import tempfile
+        from minipylib.utils import (iter_file_contents, iter_file_lines,
+                                     map_file, get_file_contents)
+        self._msg('test', 'iter_file_contents', first=True)
+        module_dir = os.path.dirname(os.path.realpath(__file__))
+        missing = os.path.join(module_dir, 'no_such_file')
+        self.assertTrue(iter_file_contents(missing) is None)
+        self.assertTrue(iter_file_lines(missing) is None)
+        self.assertTrue(map_file(missing) is None)
+
+        text = 'écriture 寫作\nline two\n' * 50
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(text.encode('utf-8'))
+            chunks = list(iter_file_contents(path, chunk_size=7))
+            self.assertEqual(''.join(chunks), text)
+            self.assertTrue(all([len(c) <= 7 for c in chunks]))
+            lines = list(iter_file_lines(path))
+            self.assertEqual(lines, text.splitlines(True))
+            self._msg('chunks', len(chunks))
+            self._msg('lines', len(lines))
+
+            data = b''.join(iter_file_contents(path, chunk_size=100, mode='b'))
+            self.assertEqual(data, text.encode('utf-8'))
+            self.assertTrue(isinstance(next(iter_file_lines(path, mode='b')),
+                                       six.binary_type))
+            view = map_file(path)
+            try:
+                self.assertEqual(len(view), len(data))
+                self.assertEqual(view[:10], data[:10])
+                self.assertEqual(view.find(b'two'), data.find(b'two'))
+            finally:
+                view.close()
+
+            with open(path, 'wb') as f:
+                pass
+            view = map_file(path)
+            self.assertEqual(view, b'')
+            self.assertEqual(len(view), 0)
+            view.close()
+        finally:
+            os.unlink(path)
+
+
     def test_write_file(self):
         """
         Ensure write_file function is working properly.
@@ -163,6 +357,80 @@ class UtilsTests(SimpleTestCase):
         os.unlink(path)
 
 
+    def test_write_file_atomic(self):
+        """
+        Ensure atomic and durable writes are working properly.
+        """
+        import stat
+        import shutil
+        import tempfile
+        from minipylib.utils import (write_file, get_file_contents,
+                                     DURABILITY_FDATASYNC, DURABILITY_DIRSYNC)
+        self._msg('test', 'write_file atomic', first=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'testfile.txt')
+            self.assertTrue(write_file(path, TestData, atomic=True))
+            self.assertEqual(get_file_contents(path), TestData)
+            os.chmod(path, 0o640)
+            self.assertTrue(write_file(path, b'\x00\x01', mode='b',
+                                       atomic=True,
+                                       durability=DURABILITY_DIRSYNC))
+            self.assertEqual(get_file_contents(path, mode='b'), b'\x00\x01')
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+            self.assertTrue(write_file(path, TestData,
+                                       durability=DURABILITY_FDATASYNC))
+            self.assertEqual(get_file_contents(path), TestData)
+            self.assertEqual(os.listdir(tmp_dir), ['testfile.txt'])
+
+            # new files follow the current umask
+            umask = os.umask(0o027)
+            try:
+                path = os.path.join(tmp_dir, 'newfile.txt')
+                self.assertTrue(write_file(path, TestData, atomic=True))
+            finally:
+                os.umask(umask)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+            os.unlink(path)
+
+            missing = os.path.join(tmp_dir, 'no_such_dir', 'testfile.txt')
+            self.assertFalse(write_file(missing, TestData, atomic=True))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_batch_writer(self):
+        """
+        Ensure BatchWriter is working properly.
+        """
+        import shutil
+        import tempfile
+        from minipylib.utils import (BatchWriter, get_file_contents,
+                                     DURABILITY_DIRSYNC)
+        self._msg('test', 'BatchWriter', first=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tmp_dir, 'file%d.txt' % n) for n in range(5)]
+            with BatchWriter(durability=DURABILITY_DIRSYNC) as batch:
+                for n, path in enumerate(paths):
+                    batch.write(path, 'data %d' % n)
+                # nothing is visible before commit
+                self.assertFalse(any([os.path.exists(p) for p in paths]))
+            for n, path in enumerate(paths):
+                self.assertEqual(get_file_contents(path), 'data %d' % n)
+
+            try:
+                with BatchWriter() as batch:
+                    batch.write(paths[0], 'changed')
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(get_file_contents(paths[0]), 'data 0')
+            self.assertEqual(len(os.listdir(tmp_dir)), len(paths))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
     def test_delete_file(self):
         """
         Ensure delete_file function is working properly.
@@ -182,6 +450,104 @@ class UtilsTests(SimpleTestCase):
         self._msg('exists', os.path.isfile(path))
 
 
+    def test_delete_file_secure(self):
+        """
+        Ensure delete_file secure wipe is working properly.
+        """
+        import tempfile
+        from minipylib.utils import delete_file, _wipe_file
+        self._msg('test', 'delete_file secure', first=True)
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'secret' * 20000)
+        _wipe_file(path)
+        self.assertEqual(os.path.getsize(path), 0)
+        with open(path, 'wb') as f:
+            f.write(b'secret')
+        self.assertTrue(delete_file(path, secure=True))
+        self.assertFalse(os.path.exists(path))
+        # missing file is not created
+        self.assertTrue(delete_file(path))
+        self.assertFalse(os.path.exists(path))
+
+
+    def test_purge_directory(self):
+        """
+        Ensure delete_files and purge_directory are working properly.
+        """
+        import shutil
+        import tempfile
+        from minipylib.utils import (delete_files, purge_directory,
+                                     iter_dir_files)
+        self._msg('test', 'purge_directory', first=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for d in ('a', os.path.join('a', 'b'), 'c'):
+                os.makedirs(os.path.join(tmp_dir, d))
+                for n in range(10):
+                    path = os.path.join(tmp_dir, d, 'file%d' % n)
+                    with open(path, 'wb') as f:
+                        f.write(b'data')
+                    paths.append(path)
+            self.assertEqual(sorted(iter_dir_files(tmp_dir)), sorted(paths))
+
+            missing = os.path.join(tmp_dir, 'missing')
+            report = delete_files(paths[:5] + [missing], workers=1)
+            self.assertEqual((report.deleted, report.missing), (5, 1))
+            self.assertEqual(report.failed, [])
+
+            report = purge_directory(tmp_dir, workers=4, remove_dirs=True)
+            self._msg('report', report)
+            self.assertEqual(report.deleted, len(paths) - 5)
+            self.assertEqual(report.dirs_removed, 3)
+            self.assertEqual(report.failed, [])
+            self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_purge_directory_symlinks(self):
+        """
+        Ensure secure deletion unlinks symlinks without wiping targets.
+        """
+        import shutil
+        import tempfile
+        from minipylib.utils import delete_file, purge_directory, iter_tree
+        self._msg('test', 'purge_directory_symlinks', first=True)
+        if not hasattr(os, 'symlink'):
+            return
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            victim = os.path.join(tmp_dir, 'victim')
+            with open(victim, 'wb') as f:
+                f.write(b'keep me')
+            tree = os.path.join(tmp_dir, 'tree')
+            os.makedirs(os.path.join(tree, 'sub'))
+            with open(os.path.join(tree, 'sub', 'file'), 'wb') as f:
+                f.write(b'data')
+            os.symlink(victim, os.path.join(tree, 'link'))
+            os.symlink(victim, os.path.join(tree, 'sub', 'link'))
+            self.assertEqual([p for p, st in iter_tree(tree)],
+                             [os.path.join('sub', 'file')])
+            self.assertEqual(
+                sorted(p for p, st in iter_tree(tree, regular_only=False)),
+                sorted(['link', os.path.join('sub', 'file'),
+                        os.path.join('sub', 'link')]))
+
+            self.assertTrue(delete_file(os.path.join(tree, 'link'),
+                                        secure=True))
+            report = purge_directory(tree, secure=True, remove_dirs=True)
+            self._msg('report', report)
+            self.assertEqual(report.deleted, 2)
+            self.assertEqual(report.failed, [])
+            self.assertEqual(os.listdir(tree), [])
+            with open(victim, 'rb') as f:
+                self.assertEqual(f.read(), b'keep me')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
     def test_uri_to_list(self):
         """
         Ensure uri_to_list function is working properly.
@@ -226,14 +592,143 @@ class UtilsTests(SimpleTestCase):
             self._msg(k, v)
 
 
+    def test_make_record(self):
+        """
+        Ensure make_record is working properly.
+        """
+        import pickle
+        from minipylib.utils import make_record, DataObject
+        self._msg('test', 'make_record', first=True)
+        Point = make_record('Point', 'x, y label', defaults={'x': 0, 'y': 0})
+        p = Point({'x': 1}, ['label'], y=2)
+        self.assertEqual((p.x, p['y'], p.label), (1, 2, True))
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertEqual(p.to_dict(), {'x': 1, 'y': 2, 'label': True})
+        self.assertEqual(dict(p), p.to_dict())
+        self.assertEqual(p, {'x': 1, 'y': 2, 'label': True})
+        self.assertEqual(Point(), {'x': 0, 'y': 0, 'label': None})
+        self.assertEqual(p.get('z', 'missing'), 'missing')
+        self.assertTrue('x' in p and 'z' not in p)
+        self._msg('record', p)
+
+        p.add({'label': 'start'})
+        p['x'] = 5
+        self.assertEqual((p.x, p.label), (5, 'start'))
+        self.assertRaises(AttributeError, setattr, p, 'z', 1)
+        self.assertRaises(KeyError, p.__getitem__, 'z')
+        self.assertRaises(AttributeError, p.add, {'z': 1})
+
+        # usable where a DataObject is expected
+        obj = DataObject(p)
+        self.assertEqual(obj.label, 'start')
+        record = PickledRecord(a=1, b='two')
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+        self.assertRaises(ValueError, make_record, 'Bad', ['x', 'x'])
+        self.assertRaises(ValueError, make_record, 'Bad', ['get'])
+        self.assertRaises(ValueError, make_record, 'Bad', ['_fields'])
+        self.assertRaises(ValueError, make_record, 'Bad', ['1x'])
+
+
+    def test_layered_data_object(self):
+        """
+        Ensure LayeredDataObject is working properly.
+        """
+        import operator
+        from minipylib.utils import (LayeredDataObject, FrozenDataObject,
+                                     DataObject)
+        self._msg('test', 'LayeredDataObject', first=True)
+        defaults = {'a': 1, 'b': [1, {'c': 2}], 'd': 'default'}
+        site = DataObject(d='site')
+        config = LayeredDataObject(site, defaults)
+        self.assertEqual((config.a, config.d), (1, 'site'))
+        self.assertEqual(config.get('missing', 'x'), 'x')
+        self.assertRaises(AttributeError, getattr, config, 'missing')
+
+        # writes and deletes only change the view
+        view = config.new_child({'a': 5})
+        view.e = True
+        del view.d
+        self.assertEqual(view, {'a': 5, 'b': [1, {'c': 2}], 'e': True})
+        self.assertFalse('d' in view)
+        self.assertEqual(len(view), 3)
+        self.assertEqual(config.to_dict(), {'a': 1, 'b': [1, {'c': 2}],
+                                            'd': 'site'})
+        self.assertEqual(defaults['a'], 1)
+        self.assertEqual(site, {'d': 'site'})
+        self.assertTrue(view.layers[-1] is defaults)
+        self._msg('view', view)
+
+        frozen = view.freeze()
+        self.assertTrue(isinstance(frozen, FrozenDataObject))
+        self.assertEqual(frozen.b, (1, {'c': 2}))
+        self.assertEqual(frozen.b[1].c, 2)
+        self.assertEqual(hash(frozen), hash(view.freeze()))
+        self.assertEqual(len(set([frozen, view.freeze()])), 1)
+        self.assertRaises(TypeError, frozen.__setitem__, 'a', 1)
+        self.assertRaises(TypeError, setattr, frozen, 'a', 1)
+        self.assertRaises(TypeError, frozen.update, {})
+        self.assertRaises(TypeError, operator.ior, frozen, {'a': 2})
+        self.assertEqual(frozen.a, 5)
+        self._msg('frozen', frozen)
+
+        self.assertEqual(DataObject(view).a, 5)
+
+
     def test_config(self):
         """
         Ensure Config class is working properly.
-
-        * TODO
         """
+        from minipylib.utils import Config
         self._msg('test', 'Config', first=True)
-        self._msg('TODO', '')
+        config = Config()
+        config.add_namespace('defaults', {'a': 1, 'b': 2, 'c': 3})
+        config.add_namespace('site', {'b': 20})
+        self.assertEqual(config.get('a'), 1)
+        self.assertEqual(config.get('b'), 20)
+        self.assertEqual(config.get('missing', 'x'), 'x')
+        self.assertEqual(config.get('b', namespace='defaults'), 2)
+        self.assertEqual(config._rebuilds, 1)
+
+        # flattened map is updated without a rebuild
+        config.setvar('defaults', 'a', 10)
+        config.add_namespace('request', {'c': 300})
+        config.update_namespace('site', {'d': 40})
+        self.assertEqual([config.get(k) for k in 'abcd'], [10, 20, 300, 40])
+        config.delete_namespace('site')
+        self.assertEqual([config.get(k) for k in 'abcd'], [10, 2, 300, None])
+        config.set_adhoc_namespace('adhoc')
+        config.set('b', 'adhoc')
+        self.assertEqual(config.get('b'), 'adhoc')
+        self.assertEqual(config._rebuilds, 1)
+
+        # direct changes to a namespace object update the map
+        request = config.get_namespace('request')
+        request['e'] = 5
+        self.assertEqual(config.get('e'), 5)
+        request.f = 6
+        request.update({'a': 'request'})
+        self.assertEqual([config.get(k) for k in 'aef'], ['request', 5, 6])
+        del request.f
+        request.pop('a')
+        self.assertEqual([config.get(k) for k in 'aef'], [10, 5, None])
+        request.clear()
+        self.assertEqual([config.get(k) for k in 'ce'], [3, None])
+        defaults = config.add_namespace('defaults')
+        defaults.setdefault('g', 7)
+        self.assertEqual(config.get('g'), 7)
+
+        # namespace objects that were replaced or deleted are detached
+        config.replace_namespace('defaults', {'a': 1})
+        defaults['a'] = 'stale'
+        self.assertEqual(config.get('a'), 1)
+        config.delete_namespace('request')
+        request['b'] = 'stale'
+        self.assertEqual(config.get('b'), 'adhoc')
+        self.assertEqual(config._rebuilds, 2)
+        stats = config.lookup_stats()
+        self.assertEqual(stats['misses'], 4)
+        self._msg('stats', stats)
 
 
     def test_safe_unicode(self):
@@ -440,3 +935,61 @@ class UtilsTests(SimpleTestCase):
             self.assertEqual(s, expected)
             self.assertTrue(isinstance(s, (six.string_types, six.text_type)))
             self._msg(n, s)
+
+
+    def test_bulk_str_conv(self):
+        """
+        Ensure s2b_list and b2s_list functions are working properly.
+        """
+        from minipylib.utils import s2b, b2s, s2b_list, b2s_list, safe_str
+        self._msg('test', 'test_bulk_str_conv', first=True)
+
+        data = ['écriture 寫作', b'abc', 42, 3.5, 'Ivan Krstić', True]
+        result = s2b_list(data)
+        self.assertEqual(result, [s2b(s) for s in data[:5]] + [b'True'])
+        self.assertEqual(safe_str(tuple(data)), result)
+        self.assertEqual(b2s_list(result),
+                         ['écriture 寫作', 'abc', '42', '3.5', 'Ivan Krstić',
+                          'True'])
+        self.assertEqual(b2s_list(['abc', b'\xe2\x82\xac']), ['abc', '€'])
+        self.assertEqual(b2s(s2b('€', 'utf-16'), 'utf-16'), '€')
+        self.assertEqual(s2b_list([bytearray(b'ab')]), [b'ab'])
+        self.assertRaises(TypeError, s2b_list, [[1, 2]])
+        self.assertRaises(TypeError, s2b_list, [('a',)])
+        self.assertRaises(TypeError, s2b, {'a': 1})
+        self._msg('result', result)
+
+
+    def test_iter_str_conv(self):
+        """
+        Ensure iter_encode and iter_decode functions are working properly.
+        """
+        from minipylib.utils import iter_encode, iter_decode, safe_str
+        self._msg('test', 'test_iter_str_conv', first=True)
+
+        txt = 'écriture 寫作 €20'
+        data = txt.encode('utf-8')
+        # split multibyte characters across one-byte chunks
+        chunks = [data[n:n+1] for n in range(len(data))]
+        self.assertEqual(''.join(iter_decode(chunks)), txt)
+        self.assertEqual(''.join(iter_decode(iter(chunks))), txt)
+        # stream ends inside '€'
+        self.assertRaises(UnicodeDecodeError, list, iter_decode([data[:-3]]))
+        self.assertEqual(''.join(iter_decode([data[:-3]], errors='replace')),
+                         txt[:-3] + '\ufffd')
+        self.assertEqual(list(iter_decode([b'ab', 'cd', bytearray(b'ef')])),
+                         ['ab', 'cd', 'ef'])
+
+        parts = [txt[n:n+2] for n in range(0, len(txt), 2)]
+        self.assertEqual(b''.join(iter_encode(parts)), data)
+        self.assertEqual(b''.join(safe_str(iter(parts))), data)
+        # a single byte order mark for the whole stream
+        self.assertEqual(b''.join(iter_encode(parts, 'utf-16')),
+                         txt.encode('utf-16'))
+        self.assertEqual(list(iter_encode(['a', b'b', 3, ''])),
+                         [b'a', b'b', b'3'])
+        # bytes mid-stream do not restart the byte order mark
+        self.assertEqual(b''.join(iter_encode(['a', b'x', 'b'], 'utf-16')),
+                         'a'.encode('utf-16') + b'x' +
+                         'b'.encode('utf-16')[2:])
+        self._msg('chunks', len(chunks))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+minipylib.tokens
+
+This module contains a serializer for compact signed tokens (for
+cookies, API tokens, etc.).
+
+A token is the URL-safe base64 encoding (without padding) of the
+following binary layout: ::
+
+    version    1 byte
+    key id     1 byte
+    timestamp  4 bytes (unsigned int, seconds since epoch)
+    payload    variable length
+    mac        truncated HMAC of all the fields above
+
+Tokens are checked in order of cost: the timestamp is checked against
+``max_age`` first, then the MAC is verified and only then is the
+payload deserialized.
+
+"""
+
+from __future__ import (absolute_import, unicode_literals)
+
+import six
+import time
+import json
+import hmac
+import base64
+import struct
+import threading
+from collections import OrderedDict
+
+from minipylib.crypto import Signer, DefaultHash
+
+
+TOKEN_VERSION = 1
+DEFAULT_MAC_SIZE = 16
+HEADER = struct.Struct(str('>BBI'))
+
+
+class TokenError(Exception):
+    """
+    Raised when a token cannot be decoded.
+    """
+    pass
+
+
+class BadSignature(TokenError):
+    """
+    Raised when the token signature does not match.
+    """
+    pass
+
+
+class SignatureExpired(TokenError):
+    """
+    Raised when the token is older than ``max_age``.
+    """
+    pass
+
+
+class JSONSerializer(object):
+    """
+    Serialize payloads as compact JSON (the default serializer).
+    """
+    @staticmethod
+    def dumps(obj):
+        data = json.dumps(obj, separators=(',', ':'))
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        return data
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data.decode('utf-8'))
+
+
+class BytesSerializer(object):
+    """
+    Pass byte string payloads through unchanged.
+    """
+    @staticmethod
+    def dumps(obj):
+        return obj
+
+    @staticmethod
+    def loads(data):
+        return data
+
+
+def urlsafe_b64encode(data):
+    """Return URL-safe base64 text for ``data`` (without padding)."""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def urlsafe_b64decode(text):
+    """Decode URL-safe base64 text (with or without padding)."""
+    if isinstance(text, six.text_type):
+        text = text.encode('ascii')
+    return base64.urlsafe_b64decode(text + b'=' * (-len(text) % 4))
+
+
+class TokenSerializer(object):
+    """
+    Create and verify compact signed tokens.
+
+    Usage::
+
+        serializer = TokenSerializer({1: old_key, 2: new_key}, key_id=2)
+        token = serializer.dumps({'user': 42})
+        data = serializer.loads(token, max_age=3600)
+
+    Tokens signed with any of the keys in ``secret_keys`` can be
+    loaded; new tokens are signed with the key ``key_id``.
+
+    If ``cache_size`` is set, the payloads of recently verified tokens
+    are kept in a bounded LRU cache so a token that is loaded again
+    does not need its MAC checked a second time (``max_age`` is still
+    checked).
+    """
+    version = TOKEN_VERSION
+
+    def __init__(self, secret_keys, key_id=None, serializer=JSONSerializer,
+                 mac_size=DEFAULT_MAC_SIZE, cache_size=0,
+                 digestmod=DefaultHash):
+        """
+        :param secret_keys: secret key or dict of key id (0-255) and
+            secret key (text keys are encoded to utf-8)
+        :param key_id: id of key to sign new tokens with (default is the
+            highest key id)
+        :param serializer: object with ``dumps`` and ``loads`` methods
+            to convert payloads to and from bytes
+        :param mac_size: number of bytes of HMAC to keep in token
+        :param cache_size: number of verified tokens to cache (0 to disable)
+        :param digestmod: digest module for HMAC (default: DefaultHash)
+        """
+        if not isinstance(secret_keys, dict):
+            secret_keys = {0: secret_keys}
+        if key_id is None:
+            key_id = max(secret_keys)
+        if key_id not in secret_keys:
+            raise TokenError('Unknown key id: %s' % key_id)
+        for k in secret_keys:
+            if not isinstance(k, six.integer_types) or not 0 <= k <= 255:
+                raise TokenError('Key id must be between 0 and 255: %s' % k)
+        self.signers = {}
+        for k, v in secret_keys.items():
+            if isinstance(v, six.text_type):
+                # HMAC requires a byte string key
+                v = v.encode('utf-8')
+            self.signers[k] = Signer(v, digestmod=digestmod)
+        if not 0 < mac_size <= digestmod().digest_size:
+            raise TokenError('Bad mac_size: %s' % mac_size)
+        self.key_id = key_id
+        self.serializer = serializer
+        self.mac_size = mac_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def dumps(self, obj, timestamp=None):
+        """
+        Return signed token for ``obj``.
+
+        :param obj: payload to serialize
+        :param timestamp: token time (default is current time)
+        :returns: token (URL-safe text)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        data = HEADER.pack(self.version, self.key_id, int(timestamp)) + \
+               self.serializer.dumps(obj)
+        mac = self.signers[self.key_id].sign(data)[:self.mac_size]
+        return urlsafe_b64encode(data + mac)
+
+    def loads(self, token, max_age=None):
+        """
+        Return payload of signed token.
+
+        :param token: token returned by ``dumps``
+        :param max_age: maximum age of token in seconds
+        :returns: payload
+        :raises: ``TokenError``, ``BadSignature`` or ``SignatureExpired``
+        """
+        return self.loads_with_timestamp(token, max_age)[0]
+
+    def loads_with_timestamp(self, token, max_age=None):
+        """
+        Same as ``loads`` but returns (payload, timestamp).
+        """
+        try:
+            data = urlsafe_b64decode(token)
+        except (TypeError, ValueError, UnicodeError):
+            raise TokenError('Malformed token.')
+        if len(data) < HEADER.size + self.mac_size:
+            raise TokenError('Malformed token.')
+        version, key_id, timestamp = HEADER.unpack_from(data)
+        if version != self.version:
+            raise TokenError('Unsupported token version: %d' % version)
+        if max_age is not None and time.time() - timestamp > max_age:
+            raise SignatureExpired('Token is %d seconds old.'
+                                   % (time.time() - timestamp))
+
+        payload = None
+        if self.cache_size:
+            with self.cache_lock:
+                payload = self.cache.get(token)
+                if payload is not None:
+                    self.cache[token] = self.cache.pop(token)
+        if payload is None:
+            signer = self.signers.get(key_id)
+            if signer is None:
+                raise BadSignature('Unknown key id: %d' % key_id)
+            body, mac = data[:-self.mac_size], data[-self.mac_size:]
+            if not hmac.compare_digest(signer.sign(body)[:self.mac_size], mac):
+                raise BadSignature('Token signature does not match.')
+            payload = body[HEADER.size:]
+            if self.cache_size:
+                with self.cache_lock:
+                    self.cache[token] = payload
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+        return self.serializer.loads(payload), timestamp
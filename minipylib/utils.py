@@ -25,6 +25,8 @@ import hashlib
 import codecs
 import string
 import logging
+import threading
+import time
 
 
 
@@ -63,7 +65,7 @@ def import_module(path, module_name=None):
     """
     if not module_name:
         m = hashlib.sha1()
-        m.update(path)
+        m.update(s2b(path))
         module_name = m.hexdigest()
     sys.path.insert(0, os.path.dirname(path))
     try:
@@ -75,6 +77,118 @@ def import_module(path, module_name=None):
     return module
 
 
+# cached module loader
+
+def _load_source(module_name, path):
+    """
+    Load module from source file without touching ``sys.path``.
+    """
+    if six.PY2:
+        # compile directly (imp.load_source may reuse a stale .pyc)
+        import imp
+        module = imp.new_module(str(module_name))
+        module.__file__ = path
+        with open(path, 'rb') as src:
+            code = compile(src.read(), path, 'exec')
+        execute = lambda: six.exec_(code, module.__dict__)
+    else:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        if spec is None:
+            raise ImportError('Cannot load module from %s' % path)
+        module = importlib.util.module_from_spec(spec)
+        execute = lambda: spec.loader.exec_module(module)
+    sys.modules[module_name] = module
+    try:
+        execute()
+    except Exception:
+        sys.modules.pop(module_name, None)
+        raise
+    return module
+
+
+class ModuleLoader(object):
+    """
+    Load modules from file paths and cache them.
+
+    Usage::
+
+        loader = ModuleLoader()
+        module = loader.load('/path/to/plugins/plugin.py')
+
+    Modules are cached by path together with the file's mtime and
+    size; a module is loaded again only when its file changes. Unlike
+    ``import_module``, the loader does not modify ``sys.path``. The
+    loader is thread-safe.
+
+    * ``hits``, ``misses`` and ``reloads`` count cache lookups.
+    """
+    def __init__(self):
+        self.modules = {}
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @staticmethod
+    def module_name_for(path):
+        """Return default module name (sha1 of path) for ``path``."""
+        return 'minipylib_module_%s' % hashlib.sha1(
+            path.encode('utf-8')).hexdigest()
+
+    def load(self, path, module_name=None):
+        """
+        Return module for ``path`` (loading it if new or changed).
+
+        :param path: full path to module to import
+        :param module_name: name to map module in sys.modules
+        :returns: imported module
+        :raises: ``ImportError`` or ``OSError`` if file is missing
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        with self.lock:
+            entry = self.modules.get(path)
+            if entry is not None and entry[0] == key and \
+               (module_name is None or entry[1].__name__ == module_name):
+                self.hits += 1
+                return entry[1]
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            if not module_name:
+                module_name = self.module_name_for(path)
+            module = _load_source(module_name, path)
+            self.modules[path] = (key, module)
+            return module
+
+    def invalidate(self, path=None):
+        """Remove ``path`` (or all paths if None) from the cache."""
+        with self.lock:
+            if path is None:
+                self.modules.clear()
+            else:
+                self.modules.pop(os.path.abspath(path), None)
+
+
+default_module_loader = ModuleLoader()
+
+def load_module(path, module_name=None, loader=None):
+    """
+    Load module from path (cached until the file changes).
+
+    :param path: full path to module to import
+    :param module_name: name to map module in sys.modules
+    :param loader: ``ModuleLoader`` (default is a shared loader)
+    :returns: imported module
+    """
+    if loader is None:
+        loader = default_module_loader
+    return loader.load(path, module_name)
+
+
 # old version
 
 # def import_module(path):
@@ -117,7 +231,7 @@ def import_module_vars(module, varnames=None):
     :More info: `<http://stackoverflow.com/questions/2259427/load-python-code-at-runtime>`_
     """
     try:
-        m = __import__(module, globals(), locals(), varnames, -1)
+        m = __import__(module, globals(), locals(), varnames, 0)
     except ImportError:
         return None
 
@@ -148,7 +262,8 @@ def import_module_settings(module):
     """
     data = import_module_vars(module)
     try:
-        settings = dict([(k, v) for k, v in data.items() if k == k.upper()])
+        settings = dict([(k, v) for k, v in six.iteritems(data)
+                         if k == k.upper()])
     except AttributeError:
         return None
     return settings
@@ -171,6 +286,202 @@ def get_instance(module, class_name, *args, **kwargs):
     return f(*args, **kwargs)
 
 
+# lazy imports
+
+_unresolved = object()
+# lazy import stats keyed by name (not per proxy, so creating proxies
+# per request does not grow the table)
+_lazy_imports = {}
+_lazy_imports_lock = threading.Lock()
+
+class LazyObject(object):
+    """
+    Proxy that creates its target object on first use.
+
+    The target is created by calling ``factory`` the first time an
+    attribute, item, length, iteration or call of the proxy is
+    needed. Resolution is thread-safe and happens only once.
+
+    Proxies are counted by name for ``lazy_import_report``.
+    """
+    def __init__(self, factory, name):
+        """
+        :param factory: function (no args) that returns the target
+        :param name: name of lazy import (used in reports)
+        """
+        self.__dict__.update({
+            '_lazy_factory': factory,
+            '_lazy_target': _unresolved,
+            '_lazy_lock': threading.Lock(),
+            '_lazy_name': name,
+        })
+        with _lazy_imports_lock:
+            record = _lazy_imports.get(name)
+            if record is None:
+                record = _lazy_imports[name] = {
+                    'name': name, 'created': 0, 'triggered': 0, 'seconds': 0.0}
+            record['created'] += 1
+
+    def _lazy_resolve(self):
+        target = self._lazy_target
+        if target is _unresolved:
+            with self._lazy_lock:
+                target = self._lazy_target
+                if target is _unresolved:
+                    start = time.time()
+                    target = self._lazy_factory()
+                    seconds = time.time() - start
+                    with _lazy_imports_lock:
+                        record = _lazy_imports.get(self._lazy_name)
+                        if record is not None:
+                            record['triggered'] += 1
+                            record['seconds'] += seconds
+                    self.__dict__['_lazy_target'] = target
+        return target
+
+    @property
+    def _lazy_resolved(self):
+        return self._lazy_target is not _unresolved
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_resolve(), name, value)
+
+    def __getitem__(self, key):
+        return self._lazy_resolve()[key]
+
+    def __setitem__(self, key, value):
+        self._lazy_resolve()[key] = value
+
+    def __contains__(self, key):
+        return key in self._lazy_resolve()
+
+    def __iter__(self):
+        return iter(self._lazy_resolve())
+
+    def __len__(self):
+        return len(self._lazy_resolve())
+
+    def __call__(self, *args, **kwargs):
+        return self._lazy_resolve()(*args, **kwargs)
+
+    def __eq__(self, other):
+        return self._lazy_resolve() == other
+
+    def __ne__(self, other):
+        return self._lazy_resolve() != other
+
+    def __hash__(self):
+        return hash(self._lazy_resolve())
+
+    def __bool__(self):
+        return bool(self._lazy_resolve())
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        if self._lazy_resolved:
+            return repr(self._lazy_target)
+        return '<LazyObject %s (unresolved)>' % self._lazy_name
+
+
+def _import_or_raise(func, module, *args):
+    """Return ``func(module, *args)``; raise ImportError if it is None."""
+    result = func(module, *args)
+    if result is None:
+        raise ImportError('Cannot import module: %s' % module)
+    return result
+
+
+def lazy_module_vars(module, varnames=None):
+    """
+    Lazy version of ``import_module_vars``.
+
+    :returns: ``LazyObject`` for the result of ``import_module_vars``
+
+    Unlike ``import_module_vars``, which returns None if the module
+    cannot be imported, the proxy is always returned (the module is not
+    looked up until first use); first use raises ``ImportError``
+    instead.
+    """
+    return LazyObject(
+        lambda: _import_or_raise(import_module_vars, module, varnames),
+        'vars:%s' % module)
+
+
+_settings_snapshots = {}
+
+def get_module_settings(module):
+    """
+    Return cached settings snapshot of module.
+
+    Same as ``import_module_settings`` but each module is imported only
+    once; the snapshot is shared, so treat it as read-only.
+    """
+    try:
+        return _settings_snapshots[module]
+    except KeyError:
+        settings = import_module_settings(module)
+        if settings is not None:
+            _settings_snapshots[module] = settings
+        return settings
+
+
+def clear_settings_snapshots():
+    """Clear cached settings snapshots."""
+    _settings_snapshots.clear()
+
+
+def lazy_module_settings(module):
+    """
+    Lazy version of ``import_module_settings``.
+
+    :returns: ``LazyObject`` for the (cached) settings of module
+
+    Unlike ``import_module_settings``, which returns None if the module
+    cannot be imported, the proxy is always returned; first use raises
+    ``ImportError`` instead.
+    """
+    return LazyObject(
+        lambda: _import_or_raise(get_module_settings, module),
+        'settings:%s' % module)
+
+
+def lazy_instance(module, class_name, *args, **kwargs):
+    """
+    Lazy version of ``get_instance``.
+
+    :returns: ``LazyObject`` for the instance (created on first use)
+    """
+    return LazyObject(lambda: get_instance(module, class_name, *args, **kwargs),
+                      'instance:%s.%s' % (module, class_name))
+
+
+def lazy_import_report(triggered=None):
+    """
+    Return stats of lazy imports created so far (one entry per name).
+
+    :param triggered: if True, return only lazy imports that were
+        resolved at least once; if False, only those never resolved
+    :returns: list of dicts (sorted by name) with ``name``, ``created``
+        (number of proxies), ``triggered`` (number of proxies resolved)
+        and ``seconds`` (total time taken to resolve)
+    """
+    with _lazy_imports_lock:
+        report = [dict(_lazy_imports[name]) for name in sorted(_lazy_imports)]
+    if triggered is not None:
+        report = [r for r in report if bool(r['triggered']) == triggered]
+    return report
+
+
+def clear_lazy_import_report():
+    """Reset lazy import stats."""
+    with _lazy_imports_lock:
+        _lazy_imports.clear()
+
+
 # file read/write/delete helper functions
 
 default_text_encoding = "utf-8"
@@ -210,62 +521,676 @@ def get_file_contents(path, mode=None, encoding=None, **kwargs):
     except AssertionError:
         data = None
     else:
-        if not mode:
-            mode = ''
-        mode = 'r%s' % mode
-        if 'b' in mode:
-            encoding = None
-        else:
-            # read file as text
-            if not encoding:
-                encoding = default_text_encoding
+        mode, encoding = _file_mode('r', mode, encoding)
         with open_file(path, mode=mode, encoding=encoding, **kwargs) as file_obj:
             data = file_obj.read()
     return data
 
 
-def write_file(path, data, mode=None, encoding=None, **kwargs):
+def _file_mode(action, mode=None, encoding=None):
     """
-    Write text file to file system.
+    Return (mode, encoding) for ``open_file``.
 
-    :param path: path of file to write to.
-    :param data: data to write.
+    :param action: "r" or "w"
     :param mode: "b" for bytes or "t" for text (default is "t")
     :param encoding: file encoding for text (default is `utf-8`).
-    :returns: `True` if no error or `False` if ``IOError``.
     """
-    if not mode:
-        mode = ''
-    mode = 'w%s' % mode
+    mode = '%s%s' % (action, mode or '')
     if 'b' in mode:
         encoding = None
+    elif not encoding:
+        # read/write file as text
+        encoding = default_text_encoding
+    return mode, encoding
+
+
+# cached reads
+
+DEFAULT_FILE_CACHE_SIZE = 2**24
+
+class FileCache(object):
+    """
+    Memory-bounded LRU cache for file contents.
+
+    Usage::
+
+        cache = FileCache(max_bytes=2**22, revalidate=2.0)
+        template = cache.get(path)
+
+    Entries are keyed on (path, mode, encoding) and remember the file's
+    mtime and size. An entry younger than ``revalidate`` seconds is
+    returned without touching the file system; an older entry is
+    checked with ``os.stat`` and the file is read again only if it has
+    changed. The total size of cached files is bounded by ``max_bytes``
+    (least recently used entries are evicted). The cache is thread-safe.
+
+    * ``hits``, ``misses``, ``evictions`` and ``revalidations`` count
+      cache events.
+    """
+    def __init__(self, max_bytes=DEFAULT_FILE_CACHE_SIZE, revalidate=1.0):
+        """
+        :param max_bytes: maximum total size (in bytes on disk) of
+            cached files
+        :param revalidate: seconds before an entry is checked with stat
+            again (0 to check on every lookup)
+        """
+        from collections import OrderedDict
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+
+    def _touch(self, key, entry):
+        # move entry to the end (most recently used)
+        del self.entries[key]
+        self.entries[key] = entry
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def get(self, path, mode=None, encoding=None, **kwargs):
+        """
+        Return file content (same as ``get_file_contents``).
+
+        :returns: file content or `None` if file cannot be read.
+        """
+        key = (path, mode or '', encoding)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[3] < self.revalidate:
+                self.hits += 1
+                self._touch(key, entry)
+                return entry[2]
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            st = None
+        if st is None or not os.path.isfile(path):
+            with self.lock:
+                self._remove(key)
+            return None
+        stat_key = (st.st_mtime, st.st_size)
+        with self.lock:
+            if entry is not None and entry[0] == stat_key and \
+               self.entries.get(key) is entry:
+                self.hits += 1
+                self.revalidations += 1
+                entry[3] = now
+                self._touch(key, entry)
+                return entry[2]
+            self.misses += 1
+        data = get_file_contents(path, mode=mode, encoding=encoding, **kwargs)
+        if data is None or st.st_size > self.max_bytes:
+            return data
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = [stat_key, st.st_size, data, now]
+            self.size += st.st_size
+            while self.size > self.max_bytes:
+                old_key = next(iter(self.entries))
+                self._remove(old_key)
+                self.evictions += 1
+        return data
+
+    def invalidate(self, path=None):
+        """Remove entries for ``path`` (or all entries if None)."""
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+                self.size = 0
+            else:
+                for key in [k for k in self.entries if k[0] == path]:
+                    self._remove(key)
+
+    def stats(self):
+        """Return dict of cache counters."""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revalidations': self.revalidations,
+            }
+
+
+default_file_cache = FileCache()
+
+def get_cached_file_contents(path, mode=None, encoding=None, cache=None,
+                             **kwargs):
+    """
+    Cached version of ``get_file_contents``.
+
+    :param cache: ``FileCache`` (default is a shared cache)
+    :returns: file content or `None` if file cannot be read.
+    """
+    if cache is None:
+        cache = default_file_cache
+    return cache.get(path, mode=mode, encoding=encoding, **kwargs)
+
+
+# streaming reads
+
+default_chunk_size = 2**16
+
+def _iter_file(path, mode, encoding, chunk_size, lines, **kwargs):
+    with open_file(path, mode=mode, encoding=encoding, **kwargs) as file_obj:
+        if lines:
+            for line in file_obj:
+                yield line
+        else:
+            while True:
+                data = file_obj.read(chunk_size)
+                if not data:
+                    break
+                yield data
+
+
+def iter_file_contents(path, chunk_size=default_chunk_size, mode=None,
+                       encoding=None, **kwargs):
+    """
+    Return generator of chunks of file content.
+
+    :param path: path of file to read.
+    :param chunk_size: size of chunks (characters for text, bytes for
+        binary mode)
+    :param mode: "b" for bytes or "t" for text (default is "t")
+    :param encoding: file encoding for text (default is `utf-8`).
+    :returns: generator or `None` if file cannot be read.
+
+    Text is decoded incrementally, so chunks never split a character.
+    """
+    if path is None or not os.path.isfile(path):
+        return None
+    mode, encoding = _file_mode('r', mode, encoding)
+    return _iter_file(path, mode, encoding, chunk_size, False, **kwargs)
+
+
+def iter_file_lines(path, mode=None, encoding=None, **kwargs):
+    """
+    Return generator of lines of file (with line endings).
+
+    :param path: path of file to read.
+    :param mode: "b" for bytes or "t" for text (default is "t")
+    :param encoding: file encoding for text (default is `utf-8`).
+    :returns: generator or `None` if file cannot be read.
+    """
+    if path is None or not os.path.isfile(path):
+        return None
+    mode, encoding = _file_mode('r', mode, encoding)
+    return _iter_file(path, mode, encoding, None, True, **kwargs)
+
+
+class _EmptyMap(six.binary_type):
+    """
+    Stand-in for the map of an empty file (``mmap`` cannot map 0 bytes).
+    """
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+def map_file(path):
+    """
+    Return read-only memory map of file.
+
+    :param path: path of file to read.
+    :returns: ``mmap`` object (supports slicing, ``find`` and ``len``)
+        or `None` if file cannot be read. For an empty file, an empty
+        byte string with a no-op ``close`` method is returned.
+
+    The file content is paged in by the OS on access. Call ``close``
+    on the map when done.
+    """
+    import mmap
+    if path is None or not os.path.isfile(path):
+        return None
+    with open_file(path, mode='rb') as file_obj:
+        if os.fstat(file_obj.fileno()).st_size == 0:
+            return _EmptyMap()
+        return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# durability levels for write_file and BatchWriter
+DURABILITY_NONE = 'none'
+DURABILITY_FDATASYNC = 'fdatasync'
+DURABILITY_DIRSYNC = 'dirsync'
+
+def _sync_file(fd):
+    """Flush file data to disk (metadata only if needed)."""
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
     else:
-        if not encoding:
-            encoding = default_text_encoding
+        os.fsync(fd)
+
+
+def _sync_dir(path):
+    """Flush directory entries (e.g. after rename) to disk."""
     try:
-        with open_file(path, mode=mode, encoding=encoding, **kwargs) as file_obj:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # not supported on this platform (e.g. windows)
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+_replace = getattr(os, 'replace', os.rename)
+
+def _create_temp_file(path):
+    """
+    Create a new temp file next to ``path`` and return (fd, temp path).
+
+    The file is created with mode 0666 (less the process umask, like a
+    new file created with ``open``), or with the mode of ``path`` if it
+    already exists.
+    """
+    import errno
+    import binascii
+    dirname, basename = os.path.split(os.path.abspath(path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        suffix = binascii.hexlify(os.urandom(6)).decode('ascii')
+        tmp_path = os.path.join(dirname, '.%s.%s.tmp' % (basename, suffix))
+        try:
+            fd = os.open(tmp_path, flags, 0o666)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    try:
+        file_mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        return fd, tmp_path
+    try:
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, file_mode)
+        else:
+            os.chmod(tmp_path, file_mode)
+    except OSError:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    return fd, tmp_path
+
+
+def _write_temp_file(path, data, mode, encoding, sync, **kwargs):
+    """
+    Write data to a temp file next to ``path`` and return temp path.
+    """
+    fd, tmp_path = _create_temp_file(path)
+    try:
+        with open_file(fd, mode=mode, encoding=encoding, **kwargs) as file_obj:
             file_obj.write(data)
+            if sync:
+                file_obj.flush()
+                _sync_file(file_obj.fileno())
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def write_file(path, data, mode=None, encoding=None, atomic=False,
+               durability=None, **kwargs):
+    """
+    Write text file to file system.
+
+    :param path: path of file to write to.
+    :param data: data to write.
+    :param mode: "b" for bytes or "t" for text (default is "t")
+    :param encoding: file encoding for text (default is `utf-8`).
+    :param atomic: if True, write to a temp file in the same directory
+        and rename it to ``path`` (readers see either the old or the new
+        file, never a partial one)
+    :param durability: ``DURABILITY_NONE`` (default),
+        ``DURABILITY_FDATASYNC`` (flush file data to disk) or
+        ``DURABILITY_DIRSYNC`` (also flush the directory entry; only
+        useful with ``atomic``)
+    :returns: `True` if no error or `False` if ``IOError``.
+    """
+    mode, encoding = _file_mode('w', mode, encoding)
+    sync = durability in (DURABILITY_FDATASYNC, DURABILITY_DIRSYNC)
+    try:
+        if atomic:
+            tmp_path = _write_temp_file(path, data, mode, encoding, sync,
+                                        **kwargs)
+            try:
+                _replace(tmp_path, path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        else:
+            with open_file(path, mode=mode, encoding=encoding,
+                           **kwargs) as file_obj:
+                file_obj.write(data)
+                if sync:
+                    file_obj.flush()
+                    _sync_file(file_obj.fileno())
+        if durability == DURABILITY_DIRSYNC:
+            _sync_dir(os.path.dirname(os.path.abspath(path)))
         return True
-    except IOError:
+    except (IOError, OSError):
+        return False
+
+
+class BatchWriter(object):
+    """
+    Write many files atomically and sync them to disk together.
+
+    Usage::
+
+        with BatchWriter(durability=DURABILITY_DIRSYNC) as batch:
+            for path, data in cache_items:
+                batch.write(path, data)
+
+    Files are written to temp files first. On ``commit`` (called when
+    the ``with`` block ends without an error) the temp files are synced
+    to disk, renamed into place and every directory involved is synced
+    once. Each file still gets its own ``fdatasync``, but the syncs are
+    deferred until all files are written (so the OS can already write
+    back data while later files are written), and directories are
+    synced once per batch instead of once per file. If the block
+    raises, the temp files are removed and no file is replaced.
+    """
+    def __init__(self, durability=DURABILITY_FDATASYNC, mode=None,
+                 encoding=None):
+        """
+        :param durability: see ``write_file``
+        :param mode: default mode for ``write`` ("b" or "t")
+        :param encoding: default encoding for text
+        """
+        self.durability = durability
+        self.mode = mode
+        self.encoding = encoding
+        self.pending = []
+
+    def write(self, path, data, mode=None, encoding=None, **kwargs):
+        """Write data to temp file for ``path`` (replaced on commit)."""
+        mode, encoding = _file_mode('w', mode or self.mode,
+                                    encoding or self.encoding)
+        tmp_path = _write_temp_file(path, data, mode, encoding, False,
+                                    **kwargs)
+        self.pending.append((tmp_path, path))
+
+    def commit(self):
+        """
+        Sync and rename all pending files.
+
+        :returns: number of files written
+        """
+        pending, self.pending = self.pending, []
+        dirs = set()
+        try:
+            if self.durability in (DURABILITY_FDATASYNC, DURABILITY_DIRSYNC):
+                for tmp_path, path in pending:
+                    fd = os.open(tmp_path, os.O_RDONLY)
+                    try:
+                        _sync_file(fd)
+                    finally:
+                        os.close(fd)
+            for tmp_path, path in pending:
+                _replace(tmp_path, path)
+                dirs.add(os.path.dirname(os.path.abspath(path)))
+        except Exception:
+            # remove temp files not yet renamed
+            self.pending = pending
+            self.abort()
+            raise
+        if self.durability == DURABILITY_DIRSYNC:
+            for dirname in dirs:
+                _sync_dir(dirname)
+        return len(pending)
+
+    def abort(self):
+        """Remove all pending temp files."""
+        pending, self.pending = self.pending, []
+        for tmp_path, path in pending:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def _wipe_file(path, chunk_size=default_chunk_size):
+    """
+    Overwrite file content with zeros, sync to disk and truncate file.
+
+    Only regular files are wiped. Symlinks are not followed (the file
+    they point to may be outside the tree being deleted); the caller
+    just unlinks them.
+
+    :returns: True if file was wiped
+    """
+    import stat
+    import errno
+    if not stat.S_ISREG(os.lstat(path).st_mode):
         return False
+    flags = os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0) | \
+        getattr(os, 'O_NONBLOCK', 0) | getattr(os, 'O_BINARY', 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError as e:
+        if e.errno == errno.ELOOP:
+            # replaced by a symlink since lstat
+            return False
+        raise
+    with open_file(fd, mode='r+b') as file_obj:
+        st = os.fstat(file_obj.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        size = st.st_size
+        zeros = b'\x00' * min(size, chunk_size)
+        while size > 0:
+            file_obj.write(zeros[:size])
+            size -= len(zeros)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+        file_obj.truncate(0)
+    return True
 
 
-def delete_file(path):
+def delete_file(path, secure=False):
     """
-    Truncates file to zero size and unlinks file.
+    Unlinks file.
 
     :param path: file system path for file
+    :param secure: if True, overwrite file content with zeros and
+        truncate file before unlinking it (symlinks are only unlinked)
     :returns: True if file is unlinked (no longer found) else False
     """
-    with open_file(path, mode='wb') as file_obj:
-        file_obj.truncate(0)
     try:
+        if secure:
+            _wipe_file(path)
         os.unlink(path)
-    except OSError:
+    except (IOError, OSError):
         pass
     return os.path.isfile(path) is False
 
 
+# bulk delete
+
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+DEFAULT_DELETE_WORKERS = 8
+
+def iter_tree(root, regular_only=True):
+    """
+    Walk directory tree and yield entries that are not directories.
+
+    :param root: top directory to walk
+    :param regular_only: if True, yield only regular files (else also
+        symlinks, sockets, etc.)
+    :returns: iterator of (relative path, stat result) tuples
+
+    Uses ``os.scandir`` (or the ``scandir`` package in Python 2) when
+    available, otherwise falls back to ``os.listdir`` and ``os.lstat``.
+    Symlinks are not followed. Files and directories removed during
+    the walk are skipped.
+    """
+    import stat
+    dirs = ['']
+    while dirs:
+        reldir = dirs.pop()
+        path = os.path.join(root, reldir)
+        try:
+            if _scandir is not None:
+                entries = list(_scandir(path))
+            else:
+                entries = os.listdir(path)
+        except OSError:
+            # directory removed during the walk
+            continue
+        for entry in entries:
+            try:
+                if _scandir is not None:
+                    name, st = entry.name, entry.stat(follow_symlinks=False)
+                else:
+                    name = entry
+                    st = os.lstat(os.path.join(path, name))
+            except OSError:
+                continue
+            relpath = os.path.join(reldir, name)
+            if stat.S_ISDIR(st.st_mode):
+                dirs.append(relpath)
+            elif not regular_only or stat.S_ISREG(st.st_mode):
+                yield relpath, st
+
+
+def iter_dir_files(root):
+    """
+    Walk directory tree and yield paths of all non-directory entries
+    (see ``iter_tree``).
+    """
+    for relpath, st in iter_tree(root, regular_only=False):
+        yield os.path.join(root, relpath)
+
+
+class DeleteReport(object):
+    """
+    Result of a bulk delete.
+
+    * ``deleted``: number of files deleted
+    * ``missing``: number of files already gone
+    * ``failed``: list of (path, error message) tuples
+    * ``dirs_removed``: number of directories removed
+    """
+    def __init__(self):
+        self.deleted = 0
+        self.missing = 0
+        self.failed = []
+        self.dirs_removed = 0
+
+    def __repr__(self):
+        return '<DeleteReport deleted=%d missing=%d failed=%d dirs=%d>' % (
+            self.deleted, self.missing, len(self.failed), self.dirs_removed)
+
+
+def _delete_job(args):
+    """Unlink file in worker (returns path and error number/message)."""
+    path, secure = args
+    try:
+        if secure:
+            _wipe_file(path)
+        os.unlink(path)
+    except (IOError, OSError) as e:
+        return path, e.errno, '%s' % e
+    return path, None, None
+
+
+def delete_files(paths, workers=DEFAULT_DELETE_WORKERS, secure=False):
+    """
+    Delete many files using a thread pool.
+
+    :param paths: iterable of file paths
+    :param workers: number of threads (1 to delete in this thread)
+    :param secure: if True, wipe file content before unlinking (see
+        ``delete_file``)
+    :returns: ``DeleteReport``
+    """
+    import errno
+    report = DeleteReport()
+    jobs = ((path, secure) for path in paths)
+    pool = None
+    if workers > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        results = pool.imap_unordered(_delete_job, jobs, chunksize=64)
+    else:
+        results = six.moves.map(_delete_job, jobs)
+    try:
+        for path, error, message in results:
+            if error is None:
+                report.deleted += 1
+            elif error == errno.ENOENT:
+                report.missing += 1
+            else:
+                report.failed.append((path, message))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return report
+
+
+def purge_directory(root, workers=DEFAULT_DELETE_WORKERS, secure=False,
+                    remove_dirs=False):
+    """
+    Delete all files in a directory tree.
+
+    :param root: top directory (not removed)
+    :param workers: number of threads to unlink files
+    :param secure: if True, wipe file content before unlinking
+    :param remove_dirs: if True, also remove empty subdirectories
+    :returns: ``DeleteReport``
+    """
+    report = delete_files(iter_dir_files(root), workers=workers,
+                          secure=secure)
+    if remove_dirs:
+        for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+            for name in dirnames:
+                try:
+                    os.rmdir(os.path.join(dirpath, name))
+                    report.dirs_removed += 1
+                except OSError as e:
+                    report.failed.append((os.path.join(dirpath, name),
+                                          '%s' % e))
+    return report
+
+
 # convert uri request string to list
 
 PATH_SEP = '/'
@@ -324,8 +1249,8 @@ class DataObject(dict):
             def __getattr__(self, key):
                 try:
                     return self[key]
-                except KeyError, k:
-                    raise AttributeError, k
+                except KeyError as k:
+                    raise AttributeError(k)
 
             def __setattr__(self, key, value):
                 self[key] = value
@@ -333,8 +1258,8 @@ class DataObject(dict):
             def __delattr__(self, key):
                 try:
                     del self[key]
-                except KeyError, k:
-                    raise AttributeError, k
+                except KeyError as k:
+                    raise AttributeError(k)
 
             def __repr__(self):
                 return '<Storage ' + dict.__repr__(self) + '>'
@@ -361,8 +1286,8 @@ class DataObject(dict):
     def __getattr__(self, key):
         try:
             return self[key]
-        except KeyError, k:
-            raise AttributeError, k
+        except KeyError as k:
+            raise AttributeError(k)
 
     def __setattr__(self, key, value):
         self[key] = value
@@ -370,8 +1295,8 @@ class DataObject(dict):
     def __delattr__(self, key):
         try:
             del self[key]
-        except KeyError, k:
-            raise AttributeError, k
+        except KeyError as k:
+            raise AttributeError(k)
 
     def __repr__(self):
         return '<DataObject ' + dict.__repr__(self) + '>'
@@ -392,17 +1317,422 @@ class DataObject(dict):
                         self[name] = True
                 except TypeError:
                     pass
-            elif isinstance(d, dict):
+            elif isinstance(d, (dict, Record, LayeredDataObject)):
                 add_dict(d)
             else:
                 self[d] = True
 
 
+# compact records
+
+class Record(object):
+    """
+    Base class for record classes created by ``make_record``.
+
+    Records store a fixed set of fields in ``__slots__`` (no per-object
+    ``__dict__``), so they use much less memory than a ``DataObject``
+    and attribute access is a plain slot lookup. Like ``DataObject``,
+    fields can be accessed as ``obj.key`` or ``obj['key']``, set in bulk
+    with ``add`` and converted with ``dict(obj)`` or ``to_dict``.
+    """
+    __slots__ = ()
+    _fields = ()
+    _defaults = {}
+
+    def __init__(self, *args, **kwargs):
+        defaults = self._defaults
+        for name in self._fields:
+            setattr(self, name, defaults.get(name))
+        if args or kwargs:
+            self.add(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        """
+        Set fields from ``dict`` or list/tuple of names (set to True),
+        same as ``DataObject.add``.
+
+        :raises: ``AttributeError`` for unknown fields
+        """
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        for d in args:
+            if isinstance(d, (dict, Record)):
+                for name, value in d.items():
+                    setattr(self, name, value)
+            elif isinstance(d, (list, tuple)):
+                for name in d:
+                    setattr(self, name, True)
+            else:
+                setattr(self, d, True)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            return default
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return [getattr(self, name) for name in self._fields]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self._fields]
+
+    def to_dict(self):
+        """Return fields as ``dict``."""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.values()
+
+    def __setstate__(self, state):
+        for name, value in zip(self._fields, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.to_dict())
+
+
+def make_record(name, fields, defaults=None):
+    """
+    Return a new ``Record`` class with ``fields``.
+
+    :param name: class name
+    :param fields: list of field names (or string of space/comma
+        separated names)
+    :param defaults: dict of default values (other fields default to
+        None)
+    :returns: ``Record`` subclass
+
+    Usage::
+
+        Point = make_record('Point', 'x y label', defaults={'x': 0, 'y': 0})
+        p = Point({'x': 1}, label='start')
+        assert p.x == 1 and p['y'] == 0
+    """
+    if isinstance(fields, six.string_types):
+        fields = fields.replace(',', ' ').split()
+    fields = tuple([str(f) for f in fields])
+    for field in fields:
+        if not field or not all([c.isalnum() or c == '_' for c in field]) or \
+           field[0].isdigit() or field[0] == '_' or hasattr(Record, field):
+            raise ValueError('Invalid field name: %s' % field)
+    if len(set(fields)) != len(fields):
+        raise ValueError('Duplicate field names: %s' % (fields,))
+    attrs = {
+        '__slots__': fields,
+        '_fields': fields,
+        '_defaults': dict(defaults or {}),
+        # module of caller (so instances can be pickled)
+        '__module__': sys._getframe(1).f_globals.get('__name__', __name__),
+    }
+    return type(str(name), (Record,), attrs)
+
+
+# layered (copy-on-write) data objects
+
+_deleted = object()
+
+def _freeze_value(value):
+    """Return hashable version of value (for ``freeze``)."""
+    if isinstance(value, (dict, Record, LayeredDataObject)):
+        return FrozenDataObject(value)
+    if isinstance(value, (list, tuple)):
+        return tuple([_freeze_value(v) for v in value])
+    if isinstance(value, (set, frozenset)):
+        return frozenset([_freeze_value(v) for v in value])
+    return value
+
+
+class FrozenDataObject(dict):
+    """
+    Immutable, hashable ``DataObject`` (returned by
+    ``LayeredDataObject.freeze``).
+
+    Nested dicts, lists and sets are converted to ``FrozenDataObject``,
+    tuples and frozensets.
+
+    Mutating methods and operators (including ``|=``) raise
+    ``TypeError``. The protection is shallow: as the object is a
+    ``dict``, calling ``dict`` methods on it directly (e.g.
+    ``dict.update(frozen, data)``) still changes it.
+    """
+    __slots__ = ('_hash',)
+
+    def __init__(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        dict.__init__(self, [(k, _freeze_value(v)) for k, v in data.items()])
+        object.__setattr__(self, '_hash', None)
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as k:
+            raise AttributeError(k)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('FrozenDataObject is immutable')
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = _immutable
+    clear = pop = popitem = setdefault = update = add = _immutable
+    __ior__ = _immutable
+
+    def __hash__(self):
+        h = object.__getattribute__(self, '_hash')
+        if h is None:
+            h = hash(frozenset(self.items()))
+            object.__setattr__(self, '_hash', h)
+        return h
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __repr__(self):
+        return '<FrozenDataObject ' + dict.__repr__(self) + '>'
+
+
+class LayeredDataObject(object):
+    """
+    ``DataObject`` view over a stack of shared layers.
+
+    Usage::
+
+        defaults = DataObject(DEFAULT_SETTINGS)
+        config = LayeredDataObject(site_settings, defaults)
+        request_config = config.new_child({'debug': True})
+        assert request_config.debug is True
+
+    Lookups search the layers in order (the first layer wins). Base
+    layers are referenced, not copied: writes and deletes only change
+    the object's own (top) layer, so creating a view is cheap no matter
+    how many keys the base layers hold. ``freeze`` returns an immutable,
+    hashable snapshot.
+    """
+    __slots__ = ('_layers',)
+
+    def __init__(self, *layers, **kwargs):
+        """
+        :param layers: dicts (or mappings) to look up keys in, from
+            highest to lowest priority
+        :param kwargs: initial values of the top layer
+        """
+        object.__setattr__(self, '_layers', [dict(kwargs)] + list(layers))
+
+    @property
+    def layers(self):
+        """List of layers (the object's own layer first)."""
+        return self._layers
+
+    def new_child(self, overrides=None, **kwargs):
+        """Return new view with ``overrides`` on top of this object."""
+        child = LayeredDataObject(*self._layers, **kwargs)
+        if overrides:
+            child.add(overrides)
+        return child
+
+    def __getitem__(self, key):
+        for layer in self._layers:
+            if key in layer:
+                value = layer[key]
+                if value is _deleted:
+                    break
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._layers[0][key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._layers[0][key] = _deleted
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as k:
+            raise AttributeError(k)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError as k:
+            raise AttributeError(k)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    has_key = __contains__
+
+    def keys(self):
+        seen = set()
+        keys = []
+        for layer in self._layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    if layer[key] is not _deleted:
+                        keys.append(key)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def to_dict(self):
+        """Return flattened copy as ``dict``."""
+        return dict(self.items())
+
+    def add(self, *args, **kwargs):
+        """Add items to the top layer (same as ``DataObject.add``)."""
+        self._layers[0].update(DataObject(*args, **kwargs))
+
+    def update(self, *args, **kwargs):
+        self._layers[0].update(*args, **kwargs)
+
+    def freeze(self):
+        """Return immutable, hashable snapshot (``FrozenDataObject``)."""
+        return FrozenDataObject(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record, LayeredDataObject)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<LayeredDataObject %r>' % self.to_dict()
+
+
 # class for configuration storage and management
 
+class _Namespace(DataObject):
+    """
+    Namespace object of a ``Config``.
+
+    Changes made directly to the object (item or attribute assignment,
+    ``del``, ``update``, ``pop``, etc.) update the config's flattened
+    lookup map.
+    """
+    _config = None
+
+    def _bind(self, config):
+        object.__setattr__(self, '_config', config)
+        return self
+
+    def _change(self, keys, func, *args):
+        config = self._config
+        if config is None:
+            return func(self, *args)
+        with config._lock:
+            result = func(self, *args)
+            config._resolve_keys(keys if keys is not None else list(self))
+        return result
+
+    def __setitem__(self, key, value):
+        self._change([key], dict.__setitem__, key, value)
+
+    def __delitem__(self, key):
+        self._change([key], dict.__delitem__, key)
+
+    def setdefault(self, key, default=None):
+        return self._change([key], dict.setdefault, key, default)
+
+    def pop(self, key, *default):
+        return self._change([key], dict.pop, key, *default)
+
+    def popitem(self):
+        def popitem(self):
+            item = dict.popitem(self)
+            keys.append(item[0])
+            return item
+        keys = []
+        return self._change(keys, popitem)
+
+    def update(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        self._change(list(data), dict.update, data)
+
+    def clear(self):
+        self._change(list(self), dict.clear)
+
+
 class Config(object):
     """
     Class for storing configuration settings.
+
+    Lookups without a namespace are served from a flattened map of all
+    namespaces, which is built on first use and updated incrementally
+    whenever a namespace changes, including changes made directly to
+    the namespace objects returned by ``add_namespace`` and
+    ``get_namespace``. Readers never take a lock, so the config can be
+    read from many threads.
+
+    * ``hits`` and ``misses`` count lookups in the flattened map.
     """
     def __init__(self):
         """
@@ -414,17 +1744,113 @@ class Config(object):
         self.namespaces = []
         self.config = DataObject()
         self.adhoc_namespace = None
+        self._resolved = None
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self.hits = 0
+        self.misses = 0
+        self._rebuilds = 0
+
+    def _resolve_keys(self, keys):
+        """Update flattened map for ``keys`` (after a change)."""
+        with self._lock:
+            resolved = self._resolved
+            if resolved is None:
+                return
+            for key in keys:
+                for namespace in self.namespaces:
+                    config = self.config[namespace]
+                    if key in config:
+                        resolved[key] = config[key]
+                        break
+                else:
+                    resolved.pop(key, None)
+
+    def _rebuild(self):
+        """Build flattened map of all namespaces."""
+        with self._lock:
+            resolved = {}
+            for namespace in reversed(self.namespaces):
+                resolved.update(self.config[namespace])
+            self._resolved = resolved
+            self._rebuilds += 1
+            return resolved
+
+    def invalidate(self):
+        """Discard the flattened map (it is rebuilt on next lookup)."""
+        with self._lock:
+            self._resolved = None
+
+    def lookup_stats(self):
+        """Return dict of lookup counters."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'keys': len(self._resolved or ()),
+        }
+
+    def subscribe(self, callback):
+        """
+        Register ``callback(config, namespace, changed_keys)`` to be
+        called after ``replace_namespace`` changes values.
+        """
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove callback registered with ``subscribe``."""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def replace_namespace(self, namespace, data):
+        """
+        Replace content of `namespace` (added last if new) with data.
+
+        The namespace and the flattened lookup map are swapped in as new
+        objects, so readers see either the old or the new values.
+        Subscribers are notified of the keys whose resolved values
+        changed (errors raised by subscribers are logged).
+
+        :returns: set of changed keys
+        """
+        with self._lock:
+            old = self._resolved
+            if old is None:
+                old = self._rebuild()
+            if namespace not in self.namespaces:
+                self.namespaces.insert(0, namespace)
+            else:
+                self.config[namespace]._bind(None)
+            self.config[namespace] = _Namespace(data)._bind(self)
+            new = self._rebuild()
+            changed = set([k for k in set(old) | set(new)
+                           if k not in old or k not in new or
+                           old[k] != new[k]])
+            subscribers = list(self._subscribers)
+        if changed:
+            for callback in subscribers:
+                try:
+                    callback(self, namespace, changed)
+                except Exception:
+                    # one failing subscriber must not stop the others
+                    logging.getLogger(__name__).exception(
+                        'Config subscriber %r failed for namespace: %s',
+                        callback, namespace)
+        return changed
 
     def add_namespace(self, namespace, data={}):
         """Add a namespace or update an existing one with data."""
-        if namespace not in self.namespaces:
-            self.namespaces.insert(0, namespace)
-            config = DataObject()
-            self.config[namespace] = config
-        else:
-            config = self.get_namespace(namespace)
-        if data:
-            config.add(data)
+        with self._lock:
+            if namespace not in self.namespaces:
+                self.namespaces.insert(0, namespace)
+                config = _Namespace()._bind(self)
+                self.config[namespace] = config
+            else:
+                config = self.get_namespace(namespace)
+            if data:
+                config.add(data)
         return config
 
     def get_namespace(self, namespace):
@@ -436,16 +1862,19 @@ class Config(object):
         Update the specified `namespace` with data.
         `data` should be dict.
         """
-        if namespace in self.namespaces:
-            self.config[namespace].add(data)
-        else:
-            raise AttributeError
+        with self._lock:
+            if namespace in self.namespaces:
+                self.config[namespace].add(data)
+            else:
+                raise AttributeError
 
     def delete_namespace(self, namespace):
         """Delete a namespace."""
-        if namespace in self.namespaces:
-            self.namespaces.remove(namespace)
-            del self.config[namespace]
+        with self._lock:
+            if namespace in self.namespaces:
+                self.namespaces.remove(namespace)
+                config = self.config.pop(namespace)._bind(None)
+                self._resolve_keys(list(config.keys()))
 
     def set_adhoc_namespace(self, namespace):
         """Set the `adhoc_namespace`."""
@@ -455,11 +1884,12 @@ class Config(object):
 
     def setvar(self, namespace, key, val):
         """Set a var into the specified namespace."""
-        try:
-            config = self.config[namespace]
+        with self._lock:
+            try:
+                config = self.config[namespace]
+            except KeyError:
+                raise KeyError(namespace)
             config[key] = val
-        except KeyError:
-            raise KeyError(namespace)
         return val
 
     def getvar(self, namespace, key, default_val=None):
@@ -496,14 +1926,18 @@ class Config(object):
         will search through namespaces in reverse order of
         definition so the last namespace added is searched first.
         """
-        if not namespace:
-            for _namespace in self.namespaces:
-                config = self.config[_namespace]
-                if key in config:
-                    return config[key]
-        else:
+        if namespace:
             return self.getvar(namespace, key, default_val)
-        return default_val
+        resolved = self._resolved
+        if resolved is None:
+            resolved = self._rebuild()
+        try:
+            val = resolved[key]
+        except KeyError:
+            self.misses += 1
+            return default_val
+        self.hits += 1
+        return val
 
     def update(self, namespace, data):
         """This is a shorthand for the ``update_namespace`` method."""
@@ -539,10 +1973,10 @@ def safe_unicode(obj, encoding='utf-8'):
     elif isinstance(obj, six.string_types):
         return obj
     elif type(obj) in [int, float, bool]:
-        return unicode(obj)
+        return six.text_type(obj)
     else:
-        if hasattr(obj, '__unicode__'):
-            return unicode(obj)
+        if six.PY3 or hasattr(obj, '__unicode__'):
+            return six.text_type(obj)
         else:
             return str(obj).decode(encoding)
 
@@ -566,13 +2000,19 @@ def safe_str(obj, encoding='utf-8'):
         >>> safe_str(True)
         'True'
 
+    * Lists and tuples are converted to a list (see ``s2b_list``).
+    * Other iterables are converted lazily with ``iter_encode``.
     """
     if isinstance(obj, six.binary_type):
         return obj
-    elif isinstance(obj, (six.text_type, six.string_types)):
-        return obj.encode('utf-8')
+    elif isinstance(obj, six.text_type):
+        return obj.encode(encoding)
+    elif isinstance(obj, (list, tuple)):
+        return s2b_list(obj, encoding)
     elif hasattr(obj, '__iter__'): # iterator
-        return six.moves.map(safe_str, obj)
+        return iter_encode(obj, encoding)
+    elif six.PY3 or hasattr(obj, '__unicode__'):
+        return six.text_type(obj).encode(encoding)
     else:
         return str(obj)
 
@@ -585,12 +2025,23 @@ def s2b(s, encoding='utf-8'):
     :param s: string
     :returns: string data converted to bytes
 
-    Default encoding is *utf-8*.
+    Default encoding is *utf-8*. Bytes are returned unchanged and
+    numbers are converted to their string representation. Lists,
+    tuples and other iterables raise ``TypeError`` (use ``s2b_list``
+    or ``iter_encode``).
     """
-    if isinstance(s, (float, six.integer_types)):
-        return bytes(str(s))
+    if isinstance(s, six.text_type):
+        return s.encode(encoding)
+    elif isinstance(s, six.binary_type):
+        return s
+    elif isinstance(s, (float, six.integer_types)):
+        return str(s).encode('ascii')
+    elif isinstance(s, bytearray):
+        return bytes(s)
+    elif hasattr(s, '__iter__'):
+        raise TypeError('Cannot convert %s to bytes' % type(s).__name__)
     else:
-        return bytes(s.encode(encoding))
+        return safe_str(s, encoding)
 
 
 def b2s(b, encoding='utf-8'):
@@ -600,9 +2051,123 @@ def b2s(b, encoding='utf-8'):
     :param b: byte data
     :returns: data converted to (unicode) string.
 
-    Default encoding is *utf-8*.
+    Default encoding is *utf-8*. (Unicode) strings are returned
+    unchanged.
+    """
+    if isinstance(b, six.text_type):
+        return b
+    return b.decode(encoding)
+
+
+# bulk and streaming conversion
+
+def s2b_list(items, encoding='utf-8'):
+    """
+    Convert a list of strings (or other objects) to a list of bytes.
+
+    Faster than ``[s2b(s) for s in items]``: unicode strings are
+    matched on their exact type and encoded inline; only other items
+    go through ``s2b``.
+
+    :param items: iterable of strings, bytes or objects
+    :returns: list of bytes
+    :raises: ``TypeError`` for items that are lists or other iterables
+    """
+    text_type = six.text_type
+    return [s.encode(encoding) if type(s) is text_type else s2b(s, encoding)
+            for s in items]
+
+
+def b2s_list(items, encoding='utf-8'):
+    """
+    Convert a list of bytes (or other objects) to a list of (unicode)
+    strings.
+
+    Counterpart of ``s2b_list``; objects other than bytes and strings
+    are converted with ``safe_unicode``.
+
+    :param items: iterable of bytes, strings or objects
+    :returns: list of (unicode) strings
+    """
+    binary_type = six.binary_type
+    return [b.decode(encoding) if type(b) is binary_type
+            else safe_unicode(b, encoding) for b in items]
+
+
+def iter_encode(chunks, encoding='utf-8', errors='strict'):
+    """
+    Encode an iterable of (unicode) strings to a generator of bytes.
+
+    Uses an incremental encoder, so stateful encodings (e.g. the
+    *utf-16* byte order mark) are encoded once for the whole stream.
+    Bytes chunks are passed through unchanged (pending encoder output
+    is flushed first, without resetting the encoder); other objects
+    are converted with ``safe_unicode``. Empty output chunks are
+    skipped.
+
+    :param chunks: iterable of strings, bytes or objects
+    :param encoding: output encoding
+    :param errors: error handling scheme for the encoder
+    :returns: generator of bytes
+    """
+    encoder = codecs.getincrementalencoder(encoding)(errors)
+    encode = encoder.encode
+    text_type = six.text_type
+    binary_types = (six.binary_type, bytearray)
+    for chunk in chunks:
+        if type(chunk) is not text_type:
+            if isinstance(chunk, binary_types):
+                data = encode('', True)
+                if data:
+                    yield data
+                if chunk:
+                    yield bytes(chunk)
+                continue
+            chunk = safe_unicode(chunk, encoding)
+        data = encode(chunk)
+        if data:
+            yield data
+    data = encode('', True)
+    if data:
+        yield data
+
+
+def iter_decode(chunks, encoding='utf-8', errors='strict'):
+    """
+    Decode an iterable of bytes to a generator of (unicode) strings.
+
+    Uses an incremental decoder, so a multibyte character split
+    across chunk boundaries is decoded correctly. (Unicode) string
+    chunks are passed through unchanged. Empty output chunks are
+    skipped.
+
+    :param chunks: iterable of bytes or strings (e.g. from
+        ``iter_file_contents`` or a wsgi response)
+    :param encoding: input encoding
+    :param errors: error handling scheme for the decoder
+    :returns: generator of (unicode) strings
+    :raises: ``UnicodeDecodeError`` if the stream ends with an
+        incomplete character (and ``errors`` is *strict*)
     """
-    return unicode(b.decode(encoding))
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    decode = decoder.decode
+    binary_types = (six.binary_type, bytearray)
+    for chunk in chunks:
+        if isinstance(chunk, binary_types):
+            text = decode(chunk)
+            if text:
+                yield text
+            continue
+        text = decode(b'', True)
+        if text:
+            yield text
+        decoder.reset()
+        chunk = safe_unicode(chunk, encoding)
+        if chunk:
+            yield chunk
+    text = decode(b'', True)
+    if text:
+        yield text
 
 
 # simple logger